@@ -1,9 +1,12 @@
 import os
-import uuid
-from functools import lru_cache
+import threading
+from collections.abc import Callable
+from typing import Any
 
 from pydantic_settings import BaseSettings
 
+from .telemetry import log_exception
+
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Sagarr"
@@ -13,7 +16,9 @@ class Settings(BaseSettings):
 
     # Plex Config
     PLEX_PRODUCT: str = "Sagarr"
-    PLEX_CLIENT_ID: str = os.getenv("PLEX_CLIENT_ID", str(uuid.uuid4()))
+    # Left empty, an ID is generated once and stored in app_settings so every
+    # worker (and every restart) presents the same client to Plex.
+    PLEX_CLIENT_ID: str = os.getenv("PLEX_CLIENT_ID", "")
     PLEX_DEVICE: str = "Sagarr Server"
     PLEX_VERSION: str = "0.1.0"
 
@@ -36,12 +41,49 @@ class Settings(BaseSettings):
     AI_FALLBACK_PROVIDER: str = os.getenv("AI_FALLBACK_PROVIDER", "")
     AI_FALLBACK_API_KEY: str = os.getenv("AI_FALLBACK_API_KEY", "")
     AI_FALLBACK_MODEL: str = os.getenv("AI_FALLBACK_MODEL", "")
+    # Replay fixtures (AI_PROVIDER=replay), e.g. for offline benchmarks.
+    AI_REPLAY_PATH: str = os.getenv("AI_REPLAY_PATH", "")
+    # Append every prompt/response of the configured provider to AI_REPLAY_PATH.
+    AI_REPLAY_RECORD: bool = os.getenv("AI_REPLAY_RECORD", "false").lower() in {"1", "true", "yes"}
+    AI_REPLAY_LATENCY_MS: float = float(os.getenv("AI_REPLAY_LATENCY_MS", "0"))
+    AI_REPLAY_TOKENS_PER_SECOND: float = float(os.getenv("AI_REPLAY_TOKENS_PER_SECOND", "0"))
 
     # TMDb
     TMDB_API_KEY: str = os.getenv("TMDB_API_KEY", "")
+    # Overridable so benchmarks can point at a local stand-in.
+    TMDB_BASE_URL: str = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+
+    # Recommendations
+    # Number of recommendation runs kept per user; older runs are pruned.
+    RECOMMENDATION_RUNS_RETAINED: int = int(os.getenv("RECOMMENDATION_RUNS_RETAINED", "3"))
+    # Comma-separated words/phrases that mark watch history as adult content
+    # (matched at the start of a word, so "porn" also catches "pornstar"),
+    # whole phrases exempt from that match, and content ratings that are
+    # always treated as adult.
+    ADULT_KEYWORDS: str = os.getenv("ADULT_KEYWORDS", "porn,xxx,adult,erotic,hentai")
+    ADULT_ALLOWLIST: str = os.getenv(
+        "ADULT_ALLOWLIST", "adult swim,young adult,adult animation,adulthood,adultery"
+    )
+    ADULT_CONTENT_RATINGS: str = os.getenv("ADULT_CONTENT_RATINGS", "X,XXX")
+
+    # Performance
+    # JSON map of model-name prefix to USD per million [prompt, completion]
+    # tokens, extending the built-in price table for cost estimates.
+    LLM_PRICES: str = os.getenv("LLM_PRICES", "")
+
+    # Events
+    # How often items in connected users' feeds are re-checked in Overseerr
+    # for availability changes pushed over /api/events.
+    EVENTS_AVAILABILITY_INTERVAL_SECONDS: int = int(os.getenv("EVENTS_AVAILABILITY_INTERVAL_SECONDS", "120"))
+
+    # Auth
+    # How long decoded tokens and user snapshots are reused between requests.
+    AUTH_CACHE_TTL_SECONDS: int = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "30"))
 
     class Config:
         env_file = ".env"
+        # Snapshots are immutable; changes go through settings_store.update().
+        frozen = True
 
     # Properties used by newer code paths (security/metadata)
     @property
@@ -61,10 +103,68 @@ class Settings(BaseSettings):
         return self.TMDB_API_KEY
 
 
-settings = Settings()
+SettingsListener = Callable[[Settings, frozenset[str]], None]
+
+
+class SettingsStore:
+    """
+    Holds the current immutable Settings snapshot and its version.
+
+    `update()` swaps in a new snapshot and notifies subscribers with the set
+    of changed keys, so services can rebuild only what depends on them
+    (base URLs, headers, HTTP clients, the AI provider).
+    """
+
+    def __init__(self, initial: Settings) -> None:
+        self._current = initial
+        self._version = 0
+        self._listeners: list[SettingsListener] = []
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Settings:
+        return self._current
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def subscribe(self, listener: SettingsListener) -> None:
+        self._listeners.append(listener)
+
+    def update(self, **changes: Any) -> frozenset[str]:
+        """
+        Apply changes to known settings. Returns the keys that actually
+        changed; listeners are only called when there is at least one.
+        """
+        with self._lock:
+            old = self._current
+            updates = {
+                key: value
+                for key, value in changes.items()
+                if key in Settings.model_fields and getattr(old, key) != value
+            }
+            if not updates:
+                return frozenset()
+            self._current = old.model_copy(update=updates)
+            self._version += 1
+            new = self._current
+
+        changed = frozenset(updates)
+        for listener in list(self._listeners):
+            try:
+                listener(new, changed)
+            except Exception:
+                log_exception("settings", "Error applying settings change", changed=sorted(changed))
+        return changed
+
+
+settings_store = SettingsStore(Settings())
 
 
-@lru_cache
 def get_settings() -> Settings:
-    # For places that import get_settings() instead of using the global
-    return settings
+    """
+    The current settings snapshot. Read it per use rather than holding on
+    to it, so runtime changes from the admin UI take effect.
+    """
+    return settings_store.current
@@ -1,17 +1,58 @@
-from collections.abc import Generator
+import sqlite3
+from collections.abc import AsyncGenerator, Generator, Iterator
+from contextlib import contextmanager
+from pathlib import Path
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .database import Base, SessionLocal, engine, get_db as _get_db
+from .database import engine, get_async_db as _get_async_db, get_db as _get_db
+
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+# How long a worker waits for another worker's migrations to finish.
+MIGRATION_LOCK_TIMEOUT_SECONDS = 600
+
+
+@contextmanager
+def _migration_lock() -> Iterator[None]:
+    """
+    Serialize migrations across worker processes sharing a SQLite file.
+
+    The lock is an exclusive transaction on a sidecar database next to the
+    real one, so it never blocks the migration's own connection and is
+    released by SQLite if the process dies. In-memory and non-SQLite
+    databases are not shared this way and run without it.
+    """
+    path = engine.url.database if engine.url.get_backend_name() == "sqlite" else None
+    if not path or path == ":memory:" or path.startswith("file:"):
+        yield
+        return
+    lock = sqlite3.connect(f"{path}.migrate-lock", timeout=MIGRATION_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+    try:
+        lock.execute("BEGIN EXCLUSIVE")
+        yield
+    finally:
+        lock.close()
 
 
 def init_db() -> None:
     """
-    Ensure all tables are created.
+    Bring the schema up to date by running pending Alembic migrations.
+
+    Called from application startup rather than at import time. Revisions
+    are idempotent against databases created before migrations existed.
+    With several workers, the first one migrates while the others wait for
+    it and then find the schema already at head.
     """
-    from . import models  # noqa: F401
+    from alembic import command
+    from alembic.config import Config
 
-    Base.metadata.create_all(bind=engine)
+    config = Config(str(ALEMBIC_INI))
+    with _migration_lock(), engine.connect() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+        connection.commit()
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -21,3 +62,10 @@ def get_db() -> Generator[Session, None, None]:
     yield from _get_db()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async session dependency for route handlers; never blocks the event loop
+    on SQLite I/O or lock waits.
+    """
+    async for db in _get_async_db():
+        yield db
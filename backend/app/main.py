@@ -1,21 +1,47 @@
 import asyncio
+import uuid
+from datetime import datetime, timedelta
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
 
-from .database import engine, Base, SessionLocal
-from . import models
-from .models import User, AppSetting
-from .config import settings
-from .routers import auth, admin, media, recommendations, users
-from .services.recommendations import generate_recommendations
-
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+from .database import AsyncSessionLocal
+from .db import init_db
+from .models import AppSetting
+from .config import get_settings, settings_store
+from .routers import auth, admin, events, media, recommendations, users
+from .services.events import (
+    EVENT_RELAY_SECONDS,
+    refresh_watched_availability,
+    relay_shared_events,
+    sync_watched_availability,
+)
+from .services.leader import LEASE_RENEW_SECONDS, scheduler_lease
+from .services.performance import (
+    ROLLUP_INTERVAL_SECONDS,
+    ROLLUP_PRUNE_INTERVAL_SECONDS,
+    prune_performance_rollups,
+    rollup_performance,
+)
+from .services.recommendations import refresh_all_recommendations
+from .services.request_outbox import OUTBOX_POLL_SECONDS, process_outbox, wait_for_outbox
+from .services.seed import SEED_FEED_MAX_AGE, build_seed_feed
+from .services.shared_cache import get_shared, put_shared
+from .services.tautulli import tautulli_user_directory
+from .telemetry import configure_logging, log_event, log_exception, registry, span
 
 app = FastAPI(title="Sagarr API", version="0.1.0")
 
+# The nightly sweep's last run is kept in the shared cache for this long.
+NIGHTLY_SWEEP_KEY = "nightly_sweep"
+NIGHTLY_SWEEP_INTERVAL = timedelta(hours=24)
+NIGHTLY_SWEEP_CHECK_SECONDS = 5 * 60
+# How often each worker re-reads settings saved by the others.
+SETTINGS_SYNC_SECONDS = 10
+
 
 # Configure CORS
 origins = [
@@ -36,6 +62,7 @@ app.add_middleware(
 
 app.include_router(auth.router)
 app.include_router(admin.router)
+app.include_router(events.router)
 app.include_router(media.router)
 app.include_router(recommendations.router)
 app.include_router(users.router)
@@ -46,48 +73,254 @@ async def health_check():
     return {"status": "ok", "service": "Sagarr Backend", "database": "connected"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """
+    Span, upstream and LLM token metrics in Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 async def _refresh_recommendations_loop() -> None:
     """
     Simple background loop that refreshes recommendations for all users daily.
     """
-    # Run once shortly after startup, then every 24 hours.
+    # Run shortly after startup unless a sweep finished within the last 24
+    # hours (recorded in the shared cache, so a restart or a new leader does
+    # not repeat it), then every 24 hours.
     await asyncio.sleep(5)
     while True:
-        db: Session = SessionLocal()
         try:
-            users = db.query(User).all()
-            for user in users:
-                try:
-                    await generate_recommendations(db, user.id)
-                except Exception:
-                    # For now we swallow errors; production should log them.
-                    continue
-        finally:
-            db.close()
+            if await get_shared(NIGHTLY_SWEEP_KEY) is None:
+                await refresh_all_recommendations()
+                await put_shared(NIGHTLY_SWEEP_KEY, datetime.utcnow().isoformat(), NIGHTLY_SWEEP_INTERVAL)
+        except Exception:
+            log_exception("nightly_refresh", "Error running nightly refresh")
+        await asyncio.sleep(NIGHTLY_SWEEP_CHECK_SECONDS)
+
+
+async def _refresh_seed_feed_loop() -> None:
+    """
+    Rebuild the server-wide seed feed served to users whose personalized
+    recommendations are not ready yet.
+    """
+    await asyncio.sleep(5)
+    while True:
+        async with AsyncSessionLocal() as db:
+            try:
+                with span("build_seed_feed"):
+                    await build_seed_feed(db)
+            except Exception:
+                await db.rollback()
+                log_exception("seed_feed", "Error building seed feed")
+        await asyncio.sleep(SEED_FEED_MAX_AGE.total_seconds())
 
-        # Sleep for 24 hours
-        await asyncio.sleep(60 * 60 * 24)
+
+async def _refresh_tautulli_users_loop() -> None:
+    """
+    Keep the Tautulli user directory warm so logins map users without a
+    request to Tautulli.
+    """
+    while True:
+        try:
+            await tautulli_user_directory.refresh_if_stale()
+        except Exception:
+            log_exception("tautulli_users", "Error refreshing Tautulli users")
+        await asyncio.sleep(60)
 
 
-def _load_persistent_settings() -> None:
+async def _performance_rollup_loop() -> None:
+    """
+    Periodically summarize this worker's in-memory performance samples
+    into SQLite.
+    """
+    while True:
+        await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
+        try:
+            await rollup_performance()
+        except Exception:
+            log_exception("performance_rollup", "Error rolling up performance samples")
+
+
+async def _prune_performance_loop() -> None:
+    """
+    Drop performance summaries past retention.
+    """
+    while True:
+        try:
+            await prune_performance_rollups()
+        except Exception:
+            log_exception("performance_prune", "Error pruning performance rollups")
+        await asyncio.sleep(ROLLUP_PRUNE_INTERVAL_SECONDS)
+
+
+def _availability_ttl() -> timedelta:
+    # Outlives a couple of missed rounds before an entry is dropped.
+    return timedelta(seconds=3 * get_settings().EVENTS_AVAILABILITY_INTERVAL_SECONDS)
+
+
+async def _watch_availability_loop() -> None:
+    """
+    Re-check availability of the items in connected users' feeds on every
+    worker once per round, instead of every card polling.
+    """
+    while True:
+        await asyncio.sleep(get_settings().EVENTS_AVAILABILITY_INTERVAL_SECONDS)
+        try:
+            await refresh_watched_availability(_availability_ttl())
+        except Exception:
+            log_exception("availability_watch", "Error refreshing watched availability")
+
+
+async def _sync_availability_loop() -> None:
+    """
+    Hand this worker's watched items to the leader and push the statuses
+    it observed over this worker's event streams.
+    """
+    while True:
+        await asyncio.sleep(get_settings().EVENTS_AVAILABILITY_INTERVAL_SECONDS)
+        try:
+            await sync_watched_availability(scheduler_lease.holder, _availability_ttl())
+        except Exception:
+            log_exception("availability_sync", "Error syncing watched availability")
+
+
+async def _request_outbox_loop() -> None:
+    """
+    Submit media requests queued through this worker right away; claiming
+    keeps workers from submitting the same rows.
+    """
+    while True:
+        await wait_for_outbox()
+        try:
+            await process_outbox()
+        except Exception:
+            log_exception("request_outbox", "Error processing media request outbox")
+
+
+async def _retry_outbox_loop() -> None:
+    """
+    Submit retries once they are due, and requests left behind by a worker
+    that stopped before submitting them.
+    """
+    while True:
+        try:
+            await process_outbox()
+        except Exception:
+            log_exception("request_outbox", "Error retrying media request outbox")
+        await asyncio.sleep(OUTBOX_POLL_SECONDS)
+
+
+async def _relay_events_loop() -> None:
+    """
+    Push events published by other workers (request outcomes, finished
+    generations) to the streams connected to this one.
+    """
+    while True:
+        await asyncio.sleep(EVENT_RELAY_SECONDS)
+        try:
+            await relay_shared_events()
+        except Exception:
+            log_exception("event_relay", "Error relaying shared events")
+
+
+# Jobs that act on shared state run only in the worker holding the
+# scheduler lease; the loops started in every worker serve per-worker
+# state (settings snapshot, Tautulli directory, in-memory samples, SSE
+# connections, requests queued through that worker).
+LEADER_JOBS = (
+    _refresh_recommendations_loop,
+    _refresh_seed_feed_loop,
+    _retry_outbox_loop,
+    _watch_availability_loop,
+    _prune_performance_loop,
+)
+
+
+async def _leader_election_loop() -> None:
+    """
+    Renew the scheduler lease and run the scheduled jobs while this worker
+    holds it, so `uvicorn --workers N` still runs one nightly sweep.
+    """
+    tasks: list[asyncio.Task] = []
+    while True:
+        try:
+            await scheduler_lease.renew()
+        except Exception:
+            log_exception("scheduler_lease", "Error renewing scheduler lease")
+        if scheduler_lease.is_leader and not tasks:
+            log_event("scheduler_lease", "Took the scheduler lease", worker=scheduler_lease.holder)
+            tasks = [asyncio.create_task(job()) for job in LEADER_JOBS]
+        elif not scheduler_lease.is_leader and tasks:
+            log_event("scheduler_lease", "Lost the scheduler lease", worker=scheduler_lease.holder)
+            for task in tasks:
+                task.cancel()
+            tasks = []
+        await asyncio.sleep(LEASE_RENEW_SECONDS)
+
+
+async def _sync_settings_loop() -> None:
+    """
+    Pick up settings saved through another worker's admin API; only the
+    changed keys are published, so unchanged services are left alone.
+    """
+    while True:
+        await asyncio.sleep(SETTINGS_SYNC_SECONDS)
+        try:
+            await _load_persistent_settings()
+        except Exception:
+            log_exception("settings_sync", "Error reloading settings")
+
+
+async def _load_persistent_settings() -> None:
     """
     On startup, load any persisted app-level settings from the database and
-    apply them to the in-memory settings object, overriding env defaults.
+    publish them as a new settings snapshot, overriding env defaults.
+    """
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(AppSetting))).scalars().all()
+    settings_store.update(**{row.key: row.value for row in rows})
+
+
+async def _ensure_plex_client_id() -> None:
+    """
+    Persist a generated Plex client identifier unless one is configured.
+    Workers race to insert it and the first one wins; all of them then
+    read the stored ID through `_load_persistent_settings`.
     """
-    db: Session = SessionLocal()
-    try:
-        rows = db.query(AppSetting).all()
-        for row in rows:
-            if hasattr(settings, row.key):
-                setattr(settings, row.key, row.value)
-    finally:
-        db.close()
+    if settings_store.current.PLEX_CLIENT_ID:
+        return
+    stmt = insert(AppSetting).values(key="PLEX_CLIENT_ID", value=str(uuid.uuid4()))
+    async with AsyncSessionLocal() as db:
+        await db.execute(stmt.on_conflict_do_nothing(index_elements=["key"]))
+        await db.commit()
 
 
 @app.on_event("startup")
 async def startup_event() -> None:
+    configure_logging()
+    # Apply pending schema migrations before anything touches the database.
+    await asyncio.to_thread(init_db)
+    await _ensure_plex_client_id()
     # First, hydrate settings from persistent store so services see the
     # latest config rather than only env defaults.
-    _load_persistent_settings()
-    # Fire-and-forget background task for nightly recommendation refresh.
-    asyncio.create_task(_refresh_recommendations_loop())
+    await _load_persistent_settings()
+    # Fire-and-forget background tasks; LEADER_JOBS are started by
+    # whichever worker wins the scheduler lease.
+    asyncio.create_task(_leader_election_loop())
+    asyncio.create_task(_sync_settings_loop())
+    asyncio.create_task(_refresh_tautulli_users_loop())
+    asyncio.create_task(_performance_rollup_loop())
+    asyncio.create_task(_sync_availability_loop())
+    asyncio.create_task(_request_outbox_loop())
+    asyncio.create_task(_relay_events_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    # Hand the scheduled jobs to another worker right away.
+    if scheduler_lease.is_leader:
+        try:
+            await scheduler_lease.release()
+        except Exception:
+            log_exception("scheduler_lease", "Error releasing scheduler lease")
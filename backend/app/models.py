@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Float, ForeignKey, Index, Text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -17,11 +17,19 @@ class User(Base):
     tautulli_user_id = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     settings = Column(Text, default="{}") # JSON blob for user preferences
+    # Bumped in the same transaction as every user_preferences write, so
+    # caches derived from the user's ratings can be checked with one compare.
+    preference_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     recommendations = relationship("RecommendationCache", back_populates="user")
+    recommendation_runs = relationship("RecommendationRun", back_populates="user")
     preferences = relationship("UserPreference", back_populates="user")
 
 class RecommendationCache(Base):
+    """
+    Legacy JSON-blob storage, superseded by RecommendationRun. Kept so
+    existing rows remain readable for migration.
+    """
     __tablename__ = "recommendation_cache"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -31,8 +39,76 @@ class RecommendationCache(Base):
     
     user = relationship("User", back_populates="recommendations")
 
+
+class RecommendationRun(Base):
+    """
+    One generation of recommendations for a user. Only the newest few runs
+    per user are retained (see RECOMMENDATION_RUNS_RETAINED).
+    """
+    __tablename__ = "recommendation_runs"
+    __table_args__ = (
+        Index("ix_recommendation_runs_user_created", "user_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # JSON list of normalized titles from the user's watch history when the
+    # run was generated; feeds hide recommendations matching one of them.
+    watched_titles = Column(Text, nullable=True)
+
+    user = relationship("User", back_populates="recommendation_runs")
+    categories = relationship(
+        "RecommendationRunCategory",
+        back_populates="run",
+        cascade="all, delete-orphan",
+        order_by="RecommendationRunCategory.position",
+    )
+
+
+class RecommendationRunCategory(Base):
+    __tablename__ = "recommendation_categories"
+    __table_args__ = (
+        Index("ix_recommendation_categories_run_lane_position", "run_id", "lane", "position"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey("recommendation_runs.id", ondelete="CASCADE"), nullable=False)
+    lane = Column(String, nullable=False) # 'movies', 'tv' or 'documentaries'
+    position = Column(Integer, nullable=False)
+    title = Column(String, nullable=False)
+    reason = Column(Text, default="")
+
+    run = relationship("RecommendationRun", back_populates="categories")
+    items = relationship(
+        "RecommendationRunItem",
+        back_populates="category",
+        cascade="all, delete-orphan",
+        order_by="RecommendationRunItem.position",
+    )
+
+
+class RecommendationRunItem(Base):
+    __tablename__ = "recommendation_items"
+    __table_args__ = (
+        Index("ix_recommendation_items_category_position", "category_id", "position"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, ForeignKey("recommendation_categories.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    tmdb_id = Column(Integer, nullable=False)
+
+    category = relationship("RecommendationRunCategory", back_populates="items")
+
 class UserPreference(Base):
     __tablename__ = "user_preferences"
+    __table_args__ = (
+        # One preference per user and title; also the conflict target for upserts.
+        Index("uq_user_preferences_user_tmdb", "user_id", "tmdb_id", unique=True),
+        # Newest-first history pages.
+        Index("ix_user_preferences_user_created", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -44,9 +120,134 @@ class UserPreference(Base):
     user = relationship("User", back_populates="preferences")
 
 
+class UserStats(Base):
+    """
+    Per-user interaction counters, maintained incrementally alongside every
+    UserPreference write (see services/stats.py).
+    """
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    likes = Column(Integer, nullable=False, default=0)
+    dislikes = Column(Integer, nullable=False, default=0)
+    seen = Column(Integer, nullable=False, default=0)
+    requested = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class ActivityDaily(Base):
+    """
+    Server-wide activity per UTC day, for the admin activity series.
+    """
+    __tablename__ = "activity_daily"
+
+    day = Column(Date, primary_key=True)
+    ratings = Column(Integer, nullable=False, default=0)
+    requests = Column(Integer, nullable=False, default=0)
+
+
+class PerformanceRollup(Base):
+    """
+    Periodic summary of the in-memory performance samples (see
+    services/performance.py). `kind` is one of "upstream" (subject is the
+    service), "generation", "llm" (subject is the model) or "cache"
+    (subject is the cache name); `user_id` is set for per-user kinds.
+    """
+    __tablename__ = "performance_rollups"
+
+    id = Column(Integer, primary_key=True)
+    period_start = Column(DateTime, nullable=False)
+    kind = Column(String(20), nullable=False)
+    subject = Column(String, nullable=False, default="")
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    count = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    hits = Column(Integer, nullable=False, default=0)
+    p50_ms = Column(Float, nullable=True)
+    p95_ms = Column(Float, nullable=True)
+    p99_ms = Column(Float, nullable=True)
+    max_ms = Column(Float, nullable=True)
+    total_ms = Column(Float, nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_performance_rollups_kind_period", "kind", "period_start"),
+    )
+
+
+class MediaRequestOutbox(Base):
+    """
+    Media requests accepted from users and waiting to be submitted to
+    Overseerr by the outbox worker (see services/request_outbox.py).
+    `status` is "pending", "submitted", "skipped" (already available or
+    requested in Overseerr) or "failed" (gave up after retries).
+    """
+    __tablename__ = "media_request_outbox"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    tmdb_id = Column(Integer, nullable=False)
+    media_type = Column(String(10), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    submitted_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # One row per user and title, so repeated clicks collapse.
+        Index("uq_media_request_outbox_user_media", "user_id", "tmdb_id", "media_type", unique=True),
+        Index("ix_media_request_outbox_status_due", "status", "next_attempt_at"),
+    )
+
+
 class AppSetting(Base):
     __tablename__ = "app_settings"
 
     key = Column(String, primary_key=True, index=True)
     value = Column(Text, nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class MediaMetadata(Base):
+    """
+    Local cache of TMDb details, so feeds and history can be rendered
+    without re-fetching titles and posters on every request.
+    """
+    __tablename__ = "media_metadata"
+
+    tmdb_id = Column(Integer, primary_key=True)
+    media_type = Column(String, primary_key=True) # 'movie' or 'tv'
+    title = Column(String, nullable=True)
+    overview = Column(Text, nullable=True)
+    poster_path = Column(String, nullable=True)
+    adult = Column(Boolean, default=False)
+    genres = Column(Text, default="[]") # JSON list of {"id", "name"}
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class Lease(Base):
+    """
+    Named lease held by one worker process until `expires_at` unless renewed
+    (see services/leader.py), so background jobs run in a single worker.
+    """
+    __tablename__ = "leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class SharedCacheEntry(Base):
+    """
+    JSON values cached in the database so all worker processes can reuse
+    them (see services/shared_cache.py).
+    """
+    __tablename__ = "shared_cache"
+
+    key = Column(String, primary_key=True)
+    value = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -1,15 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..config import settings
-from ..database import get_db
+from ..config import settings_store
+from ..db import get_async_db
 from ..models import User, AppSetting
 from ..security import get_current_user
 from ..services.tautulli import tautulli_service
 from ..services.overseerr import overseerr_service
 from ..services.ai import get_ai_provider
-from ..services.metadata import fetch_tmdb_details, MetadataNotConfiguredError
+from ..services.metadata import fetch_tmdb_details_checked, MetadataNotConfiguredError
+from ..services.performance import get_performance
+from ..services.stats import get_admin_stats
 
 
 router = APIRouter(
@@ -32,6 +34,10 @@ class SettingsUpdate(BaseModel):
     AI_FALLBACK_MODEL: str
 
 
+# Keys masked as "***" in responses; a masked value is never saved back.
+SECRET_KEYS = {"TAUTULLI_API_KEY", "OVERSEERR_API_KEY", "AI_API_KEY", "TMDB_API_KEY", "AI_FALLBACK_API_KEY"}
+
+
 def _ensure_admin(user: User) -> None:
     if not user.is_admin:
         raise HTTPException(
@@ -40,11 +46,11 @@ def _ensure_admin(user: User) -> None:
         )
 
 
-def _save_setting(db: Session, key: str, value: str) -> None:
+async def _save_setting(db: AsyncSession, key: str, value: str) -> None:
     """
     Upsert a single app-level setting into the persistent store.
     """
-    setting = db.query(AppSetting).filter(AppSetting.key == key).first()
+    setting = await db.get(AppSetting, key)
     if setting:
         setting.value = value
     else:
@@ -54,11 +60,12 @@ def _save_setting(db: Session, key: str, value: str) -> None:
 
 @router.get("/settings")
 async def get_settings(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
 ):
     _ensure_admin(current_user)
 
+    settings = settings_store.current
     # Note: We mask sensitive keys in the API response
     return {
         "TAUTULLI_URL": settings.TAUTULLI_URL,
@@ -78,50 +85,25 @@ async def get_settings(
 @router.post("/settings")
 async def update_settings(
     new_settings: SettingsUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
 ):
     _ensure_admin(current_user)
 
     # Only update if value is provided (and not masked)
-    if new_settings.TAUTULLI_URL:
-        settings.TAUTULLI_URL = new_settings.TAUTULLI_URL
-        _save_setting(db, "TAUTULLI_URL", new_settings.TAUTULLI_URL)
-    if new_settings.TAUTULLI_API_KEY and "***" not in new_settings.TAUTULLI_API_KEY:
-        settings.TAUTULLI_API_KEY = new_settings.TAUTULLI_API_KEY
-        _save_setting(db, "TAUTULLI_API_KEY", new_settings.TAUTULLI_API_KEY)
-
-    if new_settings.OVERSEERR_URL:
-        settings.OVERSEERR_URL = new_settings.OVERSEERR_URL
-        _save_setting(db, "OVERSEERR_URL", new_settings.OVERSEERR_URL)
-    if new_settings.OVERSEERR_API_KEY and "***" not in new_settings.OVERSEERR_API_KEY:
-        settings.OVERSEERR_API_KEY = new_settings.OVERSEERR_API_KEY
-        _save_setting(db, "OVERSEERR_API_KEY", new_settings.OVERSEERR_API_KEY)
-
-    if new_settings.AI_PROVIDER:
-        settings.AI_PROVIDER = new_settings.AI_PROVIDER
-        _save_setting(db, "AI_PROVIDER", new_settings.AI_PROVIDER)
-    if new_settings.AI_API_KEY and "***" not in new_settings.AI_API_KEY:
-        settings.AI_API_KEY = new_settings.AI_API_KEY
-        _save_setting(db, "AI_API_KEY", new_settings.AI_API_KEY)
-    if new_settings.AI_MODEL:
-        settings.AI_MODEL = new_settings.AI_MODEL
-        _save_setting(db, "AI_MODEL", new_settings.AI_MODEL)
-    if new_settings.TMDB_API_KEY and "***" not in new_settings.TMDB_API_KEY:
-        settings.TMDB_API_KEY = new_settings.TMDB_API_KEY
-        _save_setting(db, "TMDB_API_KEY", new_settings.TMDB_API_KEY)
-
-    if new_settings.AI_FALLBACK_PROVIDER:
-        settings.AI_FALLBACK_PROVIDER = new_settings.AI_FALLBACK_PROVIDER
-        _save_setting(db, "AI_FALLBACK_PROVIDER", new_settings.AI_FALLBACK_PROVIDER)
-    if new_settings.AI_FALLBACK_API_KEY and "***" not in new_settings.AI_FALLBACK_API_KEY:
-        settings.AI_FALLBACK_API_KEY = new_settings.AI_FALLBACK_API_KEY
-        _save_setting(db, "AI_FALLBACK_API_KEY", new_settings.AI_FALLBACK_API_KEY)
-    if new_settings.AI_FALLBACK_MODEL:
-        settings.AI_FALLBACK_MODEL = new_settings.AI_FALLBACK_MODEL
-        _save_setting(db, "AI_FALLBACK_MODEL", new_settings.AI_FALLBACK_MODEL)
-
-    db.commit()
+    changes: dict[str, str] = {}
+    for key, value in new_settings.model_dump().items():
+        if not value:
+            continue
+        if key in SECRET_KEYS and "***" in value:
+            continue
+        changes[key] = value
+        await _save_setting(db, key, value)
+
+    await db.commit()
+    # Publish a new settings snapshot; services rebuild what depends on the
+    # changed keys.
+    settings_store.update(**changes)
     return {"status": "updated"}
 
 
@@ -134,7 +116,7 @@ class TestResult(BaseModel):
 async def test_tautulli(current_user: User = Depends(get_current_user)) -> TestResult:
     _ensure_admin(current_user)
 
-    if not settings.TAUTULLI_URL or not settings.TAUTULLI_API_KEY:
+    if not tautulli_service.configured:
         return TestResult(ok=False, message="Tautulli URL or API key is not configured.")
 
     try:
@@ -153,7 +135,7 @@ async def test_tautulli(current_user: User = Depends(get_current_user)) -> TestR
 async def test_overseerr(current_user: User = Depends(get_current_user)) -> TestResult:
     _ensure_admin(current_user)
 
-    if not settings.OVERSEERR_URL or not settings.OVERSEERR_API_KEY:
+    if not overseerr_service.configured:
         return TestResult(ok=False, message="Overseerr URL or API key is not configured.")
 
     # Try a simple availability check for a well-known TMDb movie ID (e.g. 550 = Fight Club).
@@ -173,6 +155,7 @@ async def test_overseerr(current_user: User = Depends(get_current_user)) -> Test
 async def test_ai(current_user: User = Depends(get_current_user)) -> TestResult:
     _ensure_admin(current_user)
 
+    settings = settings_store.current
     if not settings.AI_MODEL or not settings.AI_PROVIDER:
         return TestResult(ok=False, message="AI provider or model is not configured.")
 
@@ -198,7 +181,7 @@ async def test_tmdb(current_user: User = Depends(get_current_user)) -> TestResul
     _ensure_admin(current_user)
 
     try:
-        details = await fetch_tmdb_details([550])
+        details, complete = await fetch_tmdb_details_checked([550], use_cache=False)
     except MetadataNotConfiguredError:
         return TestResult(ok=False, message="TMDb API key is not configured.")
     except Exception as exc:
@@ -206,6 +189,8 @@ async def test_tmdb(current_user: User = Depends(get_current_user)) -> TestResul
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail=f"Failed to contact TMDb: {exc}",
         ) from exc
+    if not complete:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Failed to contact TMDb.")
 
     if not details:
         return TestResult(ok=False, message="TMDb responded, but no movie details were returned.")
@@ -216,53 +201,23 @@ async def test_tmdb(current_user: User = Depends(get_current_user)) -> TestResul
 
 @router.get("/stats")
 async def get_stats(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
+    days: int = Query(30, ge=1, le=365),
 ):
     _ensure_admin(current_user)
 
-    from sqlalchemy import func
-    from ..models import UserPreference
-
-    # Count total users
-    total_users = db.query(User).count()
-
-    # Count interactions
-    # rating=1 (Like), rating=-1 (Dislike), rating=0 (Seen/Skip depending on context, but usually Seen)
-    # Actually, let's break it down by rating value
-    likes = db.query(UserPreference).filter(UserPreference.rating == 1).count()
-    dislikes = db.query(UserPreference).filter(UserPreference.rating == -1).count()
-    seen = db.query(UserPreference).filter(UserPreference.rating == 0).count()
-
-    # Count requests (if we track them in DB? Currently requests go straight to Overseerr)
-    # We don't have a local table for requests yet, so we can only count local interactions.
-
-    # Per-user statistics
-    users = db.query(User).all()
-    user_stats = []
-    for u in users:
-        u_likes = db.query(UserPreference).filter(UserPreference.user_id == u.id, UserPreference.rating == 1).count()
-        u_dislikes = db.query(UserPreference).filter(UserPreference.user_id == u.id, UserPreference.rating == -1).count()
-        u_seen = db.query(UserPreference).filter(UserPreference.user_id == u.id, UserPreference.rating == 0).count()
-        
-        user_stats.append({
-            "username": u.username or u.email or f"User {u.id}",
-            "likes": u_likes,
-            "dislikes": u_dislikes,
-            "seen": u_seen,
-            "total": u_likes + u_dislikes + u_seen
-        })
-
-    # Sort by total activity
-    user_stats.sort(key=lambda x: x["total"], reverse=True)
+    # Counters are maintained on every preference write, so this is one
+    # joined query plus the activity series regardless of user count.
+    return await get_admin_stats(db, days=days)
 
-    return {
-        "total_users": total_users,
-        "interactions": {
-            "likes": likes,
-            "dislikes": dislikes,
-            "seen": seen,
-            "total": likes + dislikes + seen
-        },
-        "user_stats": user_stats
-    }
+
+@router.get("/performance")
+async def get_performance_report(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+    hours: int = Query(24, ge=1, le=24 * 30),
+):
+    _ensure_admin(current_user)
+
+    return await get_performance(db, hours=hours)
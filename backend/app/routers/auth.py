@@ -1,11 +1,14 @@
-from datetime import datetime, timedelta
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
-import httpx
+from datetime import timedelta
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models, database, config
-from ..database import get_db
+from ..db import get_async_db
+from ..security import create_access_token
+from ..services.http import instrumented_client
+from ..services.recommendations import schedule_generation
+from ..services.tautulli import tautulli_user_directory
+from ..telemetry import log_exception
 from pydantic import BaseModel
 
 router = APIRouter(
@@ -13,6 +16,10 @@ router = APIRouter(
     tags=["auth"]
 )
 
+# Shared client so PIN polls and the user lookup reuse one TLS connection
+# to plex.tv instead of a handshake per request.
+_plex_client = instrumented_client("plex", timeout=15)
+
 # Schemas
 class LoginResponse(BaseModel):
     auth_url: str
@@ -27,16 +34,33 @@ class Token(BaseModel):
     token_type: str
     user: dict
 
-# Utils
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, config.settings.SECRET_KEY, algorithm=config.settings.ALGORITHM)
-    return encoded_jwt
+async def _finish_login(
+    user_id: int,
+    plex_id: int | None,
+    email: str | None,
+    username: str | None,
+    map_tautulli: bool,
+    generate: bool,
+) -> None:
+    """
+    Post-login work kept off the response path: map the user to Tautulli
+    once the directory is warm, then start their first generation.
+    """
+    if map_tautulli:
+        try:
+            await tautulli_user_directory.refresh_if_stale()
+        except Exception:
+            log_exception("tautulli_users", "Error refreshing Tautulli users")
+        tautulli_user_id = tautulli_user_directory.lookup(plex_id=plex_id, email=email, username=username)
+        if tautulli_user_id is not None:
+            async with database.AsyncSessionLocal() as db:
+                user = await db.get(models.User, user_id)
+                if user is not None:
+                    user.tautulli_user_id = tautulli_user_id
+                    await db.commit()
+    if generate:
+        schedule_generation(user_id)
+
 
 # Endpoints
 @router.get("/login", response_model=LoginResponse)
@@ -45,115 +69,96 @@ async def login():
     Initiate Plex OAuth flow.
     Returns the URL to redirect the user to, and the PIN ID to check later.
     """
+    settings = config.get_settings()
     headers = {
-        "X-Plex-Product": config.settings.PLEX_PRODUCT,
-        "X-Plex-Client-Identifier": config.settings.PLEX_CLIENT_ID,
-        "X-Plex-Version": config.settings.PLEX_VERSION,
-        "X-Plex-Device": config.settings.PLEX_DEVICE,
+        "X-Plex-Product": settings.PLEX_PRODUCT,
+        "X-Plex-Client-Identifier": settings.PLEX_CLIENT_ID,
+        "X-Plex-Version": settings.PLEX_VERSION,
+        "X-Plex-Device": settings.PLEX_DEVICE,
         "Accept": "application/json"
     }
     
-    async with httpx.AsyncClient() as client:
-        # 1. Get PIN
-        try:
-            resp = await client.post("https://plex.tv/api/v2/pins?strong=true", headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            pin_id = data['id']
-            code = data['code']
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to reach Plex API: {str(e)}")
+    # 1. Get PIN
+    try:
+        resp = await _plex_client.post("https://plex.tv/api/v2/pins?strong=true", headers=headers)
+        resp.raise_for_status()
+        data = resp.json()
+        pin_id = data['id']
+        code = data['code']
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to reach Plex API: {str(e)}")
 
     # 2. Construct Auth URL
     # We set forwardUrl to our frontend callback page
-    forward_url = f"{config.settings.FRONTEND_URL}/login/callback"
+    forward_url = f"{settings.FRONTEND_URL}/login/callback"
     auth_url = (
         f"https://app.plex.tv/auth#?"
-        f"clientID={config.settings.PLEX_CLIENT_ID}&"
+        f"clientID={settings.PLEX_CLIENT_ID}&"
         f"code={code}&"
-        f"context[device][product]={config.settings.PLEX_PRODUCT}&"
+        f"context[device][product]={settings.PLEX_PRODUCT}&"
         f"forwardUrl={forward_url}"
     )
     
     return {"auth_url": auth_url, "pin_id": pin_id, "code": code}
 
 @router.post("/callback", response_model=Token)
-async def callback(request: CallbackRequest, db: Session = Depends(get_db)):
+async def callback(
+    request: CallbackRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Check PIN status. If verified, create/update user and return JWT.
     """
+    settings = config.get_settings()
     headers = {
-        "X-Plex-Client-Identifier": config.settings.PLEX_CLIENT_ID,
+        "X-Plex-Client-Identifier": settings.PLEX_CLIENT_ID,
         "Accept": "application/json"
     }
     
-    async with httpx.AsyncClient() as client:
-        # 1. Check PIN
-        try:
-            resp = await client.get(f"https://plex.tv/api/v2/pins/{request.pin_id}", headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to check PIN: {str(e)}")
-
-        auth_token = data.get('authToken')
-        if not auth_token:
-            # Plex hasn't authorized this PIN yet (user didn't finish login or PIN expired)
-            raise HTTPException(status_code=400, detail="User has not authorized the app yet.")
-
-        # 2. Get User Details using the same client
-        user_headers = {
-            "X-Plex-Token": auth_token,
-            "X-Plex-Client-Identifier": config.settings.PLEX_CLIENT_ID,
-            "Accept": "application/json"
-        }
+    # 1. Check PIN
+    try:
+        resp = await _plex_client.get(f"https://plex.tv/api/v2/pins/{request.pin_id}", headers=headers)
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to check PIN: {str(e)}")
+
+    auth_token = data.get('authToken')
+    if not auth_token:
+        # Plex hasn't authorized this PIN yet (user didn't finish login or PIN expired)
+        raise HTTPException(status_code=400, detail="User has not authorized the app yet.")
+
+    # 2. Get User Details over the same kept-alive connection
+    user_headers = {
+        "X-Plex-Token": auth_token,
+        "X-Plex-Client-Identifier": settings.PLEX_CLIENT_ID,
+        "Accept": "application/json"
+    }
 
-        try:
-            user_resp = await client.get("https://plex.tv/api/v2/user", headers=user_headers)
-            user_resp.raise_for_status()
-            user_data = user_resp.json()
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            raise HTTPException(status_code=500, detail=f"Failed to fetch user info: {str(e)}")
-        
+    try:
+        user_resp = await _plex_client.get("https://plex.tv/api/v2/user", headers=user_headers)
+        user_resp.raise_for_status()
+        user_data = user_resp.json()
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to fetch user info: {str(e)}")
+    
     # 3. Create/Update User in DB
     plex_id = user_data.get('id')
     username = user_data.get('username')
     email = user_data.get('email')
     thumb = user_data.get('thumb')
     
-    # Check Tautulli
-    from ..services.tautulli import tautulli_service
-    tautulli_users = await tautulli_service.get_users()
-    tautulli_user_id = None
-
-    # Map Plex user to Tautulli user.
-    # Prefer email match, then username/friendly_name, falling back to id if they align.
-    plex_email = (email or "").lower()
-    plex_username = (username or "").lower()
-
-    for t_user in tautulli_users:
-        t_email = (t_user.get("email") or "").lower()
-        t_username = (t_user.get("username") or "").lower()
-        t_friendly = (t_user.get("friendly_name") or "").lower()
-        t_id = t_user.get("user_id")
-        
-        # Sometimes Tautulli returns user_id as integer, sometimes string. Normalize.
-        t_id_str = str(t_id) if t_id is not None else ""
-        plex_id_str = str(plex_id) if plex_id is not None else ""
-
-        if plex_email and t_email and plex_email == t_email:
-            tautulli_user_id = t_id
-            break
-        if plex_username and plex_username in (t_username, t_friendly):
-            tautulli_user_id = t_id
-            break
-        if t_id_str and plex_id_str and t_id_str == plex_id_str:
-            tautulli_user_id = t_id
-            break
-            
-    user = db.query(models.User).filter(models.User.plex_id == plex_id).first()
+    # Map to Tautulli from the cached user directory (no Tautulli request
+    # on the login path). A miss while the directory is still cold is
+    # retried in the background after login returns.
+    tautulli_user_id = tautulli_user_directory.lookup(plex_id=plex_id, email=email, username=username)
+
+    user = (
+        await db.execute(select(models.User).where(models.User.plex_id == plex_id))
+    ).scalars().first()
     if not user:
         user = models.User(
             plex_id=plex_id,
@@ -169,21 +174,43 @@ async def callback(request: CallbackRequest, db: Session = Depends(get_db)):
         user.email = email
         user.thumb = thumb
         user.auth_token = auth_token
-        user.tautulli_user_id = tautulli_user_id
+        if tautulli_user_id is not None:
+            user.tautulli_user_id = tautulli_user_id
 
     # Bootstrap admin: if there is no admin user yet, make this user admin.
-    has_admin = db.query(models.User).filter(models.User.is_admin.is_(True)).first()
+    has_admin = (
+        await db.execute(select(models.User.id).where(models.User.is_admin.is_(True)).limit(1))
+    ).first()
     if not has_admin:
         user.is_admin = True
 
-    db.commit()
-    db.refresh(user)
-    
+    await db.commit()
+    await db.refresh(user)
+
+    # First-time users get their feed generated in the background rather
+    # than on their first dashboard load.
+    has_run = (
+        await db.execute(
+            select(models.RecommendationRun.id).where(models.RecommendationRun.user_id == user.id).limit(1)
+        )
+    ).first()
+    if user.tautulli_user_id is None or not has_run:
+        background_tasks.add_task(
+            _finish_login,
+            user.id,
+            plex_id,
+            email,
+            username,
+            map_tautulli=user.tautulli_user_id is None,
+            generate=not has_run,
+        )
+
     # 4. Issue JWT
-    access_token_expires = timedelta(minutes=config.settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": str(user.id), "username": user.username},
-        expires_delta=access_token_expires
+        user.id,
+        expires_delta=access_token_expires,
+        username=user.username,
     )
     
     return {
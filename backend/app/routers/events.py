@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+
+from ..security import STREAM_TICKET_TTL, get_current_user, get_stream_user_id, issue_stream_ticket
+from ..services.events import event_bus
+
+
+router = APIRouter(tags=["events"])
+
+StreamUserDep = Annotated[int, Depends(get_stream_user_id)]
+CurrentUserDep = Annotated[object, Depends(get_current_user)]
+
+# Comment line sent on idle streams so proxies keep the connection open.
+KEEPALIVE_SECONDS = 15
+# Client reconnect delay after the stream drops.
+RETRY_MS = 5000
+
+
+async def _stream(user_id: int) -> AsyncIterator[bytes]:
+    async with event_bus.subscribe(user_id) as queue:
+        yield f"retry: {RETRY_MS}\n\n".encode("utf-8")
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield event.encode()
+
+
+@router.post("/api/events/ticket")
+async def create_stream_ticket(current_user: CurrentUserDep) -> dict:
+    """
+    Issue a single-use ticket for `GET /api/events?ticket=...`, so the
+    session token never appears in the stream URL.
+    """
+    ticket = await issue_stream_ticket(current_user.id)
+    return {"ticket": ticket, "expires_in": int(STREAM_TICKET_TTL.total_seconds())}
+
+
+@router.get("/api/events")
+async def stream_events(user_id: StreamUserDep) -> StreamingResponse:
+    """
+    Server-Sent Events stream for the current user:
+
+    - `recommendations`: a new recommendation run is ready (`run_id`);
+    - `availability`: an item shown in the user's feed changed status
+      (`tmdb_id`, `media_type`, `status`);
+    - `request`: a media request was submitted (`tmdb_id`, `media_type`).
+    """
+    return StreamingResponse(
+        _stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,29 +1,35 @@
 from __future__ import annotations
 
-from typing import Annotated
+import base64
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, desc
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from sqlalchemy import String, and_, bindparam, desc, or_, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import get_db
-from ..models import UserPreference
+from ..db import get_async_db
+from ..models import MediaMetadata, UserPreference
 from ..schemas import (
     MediaStatusResponse,
     RateMediaRequest,
+    RatingBatchRequest,
+    RatingBatchResponse,
     MediaRequestBody,
     MessageResponse,
     HistoryResponse,
     HistoryItem,
 )
 from ..security import get_current_user
-from ..services.overseerr import check_availability, request_media, OverseerrNotConfiguredError
-from ..services.metadata import fetch_tmdb_details
+from ..services.events import event_bus
+from ..services.overseerr import availability_status, check_availability, overseerr_service, OverseerrNotConfiguredError
+from ..services.metadata import warm_metadata_cache
+from ..services.preferences import apply_preference_events, delete_preference, upsert_preference
+from ..services.request_outbox import enqueue_request, notify_outbox
 
 
 router = APIRouter(tags=["media"])
 
-DbDep = Annotated[Session, Depends(get_db)]
+DbDep = Annotated[AsyncSession, Depends(get_async_db)]
 CurrentUserDep = Annotated[object, Depends(get_current_user)]
 
 
@@ -39,51 +45,46 @@ async def get_media_status(tmdb_id: int, media_type: str = "movie") -> MediaStat
     except Exception:
         return MediaStatusResponse(tmdb_id=tmdb_id, status="unknown")
 
-    # Heuristic: if Overseerr returns any request entries, treat as requested.
-    results = (
-        data.get("results")
-        or data.get("data", {}).get("results")
-        or data.get("data", {}).get("requests")
-        or []
-    )
-
-    if not results:
-        return MediaStatusResponse(tmdb_id=tmdb_id, status="missing")
-
-    # We could inspect media status here and distinguish "available" vs "requested".
-    # For now, if we have at least one entry, treat as "requested".
-    return MediaStatusResponse(tmdb_id=tmdb_id, status="requested")
+    status = availability_status(data)
+    # Baseline for the availability events pushed to feeds showing this item.
+    event_bus.note_availability(media_type, tmdb_id, status)
+    return MediaStatusResponse(tmdb_id=tmdb_id, status=status)
 
 
-@router.post("/api/media/{tmdb_id}/request", response_model=MessageResponse)
+@router.post("/api/media/{tmdb_id}/request", response_model=MessageResponse, status_code=202)
 async def create_media_request(
     tmdb_id: int,
     payload: MediaRequestBody,
+    response: Response,
     db: DbDep,
     current_user: CurrentUserDep,
 ) -> MessageResponse:
     """
-    Proxy a media request to Overseerr.
+    Queue a media request for Overseerr and answer right away.
+
+    The request is stored in the outbox together with the "requested"
+    preference; the outbox worker submits it (retrying while Overseerr is
+    slow or down) and confirms over /api/events. If it finally fails, the
+    preference is withdrawn again. Repeated clicks on the same title are
+    collapsed.
     """
-    try:
-        await request_media(tmdb_id=tmdb_id, media_type=payload.media_type)
-        
-        # Log the request as a high-value preference (Rating 2)
-        pref = UserPreference(
-            user_id=current_user.id,
-            tmdb_id=tmdb_id,
-            media_type=payload.media_type,
-            rating=2,  # 2 = Requested / Super Like
-        )
-        db.add(pref)
-        db.commit()
-        
-    except OverseerrNotConfiguredError:
+    if not overseerr_service.configured:
+        response.status_code = 200
         return MessageResponse(message="Overseerr is not configured on the server.")
-    except Exception:
-        return MessageResponse(message="Failed to create Overseerr request.")
 
-    return MessageResponse(message="Request submitted")
+    await enqueue_request(db, current_user.id, tmdb_id, payload.media_type)
+    # Log the request as a high-value preference (Rating 2)
+    await upsert_preference(
+        db,
+        user_id=current_user.id,
+        tmdb_id=tmdb_id,
+        media_type=payload.media_type,
+        rating=2,  # 2 = Requested / Super Like
+    )
+    await db.commit()
+    notify_outbox()
+
+    return MessageResponse(message="Request queued")
 
 
 @router.post("/api/media/{tmdb_id}/rate", response_model=MessageResponse)
@@ -97,36 +98,37 @@ async def rate_media(
     Store or update a simple thumbs up / down rating for a given item.
     """
     numeric_rating = 1 if payload.rating == "up" else -1
-    
-    # Check for existing preference
-    stmt = select(UserPreference).where(
-        UserPreference.user_id == current_user.id,
-        UserPreference.tmdb_id == tmdb_id
+    await upsert_preference(
+        db,
+        user_id=current_user.id,
+        tmdb_id=tmdb_id,
+        media_type=payload.media_type,
+        rating=numeric_rating,
     )
-    existing = db.execute(stmt).scalars().first()
-    
-    if existing:
-        existing.rating = numeric_rating
-        existing.media_type = payload.media_type
-        # Update timestamp? SQLAlchemy onupdate might handle it if configured, 
-        # but our model has server_default=func.now(). It doesn't have onupdate.
-        # Let's force update it if we want to bump it to top of history.
-        # existing.created_at = func.now() # Requires import func
-        pass 
-    else:
-        pref = UserPreference(
-            user_id=current_user.id,
-            tmdb_id=tmdb_id,
-            media_type=payload.media_type,
-            rating=numeric_rating,
-        )
-        db.add(pref)
-    
-    db.commit()
+    await db.commit()
 
     return MessageResponse(message="Rating saved")
 
 
+@router.post("/api/media/ratings", response_model=RatingBatchResponse)
+async def rate_media_batch(
+    payload: RatingBatchRequest,
+    db: DbDep,
+    current_user: CurrentUserDep,
+) -> RatingBatchResponse:
+    """
+    Apply a buffered batch of rating, skip and unrate events in a single
+    transaction (one upsert, one delete and one counters update).
+    """
+    saved, removed = await apply_preference_events(
+        db,
+        current_user.id,
+        [(event.tmdb_id, event.media_type, event.action) for event in payload.events],
+    )
+    await db.commit()
+    return RatingBatchResponse(saved=saved, removed=removed)
+
+
 @router.delete("/api/media/{tmdb_id}/rate", response_model=MessageResponse)
 async def delete_rating(
     tmdb_id: int,
@@ -136,64 +138,86 @@ async def delete_rating(
     """
     Remove a rating (undo).
     """
-    stmt = select(UserPreference).where(
-        UserPreference.user_id == current_user.id,
-        UserPreference.tmdb_id == tmdb_id
-    )
-    existing = db.execute(stmt).scalars().first()
-    
-    if existing:
-        db.delete(existing)
-        db.commit()
+    if await delete_preference(db, current_user.id, tmdb_id):
+        await db.commit()
         return MessageResponse(message="Rating removed")
     
     raise HTTPException(status_code=404, detail="Rating not found")
 
 
+def _encode_history_cursor(created_at_raw: str, pref_id: int) -> str:
+    raw = f"{created_at_raw}|{pref_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_history_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at_raw, pref_id = base64.urlsafe_b64decode(padded).decode("utf-8").rsplit("|", 1)
+        return created_at_raw, int(pref_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+
 @router.get("/api/user/history", response_model=HistoryResponse)
 async def get_history(
     db: DbDep,
     current_user: CurrentUserDep,
+    background_tasks: BackgroundTasks,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    rating: int | None = None,
+    media_type: Literal["movie", "tv"] | None = None,
 ) -> HistoryResponse:
     """
     Get user's interaction history (Requests, Likes, Dislikes).
+
+    Keyset-paginated on (created_at, id), newest first. Titles and posters
+    come from the local metadata cache in the same query; rows that are not
+    cached yet are filled in the background for the next load.
     """
+    # Compare against the raw stored timestamp so the keyset is exact no
+    # matter how SQLite formatted the value.
+    created_at_raw = type_coerce(UserPreference.created_at, String).label("created_at_raw")
     stmt = (
-        select(UserPreference)
+        select(UserPreference, created_at_raw, MediaMetadata.title, MediaMetadata.poster_path)
+        .outerjoin(
+            MediaMetadata,
+            and_(
+                MediaMetadata.tmdb_id == UserPreference.tmdb_id,
+                MediaMetadata.media_type == UserPreference.media_type,
+            ),
+        )
         .where(UserPreference.user_id == current_user.id)
-        .order_by(desc(UserPreference.created_at))
-        .limit(100) # Pagination can be added later
+        .order_by(desc(UserPreference.created_at), desc(UserPreference.id))
+        .limit(limit + 1)
     )
-    prefs = db.execute(stmt).scalars().all()
-    
-    if not prefs:
-        return HistoryResponse(history=[])
+    if rating is not None:
+        stmt = stmt.where(UserPreference.rating == rating)
+    if media_type is not None:
+        stmt = stmt.where(UserPreference.media_type == media_type)
+    if cursor:
+        after_created_at, after_id = _decode_history_cursor(cursor)
+        after_ts = bindparam("after_created_at", after_created_at, type_=String)
+        stmt = stmt.where(
+            or_(
+                UserPreference.created_at < after_ts,
+                and_(UserPreference.created_at == after_ts, UserPreference.id < after_id),
+            )
+        )
+
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_pref, last_created_at, _, _ = rows[-1]
+        next_cursor = _encode_history_cursor(last_created_at, last_pref.id)
 
-    # Split by type for metadata fetching
-    movies = [p for p in prefs if p.media_type == 'movie']
-    tv = [p for p in prefs if p.media_type == 'tv']
-    
-    movie_meta = []
-    tv_meta = []
-    
-    if movies:
-        movie_meta = await fetch_tmdb_details([p.tmdb_id for p in movies], "movie")
-    if tv:
-        tv_meta = await fetch_tmdb_details([p.tmdb_id for p in tv], "tv")
-        
-    movie_map = {m['id']: m for m in movie_meta}
-    tv_map = {t['id']: t for t in tv_meta}
-    
     results = []
-    for p in prefs:
-        meta = {}
-        if p.media_type == 'movie':
-            meta = movie_map.get(p.tmdb_id, {})
-        elif p.media_type == 'tv':
-            meta = tv_map.get(p.tmdb_id, {})
-            
-        title = meta.get("title") or meta.get("name")
-        poster_path = meta.get("poster_path")
+    uncached: dict[str, list[int]] = {}
+    for p, _, title, poster_path in rows:
+        if title is None and p.media_type in ("movie", "tv"):
+            uncached.setdefault(p.media_type, []).append(p.tmdb_id)
         poster_url = f"https://image.tmdb.org/t/p/w200{poster_path}" if poster_path else None
         
         results.append(HistoryItem(
@@ -204,6 +228,8 @@ async def get_history(
             title=title,
             poster_url=poster_url
         ))
-        
-    return HistoryResponse(history=results)
 
+    for kind, tmdb_ids in uncached.items():
+        background_tasks.add_task(warm_metadata_cache, tmdb_ids, kind)
+        
+    return HistoryResponse(history=results, next_cursor=next_cursor)
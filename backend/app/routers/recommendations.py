@@ -1,23 +1,37 @@
 from __future__ import annotations
 
+import asyncio
+import base64
 import json
-from typing import Annotated
+from datetime import datetime, timedelta
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException
+import httpx
+import openai
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy import select, desc
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import get_db
-from ..models import RecommendationCache, UserPreference
-from ..schemas import RecommendationsResponse, RecommendationCategory, MediaItem
+from ..db import get_async_db
+from ..models import (
+    RecommendationRun,
+    RecommendationRunCategory,
+    RecommendationRunItem,
+)
+from ..schemas import RecommendationsResponse, RecommendationCategory, RecommendationPage, MediaItem
 from ..security import get_current_user
-from ..services.metadata import fetch_tmdb_details, MetadataNotConfiguredError
-from ..services.recommendations import generate_recommendations
+from ..services.events import event_bus
+from ..services.feed_cache import EncodedFeed, etag_matches, feed_cache, make_etag, not_modified
+from ..services.metadata import fetch_tmdb_details_checked, MetadataNotConfiguredError
+from ..services.preferences import preference_version, rated_ids
+from ..services.recommendations import schedule_generation
+from ..services.seed import get_seed_run
+from ..telemetry import log_exception, span
 
 
 router = APIRouter(tags=["recommendations"])
 
-DbDep = Annotated[Session, Depends(get_db)]
+DbDep = Annotated[AsyncSession, Depends(get_async_db)]
 CurrentUserDep = Annotated[object, Depends(get_current_user)]
 
 
@@ -44,14 +58,18 @@ async def _enrich_categories(
     raw_categories: list[dict],
     media_type: str,
     watched_titles: set[str],
-    blocked_tmdb_ids: set[int],
+    blocked_tmdb_ids: frozenset[int],
     category_kind: str,
-) -> list[RecommendationCategory]:
+) -> tuple[list[RecommendationCategory], bool]:
     """
     Helper to fetch metadata for a list of raw categories and return enriched objects.
+
+    Also returns whether enrichment was complete; False when TMDb was
+    unreachable or not configured, so the result is served bare but not
+    cached.
     """
     if not raw_categories:
-        return []
+        return [], True
 
     # Collect TMDb IDs
     tmdb_ids: set[int] = set()
@@ -63,18 +81,22 @@ async def _enrich_categories(
                 tmdb_ids.add(tmdb_id)
 
     metadata_map: dict[int, dict] = {}
+    complete = True
     if tmdb_ids:
-        try:
-            details = await fetch_tmdb_details(list(tmdb_ids), media_type=media_type)
-            for item in details:
-                tmdb_id = item.get("id")
-                if isinstance(tmdb_id, int):
-                    metadata_map[tmdb_id] = item
-        except MetadataNotConfiguredError:
-            # If metadata is not configured, continue with bare IDs.
-            metadata_map = {}
-        except Exception:
-            metadata_map = {}
+        with span("metadata_fetch", media_type=media_type, ids=len(tmdb_ids)) as step:
+            try:
+                details, complete = await fetch_tmdb_details_checked(list(tmdb_ids), media_type=media_type)
+                for item in details:
+                    tmdb_id = item.get("id")
+                    if isinstance(tmdb_id, int):
+                        metadata_map[tmdb_id] = item
+            except MetadataNotConfiguredError:
+                # If metadata is not configured, continue with bare IDs.
+                metadata_map, complete = {}, False
+            except Exception:
+                log_exception("metadata_fetch", "Error enriching recommendations", media_type=media_type)
+                metadata_map, complete = {}, False
+            step.set(found=len(metadata_map), complete=complete)
 
     categories: list[RecommendationCategory] = []
     for cat in raw_categories:
@@ -113,81 +135,216 @@ async def _enrich_categories(
         if items:
             categories.append(RecommendationCategory(title=title, reason=reason, items=items))
     
-    return categories
+    return categories, complete
+
+
+# lane -> (TMDb media type, category kind)
+LANES: dict[str, tuple[str, str]] = {
+    "movies": ("movie", "movies"),
+    "tv": ("tv", "tv"),
+    # For now, we treat documentaries as movies.
+    # Future improvement: Support mixed types or ask AI to split doc-series vs doc-movies.
+    "documentaries": ("movie", "docs"),
+}
+
+
+def _watched_titles(run: RecommendationRun) -> set[str]:
+    try:
+        titles = json.loads(run.watched_titles or "[]")
+    except json.JSONDecodeError:
+        return set()
+    return {t for t in titles if isinstance(t, str)}
+
+
+def _encode_cursor(run_id: int, offset: int) -> str:
+    raw = f"{run_id}:{offset}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        run_id, offset = base64.urlsafe_b64decode(padded).decode("ascii").split(":")
+        return int(run_id), max(int(offset), 0)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+
+async def _latest_run(db: AsyncSession, user_id: int) -> RecommendationRun:
+    """
+    Load the newest recommendation run (an index seek on user_id,
+    created_at) without waiting on the AI:
+
+    - runs older than 24 hours are still served while a fresh one is
+      generated in the background (stale-while-revalidate);
+    - users without a run get the server-wide seed feed while their first
+      personalized run is generated.
+    """
+    stmt = (
+        select(RecommendationRun)
+        .where(RecommendationRun.user_id == user_id)
+        .order_by(desc(RecommendationRun.created_at), desc(RecommendationRun.id))
+        .limit(1)
+    )
+    run = (await db.execute(stmt)).scalars().first()
+    if run is not None:
+        # Retention prunes the old runs once the new one is stored.
+        if datetime.utcnow() - run.created_at > timedelta(hours=24):
+            schedule_generation(user_id)
+        return run
+
+    pending = schedule_generation(user_id)
+    seed = await get_seed_run(db)
+    if seed is not None:
+        return seed
+
+    # Nothing to show yet (e.g. a brand-new server): wait for the first run.
+    # A failed generation is reported, not retried inline, so one request
+    # never pays for two LLM calls.
+    try:
+        run_id = await asyncio.shield(pending)
+    except ValueError as exc:
+        # Surface mapping/config issues (e.g. missing Tautulli mapping)
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except (httpx.HTTPError, openai.APIError) as exc:
+        raise HTTPException(status_code=502, detail="Recommendation provider request failed") from exc
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail="Recommendation generation failed; try again later") from exc
+    run = await db.get(RecommendationRun, run_id)
+    if run is None:
+        raise HTTPException(status_code=503, detail="Recommendation generation failed; try again later")
+    return run
 
 
-@router.get("/api/recommendations", response_model=RecommendationsResponse)
+async def _load_categories(
+    db: AsyncSession,
+    run_id: int,
+    lane: str | None = None,
+    offset: int = 0,
+    limit: int | None = None,
+) -> list[tuple[str, dict]]:
+    """
+    Load (lane, raw category) pairs for a run in display order, optionally
+    restricted to a slice of one lane. Two indexed queries regardless of
+    the number of categories.
+    """
+    stmt = select(RecommendationRunCategory).where(RecommendationRunCategory.run_id == run_id)
+    if lane is not None:
+        stmt = stmt.where(
+            RecommendationRunCategory.lane == lane,
+            RecommendationRunCategory.position >= offset,
+        )
+    stmt = stmt.order_by(RecommendationRunCategory.lane, RecommendationRunCategory.position)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    categories = (await db.execute(stmt)).scalars().all()
+    if not categories:
+        return []
+
+    items_stmt = (
+        select(RecommendationRunItem.category_id, RecommendationRunItem.tmdb_id)
+        .where(RecommendationRunItem.category_id.in_([c.id for c in categories]))
+        .order_by(RecommendationRunItem.category_id, RecommendationRunItem.position)
+    )
+    items_by_category: dict[int, list[int]] = {}
+    for category_id, tmdb_id in (await db.execute(items_stmt)).all():
+        items_by_category.setdefault(category_id, []).append(tmdb_id)
+
+    return [
+        (c.lane, {"title": c.title, "reason": c.reason, "items": items_by_category.get(c.id, [])})
+        for c in categories
+    ]
+
+
+@router.get(
+    "/api/recommendations",
+    response_model=RecommendationsResponse | RecommendationPage,
+)
 async def get_recommendations(
+    request: Request,
     db: DbDep,
     current_user: CurrentUserDep,
-) -> RecommendationsResponse:
+    lane: Literal["movies", "tv", "documentaries"] | None = None,
+    cursor: str | None = None,
+    limit: int = Query(5, ge=1, le=50),
+) -> Response:
     """
     Return the latest recommendation categories for the current user,
     enriching TMDb IDs with basic metadata. Returns both movies and tv.
+
+    When `lane` is given, only `limit` categories of that lane starting at
+    `cursor` are enriched and returned, together with the cursor for the
+    next page (null once the lane is exhausted).
+
+    Until the user's first personalized run is ready the server-wide seed
+    feed is returned with `seed: true`; clients should refetch later.
+
+    The response carries a strong ETag derived from the run and the
+    user's preference version (suffixed per content coding); a matching
+    If-None-Match yields a 304 and unchanged feeds are served from a
+    precompressed body. Feeds enriched while TMDb was unavailable are sent
+    with `Cache-Control: no-store` and no ETag, and are not cached.
     """
-    stmt = (
-        select(RecommendationCache)
-        .where(RecommendationCache.user_id == current_user.id)
-        .order_by(desc(RecommendationCache.created_at))
-    )
-    cache = db.execute(stmt).scalars().first()
-
-    if cache is not None:
-        # Check if cache is older than 24 hours
-        from datetime import datetime, timedelta
-        if datetime.utcnow() - cache.created_at > timedelta(hours=24):
-            # Cache expired, delete it so we generate fresh recs
-            db.delete(cache)
-            db.commit()
-            cache = None
-
-    if cache is None:
-        # No cache yet or expired; generate on demand
-        try:
-            cache = await generate_recommendations(db, current_user.id)
-        except ValueError as exc:
-            # Surface mapping/config issues (e.g. missing Tautulli mapping)
-            raise HTTPException(status_code=400, detail=str(exc)) from exc
+    offset = 0
+    if cursor:
+        if lane is None:
+            raise HTTPException(status_code=400, detail="cursor requires lane")
+        run_id, offset = _decode_cursor(cursor)
+        run = await db.get(RecommendationRun, run_id)
+        if run is None or run.user_id not in (current_user.id, None):
+            # The run this cursor points into has been pruned; the client
+            # should restart the lane from the first page.
+            raise HTTPException(status_code=410, detail="Cursor expired")
+    else:
+        run = await _latest_run(db, current_user.id)
 
-    try:
-        data = json.loads(cache.recommendations or "{}")
-    except json.JSONDecodeError as exc:
-        raise HTTPException(status_code=500, detail="Invalid recommendation cache format") from exc
-
-    # Handle legacy format where "categories" was the only key (assumed movies)
-    raw_movies = data.get("movies", [])
-    if not raw_movies and "categories" in data:
-        raw_movies = data["categories"]
-    
-    raw_tv = data.get("tv", [])
-    raw_docs = data.get("documentaries", [])
-
-    # Fetch live rated IDs to ensure immediate feedback (hiding rated items)
-    # even if the cache is stale.
-    rated_stmt = select(UserPreference.tmdb_id).where(UserPreference.user_id == current_user.id)
-    live_rated_ids = {
-        tmdb_id for tmdb_id in db.execute(rated_stmt).scalars().all() 
-        if tmdb_id is not None
-    }
-
-    watched_titles = {t.strip().lower() for t in data.get("watched_titles", []) if isinstance(t, str)}
-    blocked_tmdb_ids = live_rated_ids
-    
-    # Merge with cached blocked IDs just in case, though live DB should cover it.
-    for raw_id in data.get("rated_tmdb_ids", []) or []:
-        try:
-            blocked_tmdb_ids.add(int(raw_id))
-        except (TypeError, ValueError):
-            continue
+    version = await preference_version(db, current_user.id)
+    etag = make_etag("recommendations", run.id, version, lane, offset, limit)
+    accept_encoding = request.headers.get("accept-encoding")
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, accept_encoding)
 
-    movies_enriched = await _enrich_categories(raw_movies, "movie", watched_titles, blocked_tmdb_ids, "movies")
-    tv_enriched = await _enrich_categories(raw_tv, "tv", watched_titles, blocked_tmdb_ids, "tv")
-    # For now, we treat documentaries as movies. 
-    # Future improvement: Support mixed types or ask AI to split doc-series vs doc-movies.
-    docs_enriched = await _enrich_categories(raw_docs, "movie", watched_titles, blocked_tmdb_ids, "docs")
+    cache_key = (current_user.id, lane or "all", offset, limit)
+    encoded = feed_cache.get(cache_key, etag)
+    if encoded is not None:
+        return encoded.to_response(accept_encoding)
 
-    return RecommendationsResponse(
-        movies=movies_enriched, 
-        tv=tv_enriched, 
-        documentaries=docs_enriched
-    )
+    # The prompt asks the model to skip watched titles; it does not always.
+    watched_titles = _watched_titles(run)
+    # Hide anything rated since the run was generated.
+    blocked_tmdb_ids = await rated_ids(db, current_user.id, version)
+
+    if lane is not None:
+        media_type, kind = LANES[lane]
+        # Fetch one extra row to learn whether another page exists.
+        rows = await _load_categories(db, run.id, lane=lane, offset=offset, limit=limit + 1)
+        page = [raw for _, raw in rows[:limit]]
+        categories, complete = await _enrich_categories(page, media_type, watched_titles, blocked_tmdb_ids, kind)
+        response = RecommendationPage(
+            lane=lane,
+            categories=categories,
+            next_cursor=_encode_cursor(run.id, offset + limit) if len(rows) > limit else None,
+            seed=run.user_id is None,
+        )
+    else:
+        raw_by_lane: dict[str, list[dict]] = {name: [] for name in LANES}
+        for name, raw in await _load_categories(db, run.id):
+            raw_by_lane.setdefault(name, []).append(raw)
+        enriched: dict[str, list[RecommendationCategory]] = {}
+        complete = True
+        for name, (media_type, kind) in LANES.items():
+            enriched[name], lane_complete = await _enrich_categories(
+                raw_by_lane[name], media_type, watched_titles, blocked_tmdb_ids, kind
+            )
+            complete = complete and lane_complete
+        response = RecommendationsResponse(**enriched, seed=run.user_id is None)
+
+    # Push availability changes for these items over the user's event stream.
+    shown = response.categories if lane is not None else [*response.movies, *response.tv, *response.documentaries]
+    event_bus.watch(current_user.id, [(item.media_type, item.tmdb_id) for cat in shown for item in cat.items])
+
+    payload = response.model_dump(mode="json")
+    if not complete:
+        return EncodedFeed.encode(None, payload).to_response(accept_encoding)
+    encoded = feed_cache.put(cache_key, etag, payload)
+    return encoded.to_response(accept_encoding)
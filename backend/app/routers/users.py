@@ -1,8 +1,8 @@
 import json
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from ..db import get_async_db
 from ..models import User
 from ..schemas import UserSettings
 from ..security import get_current_user
@@ -27,7 +27,7 @@ async def get_user_settings(
 @router.post("/settings", response_model=UserSettings)
 async def update_user_settings(
     settings: UserSettings,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
 ):
     # Merge with existing settings
@@ -45,7 +45,7 @@ async def update_user_settings(
         current_data["date_cutoff"] = settings.date_cutoff
     
     current_user.settings = json.dumps(current_data)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     
     return UserSettings(**current_data)
@@ -1,6 +1,6 @@
 from typing import Literal
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 class UserBase(BaseModel):
@@ -41,6 +41,15 @@ class RecommendationsResponse(BaseModel):
     movies: list[RecommendationCategory] = []
     tv: list[RecommendationCategory] = []
     documentaries: list[RecommendationCategory] = []
+    # True while the server-wide seed feed stands in for a personalized one.
+    seed: bool = False
+
+
+class RecommendationPage(BaseModel):
+    lane: Literal["movies", "tv", "documentaries"]
+    categories: list[RecommendationCategory]
+    next_cursor: str | None = None
+    seed: bool = False
 
 
 class MediaStatusResponse(BaseModel):
@@ -53,6 +62,22 @@ class RateMediaRequest(BaseModel):
     media_type: Literal["movie", "tv"] = "movie"
 
 
+class RatingEvent(BaseModel):
+    tmdb_id: int
+    action: Literal["up", "down", "skip", "unrate"]
+    media_type: Literal["movie", "tv"] = "movie"
+
+
+class RatingBatchRequest(BaseModel):
+    # Applied in order; the last event for a title wins.
+    events: list[RatingEvent] = Field(max_length=500)
+
+
+class RatingBatchResponse(BaseModel):
+    saved: int
+    removed: int
+
+
 class MediaRequestBody(BaseModel):
     media_type: Literal["movie", "tv"] = "movie"
 
@@ -74,6 +99,7 @@ class HistoryItem(BaseModel):
 
 class HistoryResponse(BaseModel):
     history: list[HistoryItem]
+    next_cursor: str | None = None
 
 
 class UserSettings(BaseModel):
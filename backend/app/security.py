@@ -1,23 +1,43 @@
+import secrets
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
 from fastapi import Depends, HTTPException, Request, status
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 from .config import get_settings
-from .db import get_db
+from .database import AsyncSessionLocal
+from .db import get_async_db
 from .models import User
+from .services.shared_cache import pop_shared, put_shared
+from .telemetry import record_cache
 
 
-settings = get_settings()
+# Bound on cached tokens / users; the oldest entries are dropped first.
+AUTH_CACHE_MAX_ENTRIES = 4096
+# How long a stream ticket can be redeemed after it is issued.
+STREAM_TICKET_TTL = timedelta(seconds=30)
 
+# token -> (user_id, cached_until)
+_token_cache: dict[str, tuple[int, float]] = {}
+# user_id -> (detached User snapshot, cached_until)
+_user_cache: dict[int, tuple[User, float]] = {}
 
-def create_access_token(subject: str | int, expires_delta: timedelta | None = None) -> str:
+
+def create_access_token(
+    subject: str | int,
+    expires_delta: timedelta | None = None,
+    **claims: Any,
+) -> str:
+    settings = get_settings()
     if expires_delta is None:
         expires_delta = timedelta(minutes=settings.jwt_access_token_expires_minutes)
 
-    to_encode: dict[str, Any] = {"sub": str(subject)}
+    to_encode: dict[str, Any] = {**claims, "sub": str(subject)}
     expire = datetime.now(timezone.utc) + expires_delta
     to_encode["exp"] = expire
 
@@ -25,18 +45,85 @@ def create_access_token(subject: str | int, expires_delta: timedelta | None = No
     return encoded_jwt
 
 
+def _remember(cache: dict, key: Any, value: Any) -> None:
+    cache.pop(key, None)
+    cache[key] = value
+    while len(cache) > AUTH_CACHE_MAX_ENTRIES:
+        cache.pop(next(iter(cache)))
+
+
 def _decode_access_token(token: str) -> int:
+    now = time.monotonic()
+    cached = _token_cache.get(token)
+    if cached is not None and cached[1] > now:
+        record_cache("auth_token", hits=1)
+        return cached[0]
+    record_cache("auth_token", misses=1)
+
+    settings = get_settings()
     try:
         payload = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
         sub = payload.get("sub")
         if sub is None:
             raise JWTError("Missing subject")
-        return int(sub)
-    except JWTError as exc:
+        user_id = int(sub)
+    except (JWTError, ValueError) as exc:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token") from exc
 
+    # Never trust a cached decode past the token's own expiry.
+    ttl = float(settings.AUTH_CACHE_TTL_SECONDS)
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        ttl = min(ttl, exp - time.time())
+    if ttl > 0:
+        _remember(_token_cache, token, (user_id, now + ttl))
+    return user_id
+
+
+def _snapshot(user: User) -> User:
+    """
+    Detached copy of a loaded user's column values, safe to share between
+    requests and merge into any session without a SELECT.
+    """
+    snapshot = User(**{attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs})
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def invalidate_user(user_id: int) -> None:
+    _user_cache.pop(user_id, None)
+
+
+def clear_auth_cache() -> None:
+    _token_cache.clear()
+    _user_cache.clear()
+
 
-async def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _track_user_change(mapper, connection, target: User) -> None:
+    # Settings, admin flag and Plex token all live on the users row; drop
+    # the snapshot once the change is committed (see below).
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+    invalidate_user(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    # Clearing again after commit covers a concurrent request that re-cached
+    # the old row between the flush and the commit.
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session: Session) -> None:
+    session.info.pop("changed_user_ids", None)
+
+
+def _request_token(request: Request) -> str:
     # Prefer HTTP-only cookie if present
     token = request.cookies.get("sagarr_session")
 
@@ -51,13 +138,70 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)) -> U
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
         )
+    return token
+
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_db)) -> User:
+    user_id = _decode_access_token(_request_token(request))
 
-    user_id = _decode_access_token(token)
-    user = db.get(User, user_id)
+    cached = _user_cache.get(user_id)
+    if cached is not None and cached[1] > time.monotonic():
+        # Attach the snapshot to this request's session without a query, so
+        # handlers can still modify and commit the user.
+        record_cache("auth_user", hits=1)
+        return await db.merge(cached[0], load=False)
+    record_cache("auth_user", misses=1)
+
+    user = await db.get(User, user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
         )
+    ttl = get_settings().AUTH_CACHE_TTL_SECONDS
+    if ttl > 0:
+        _remember(_user_cache, user_id, (_snapshot(user), time.monotonic() + ttl))
     return user
 
+
+async def issue_stream_ticket(user_id: int) -> str:
+    """
+    Single-use ticket for opening /api/events. EventSource cannot send
+    headers, and a session token in the URL would end up in access logs
+    and browser history; a ticket is only good for one connection within
+    STREAM_TICKET_TTL.
+    """
+    ticket = secrets.token_urlsafe(24)
+    await put_shared(f"stream_ticket:{ticket}", user_id, STREAM_TICKET_TTL)
+    return ticket
+
+
+async def get_stream_user_id(request: Request) -> int:
+    """
+    Authenticate a long-lived stream with a `ticket` query parameter (see
+    `issue_stream_ticket`), or the usual cookie/Authorization header. Uses
+    its own short session so the connection does not hold a database
+    connection open.
+    """
+    ticket = request.query_params.get("ticket")
+    if ticket:
+        user_id = await pop_shared(f"stream_ticket:{ticket}")
+        if user_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired stream ticket",
+            )
+    else:
+        user_id = _decode_access_token(_request_token(request))
+    cached = _user_cache.get(user_id)
+    if cached is not None and cached[1] > time.monotonic():
+        record_cache("auth_user", hits=1)
+        return user_id
+    record_cache("auth_user", misses=1)
+    async with AsyncSessionLocal() as db:
+        if await db.get(User, user_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found",
+            )
+    return user_id
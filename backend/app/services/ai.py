@@ -1,20 +1,35 @@
 from abc import ABC, abstractmethod
 from typing import Optional, Dict, Any, List
+import asyncio
+import hashlib
+import os
+import threading
+import time
 import httpx
 from openai import AsyncOpenAI
-from ..config import settings
+from ..config import Settings, get_settings, settings_store
+from ..telemetry import record_llm_usage, span
+from .http import instrumented_client
 import json
 
 class AIProvider(ABC):
+    # Label used for upstream latency and token metrics.
+    name = "ai"
+
     @abstractmethod
     async def generate(self, prompt: str, system_prompt: str = None) -> str:
         pass
 
 class OpenAIProvider(AIProvider):
+    name = "openai"
+
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
-        self.api_key = api_key or settings.AI_API_KEY
-        self.model = model or settings.AI_MODEL
-        self.client = AsyncOpenAI(api_key=self.api_key)
+        self.api_key = api_key or get_settings().AI_API_KEY
+        self.model = model or get_settings().AI_MODEL
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            http_client=instrumented_client(self.name),
+        )
 
     async def generate(self, prompt: str, system_prompt: str = None) -> str:
         messages = []
@@ -27,19 +42,23 @@ class OpenAIProvider(AIProvider):
             messages=messages,
             response_format={"type": "json_object"}  # Force JSON
         )
+        if response.usage is not None:
+            record_llm_usage(self.name, self.model, response.usage.prompt_tokens, response.usage.completion_tokens)
         return response.choices[0].message.content
 
 
 class GenericProvider(AIProvider):
+    name = "generic"
+
     def __init__(
         self,
         base_url: Optional[str] = None,
         api_key: Optional[str] = None,
         model: Optional[str] = None,
     ):
-        self.base_url = (base_url or settings.AI_BASE_URL).rstrip("/")
-        self.api_key = api_key or settings.AI_API_KEY
-        self.model = model or settings.AI_MODEL
+        self.base_url = (base_url or get_settings().AI_BASE_URL).rstrip("/")
+        self.api_key = api_key or get_settings().AI_API_KEY
+        self.model = model or get_settings().AI_MODEL
 
     async def generate(self, prompt: str, system_prompt: str = None) -> str:
         # Assumes OpenAI-compatible endpoint (like Ollama or LocalAI)
@@ -57,10 +76,12 @@ class GenericProvider(AIProvider):
             "response_format": {"type": "json_object"}
         }
 
-        async with httpx.AsyncClient() as client:
+        async with instrumented_client(self.name) as client:
             resp = await client.post(url, headers=headers, json=payload, timeout=60.0)
             resp.raise_for_status()
             data = resp.json()
+            usage = data.get("usage") or {}
+            record_llm_usage(self.name, self.model, usage.get("prompt_tokens"), usage.get("completion_tokens"))
             return data["choices"][0]["message"]["content"]
 
 
@@ -69,9 +90,11 @@ class AnthropicProvider(AIProvider):
     Direct integration with Anthropic Claude (messages API).
     """
 
+    name = "anthropic"
+
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
-        self.api_key = api_key or settings.AI_API_KEY
-        self.model = model or settings.AI_MODEL
+        self.api_key = api_key or get_settings().AI_API_KEY
+        self.model = model or get_settings().AI_MODEL
 
     async def generate(self, prompt: str, system_prompt: str = None) -> str:
         # Combine system + user into a single user message; Claude encourages
@@ -97,10 +120,12 @@ class AnthropicProvider(AIProvider):
             ],
         }
 
-        async with httpx.AsyncClient() as client:
+        async with instrumented_client(self.name) as client:
             resp = await client.post(url, headers=headers, json=payload, timeout=60.0)
             resp.raise_for_status()
             data = resp.json()
+            usage = data.get("usage") or {}
+            record_llm_usage(self.name, self.model, usage.get("input_tokens"), usage.get("output_tokens"))
             content = data.get("content") or []
             if content and isinstance(content, list):
                 first = content[0]
@@ -117,10 +142,12 @@ class GeminiProvider(AIProvider):
     Direct integration with Google Gemini via the REST API.
     """
 
+    name = "gemini"
+
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
-        self.api_key = api_key or settings.AI_API_KEY
+        self.api_key = api_key or get_settings().AI_API_KEY
         # Default to a capable JSON-friendly model name if none is set.
-        self.model = model or settings.AI_MODEL or "gemini-1.5-flash"
+        self.model = model or get_settings().AI_MODEL or "gemini-1.5-flash"
 
     async def generate(self, prompt: str, system_prompt: str = None) -> str:
         combined = prompt
@@ -141,10 +168,14 @@ class GeminiProvider(AIProvider):
             ]
         }
 
-        async with httpx.AsyncClient() as client:
+        async with instrumented_client(self.name) as client:
             resp = await client.post(url, params=params, json=payload, timeout=60.0)
             resp.raise_for_status()
             data = resp.json()
+            usage = data.get("usageMetadata") or {}
+            record_llm_usage(
+                self.name, self.model, usage.get("promptTokenCount"), usage.get("candidatesTokenCount")
+            )
             candidates = data.get("candidates") or []
             if candidates and isinstance(candidates, list):
                 content = candidates[0].get("content") or {}
@@ -161,6 +192,8 @@ class ChainedProvider(AIProvider):
     Tries multiple underlying providers in order until one succeeds.
     """
 
+    name = "chained"
+
     def __init__(self, providers: List[AIProvider]):
         self.providers = providers
 
@@ -182,7 +215,108 @@ class ChainedProvider(AIProvider):
         return "{}"
 
 
-def _build_provider(kind: str, api_key: str, model: str) -> Optional[AIProvider]:
+class ReplayProvider(AIProvider):
+    """
+    Records prompt/response pairs to a JSON-lines fixture file, or replays
+    them without a live provider.
+
+    In record mode every call goes to `inner` and is appended to `path`.
+    In replay mode a call is answered with the recorded response for the
+    same prompt; prompts never seen before (history sampling makes them
+    vary) get the recorded responses in file order, round robin. Replays
+    wait `latency_ms` plus the completion tokens at `tokens_per_second`
+    (0 disables either), so timings resemble a real provider.
+    """
+
+    name = "replay"
+
+    def __init__(
+        self,
+        path: str,
+        inner: Optional[AIProvider] = None,
+        latency_ms: float = 0,
+        tokens_per_second: float = 0,
+        model: str = "replay",
+    ):
+        self.path = path
+        self.inner = inner
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.model = model
+        self._lock = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, Dict[str, Any]] = {}
+        self._next = 0
+        if inner is None:
+            self._load()
+
+    @staticmethod
+    def _key(prompt: str, system_prompt: Optional[str]) -> str:
+        return hashlib.sha256(f"{system_prompt or ''}\0{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        # Roughly four characters per token for English text and JSON.
+        return max(len(text) // 4, 1)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise ValueError(f"Replay fixture {self.path} does not exist.")
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.append(entry)
+                    self._by_key.setdefault(entry["key"], entry)
+        if not self._entries:
+            raise ValueError(f"Replay fixture {self.path} has no recordings.")
+
+    async def _record(self, prompt: str, system_prompt: Optional[str]) -> str:
+        started = time.perf_counter()
+        # The inner provider reports its token usage on the current span.
+        with span("llm_record") as step:
+            response = await self.inner.generate(prompt, system_prompt)
+        entry = {
+            "key": self._key(prompt, system_prompt),
+            "system_prompt": system_prompt,
+            "prompt": prompt,
+            "response": response,
+            "provider": self.inner.name,
+            "model": getattr(self.inner, "model", None),
+            "prompt_tokens": step.attrs.get("prompt_tokens") or self._estimate_tokens((system_prompt or "") + prompt),
+            "completion_tokens": step.attrs.get("completion_tokens") or self._estimate_tokens(response or ""),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return response
+
+    def _lookup(self, prompt: str, system_prompt: Optional[str]) -> Dict[str, Any]:
+        entry = self._by_key.get(self._key(prompt, system_prompt))
+        if entry is None:
+            with self._lock:
+                entry = self._entries[self._next % len(self._entries)]
+                self._next += 1
+        return entry
+
+    async def generate(self, prompt: str, system_prompt: str = None) -> str:
+        if self.inner is not None:
+            return await self._record(prompt, system_prompt)
+
+        entry = self._lookup(prompt, system_prompt)
+        response = entry["response"]
+        prompt_tokens = self._estimate_tokens((system_prompt or "") + prompt)
+        completion_tokens = int(entry.get("completion_tokens") or self._estimate_tokens(response or ""))
+        delay = self.latency_ms / 1000
+        if self.tokens_per_second > 0:
+            delay += completion_tokens / self.tokens_per_second
+        if delay > 0:
+            await asyncio.sleep(delay)
+        record_llm_usage(self.name, self.model, prompt_tokens, completion_tokens)
+        return response
+
+
+def _build_provider(settings: Settings, kind: str, api_key: str, model: str) -> Optional[AIProvider]:
     if not kind:
         return None
     kind = kind.lower()
@@ -198,6 +332,15 @@ def _build_provider(kind: str, api_key: str, model: str) -> Optional[AIProvider]
         if not api_key:
             return None
         return GeminiProvider(api_key=api_key, model=model)
+    if kind == "replay":
+        if not settings.AI_REPLAY_PATH:
+            return None
+        return ReplayProvider(
+            settings.AI_REPLAY_PATH,
+            latency_ms=settings.AI_REPLAY_LATENCY_MS,
+            tokens_per_second=settings.AI_REPLAY_TOKENS_PER_SECOND,
+            model=model or "replay",
+        )
     if kind in {"generic", "openrouter", "mistral", "groq"}:
         if not settings.AI_BASE_URL:
             return None
@@ -205,7 +348,7 @@ def _build_provider(kind: str, api_key: str, model: str) -> Optional[AIProvider]
     return None
 
 
-def get_ai_provider() -> AIProvider:
+def build_ai_provider(settings: Settings) -> AIProvider:
     """
     Returns a provider that may internally fall back to a secondary provider
     if the primary fails (e.g., due to quota limits).
@@ -213,7 +356,7 @@ def get_ai_provider() -> AIProvider:
     providers: List[AIProvider] = []
 
     # Primary provider from core AI_* settings
-    primary = _build_provider(settings.AI_PROVIDER, settings.AI_API_KEY, settings.AI_MODEL)
+    primary = _build_provider(settings, settings.AI_PROVIDER, settings.AI_API_KEY, settings.AI_MODEL)
     if primary:
         providers.append(primary)
 
@@ -221,20 +364,45 @@ def get_ai_provider() -> AIProvider:
     if settings.AI_FALLBACK_PROVIDER:
         fb_api_key = settings.AI_FALLBACK_API_KEY or settings.AI_API_KEY
         fb_model = settings.AI_FALLBACK_MODEL or settings.AI_MODEL
-        fallback = _build_provider(settings.AI_FALLBACK_PROVIDER, fb_api_key, fb_model)
+        fallback = _build_provider(settings, settings.AI_FALLBACK_PROVIDER, fb_api_key, fb_model)
         if fallback:
             providers.append(fallback)
 
     # If nothing was configured correctly, fall back to the legacy behavior.
     if not providers:
         if settings.AI_PROVIDER == "openai":
-            providers.append(OpenAIProvider())
+            providers.append(OpenAIProvider(api_key=settings.AI_API_KEY, model=settings.AI_MODEL))
         else:
-            providers.append(GenericProvider())
+            providers.append(
+                GenericProvider(base_url=settings.AI_BASE_URL, api_key=settings.AI_API_KEY, model=settings.AI_MODEL)
+            )
+
+    provider = providers[0] if len(providers) == 1 else ChainedProvider(providers)
+
+    # Record what the configured providers answer, to replay offline later.
+    if settings.AI_REPLAY_RECORD and settings.AI_REPLAY_PATH and settings.AI_PROVIDER != "replay":
+        provider = ReplayProvider(settings.AI_REPLAY_PATH, inner=provider)
+    return provider
+
 
-    if len(providers) == 1:
-        return providers[0]
-    return ChainedProvider(providers)
+# Built on first use and rebuilt only after an AI_* setting changes.
+_provider: Optional[AIProvider] = None
 
 
-ai_provider = get_ai_provider()
+def _on_settings_change(settings: Settings, changed: frozenset[str]) -> None:
+    global _provider
+    if any(key.startswith("AI_") for key in changed):
+        _provider = None
+
+
+settings_store.subscribe(_on_settings_change)
+
+
+def get_ai_provider() -> AIProvider:
+    """
+    The provider for the current settings, cached between calls.
+    """
+    global _provider
+    if _provider is None:
+        _provider = build_ai_provider(get_settings())
+    return _provider
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from typing import Any
+
+from sqlalchemy import select
+
+from ..config import Settings, get_settings, settings_store
+from ..database import AsyncSessionLocal
+from ..models import MediaMetadata
+from ..telemetry import record_cache
+
+
+# Verdicts kept per Plex rating key; history rows repeat across generations,
+# so most rows are answered from here.
+VERDICT_CACHE_SIZE = 50_000
+
+# Tautulli fields checked against the keyword list.
+_TEXT_FIELDS = ("genres", "section_name", "library_name", "title", "grandparent_title", "tagline")
+
+# TMDb IDs in Plex GUIDs: the legacy agent's "guid", e.g.
+# "com.plexapp.agents.themoviedb://603?lang=en" or ".../1399/1/2?lang=en",
+# and the "tmdb://603" entry of the modern agent's "guids" list (whose own
+# "guid" is "plex://movie/...").
+_TMDB_GUID = re.compile(r"(?:themoviedb|tmdb)://(\d+)")
+
+
+def _split_list(value: str) -> list[str]:
+    return [part.strip().lower() for part in value.split(",") if part.strip()]
+
+
+def _phrase_pattern(phrases: list[str], prefix: bool = False) -> re.Pattern[str] | None:
+    """
+    One case-insensitive alternation for all phrases, starting at a word
+    boundary. With `prefix` a phrase also matches as the start of a longer
+    word ("porn" matches "pornstar"); otherwise it must end a word too.
+    """
+    if not phrases:
+        return None
+    alternatives = "|".join(
+        r"\s+".join(re.escape(word) for word in phrase.split())
+        for phrase in sorted(set(phrases), key=len, reverse=True)
+    )
+    end = r"\w*" if prefix else r"\b"
+    return re.compile(rf"\b(?:{alternatives}){end}", re.IGNORECASE)
+
+
+def to_text(value: Any) -> str:
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value or "")
+
+
+def tmdb_id_from_guid(item: dict[str, Any]) -> int | None:
+    guids = item.get("guids")
+    candidates = [item.get("guid"), *(guids if isinstance(guids, list) else [])]
+    for guid in candidates:
+        # Modern agent entries may be {"id": "tmdb://603"} objects.
+        if isinstance(guid, dict):
+            guid = guid.get("id")
+        match = _TMDB_GUID.search(str(guid or ""))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def _metadata_type(item: dict[str, Any]) -> str:
+    return "movie" if item.get("media_type") == "movie" else "tv"
+
+
+class AdultContentFilter:
+    """
+    Drops explicit adult titles from Tautulli history before it reaches the
+    AI. A row is adult if a word in its library, genres or titles starts
+    with a keyword (allowlisted phrases such as "Adult Swim" excepted),
+    if its content rating is listed in ADULT_CONTENT_RATINGS, or if cached
+    TMDb metadata flags the title as adult.
+    """
+
+    def __init__(self) -> None:
+        self._verdicts: OrderedDict[str, bool] = OrderedDict()
+        self._configure(get_settings())
+        settings_store.subscribe(self._on_settings_change)
+
+    def _configure(self, settings: Settings) -> None:
+        self._keywords = _phrase_pattern(_split_list(settings.ADULT_KEYWORDS), prefix=True)
+        self._allowlist = _phrase_pattern(_split_list(settings.ADULT_ALLOWLIST))
+        self._ratings = frozenset(rating.upper() for rating in _split_list(settings.ADULT_CONTENT_RATINGS))
+        self._verdicts.clear()
+
+    def _on_settings_change(self, settings: Settings, changed: frozenset[str]) -> None:
+        if changed & {"ADULT_KEYWORDS", "ADULT_ALLOWLIST", "ADULT_CONTENT_RATINGS"}:
+            self._configure(settings)
+
+    def _classify(self, item: dict[str, Any]) -> bool:
+        rating = str(item.get("content_rating") or "").strip().upper()
+        if rating and rating in self._ratings:
+            return True
+        if self._keywords is None:
+            return False
+        # Newlines keep words from neighbouring fields apart.
+        text = "\n".join(to_text(item.get(field)) for field in _TEXT_FIELDS)
+        if self._allowlist is not None:
+            text = self._allowlist.sub("\n", text)
+        return self._keywords.search(text) is not None
+
+    def looks_adult(self, item: dict[str, Any]) -> tuple[bool, bool]:
+        """
+        Keyword/rating verdict for one row, and whether it came from cache.
+        """
+        key = item.get("rating_key")
+        if key is None:
+            return self._classify(item), False
+        key = str(key)
+        verdict = self._verdicts.get(key)
+        if verdict is not None:
+            self._verdicts.move_to_end(key)
+            return verdict, True
+        verdict = self._classify(item)
+        self._verdicts[key] = verdict
+        if len(self._verdicts) > VERDICT_CACHE_SIZE:
+            self._verdicts.popitem(last=False)
+        return verdict, False
+
+    async def filter_history(self, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Return the rows that are not adult, preserving order.
+        """
+        kept: list[dict[str, Any]] = []
+        hits = misses = 0
+        for item in items:
+            verdict, cached = self.looks_adult(item)
+            if cached:
+                hits += 1
+            else:
+                misses += 1
+            if not verdict:
+                kept.append(item)
+        record_cache("adult_verdicts", hits=hits, misses=misses)
+
+        # TMDb's flag is checked on every call rather than folded into the
+        # cached verdict, since metadata may be fetched after a row was seen.
+        adult_ids = await _adult_tmdb_ids(kept)
+        if not adult_ids:
+            return kept
+        return [item for item in kept if (_metadata_type(item), tmdb_id_from_guid(item)) not in adult_ids]
+
+
+async def _adult_tmdb_ids(items: list[dict[str, Any]]) -> set[tuple[str, int]]:
+    """
+    (media_type, tmdb_id) pairs among the rows' GUIDs that cached TMDb
+    metadata marks as adult, in one query.
+    """
+    ids = {tmdb_id for item in items if (tmdb_id := tmdb_id_from_guid(item)) is not None}
+    if not ids:
+        return set()
+    stmt = select(MediaMetadata.media_type, MediaMetadata.tmdb_id).where(
+        MediaMetadata.tmdb_id.in_(ids),
+        MediaMetadata.adult.is_(True),
+    )
+    async with AsyncSessionLocal() as db:
+        return {(media_type, tmdb_id) for media_type, tmdb_id in (await db.execute(stmt)).all()}
+
+
+adult_filter = AdultContentFilter()
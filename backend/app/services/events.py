@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from ..telemetry import log_exception
+from .overseerr import availability_status, overseerr_service
+from .shared_cache import get_shared, put_shared, scan_shared
+
+
+# Events buffered per connection; a client that falls further behind loses
+# the oldest ones (it refetches on the next "recommendations" event anyway).
+EVENT_QUEUE_SIZE = 100
+# Feed items remembered per user for availability updates.
+WATCHED_ITEMS_PER_USER = 500
+# Shared-cache keys: each worker's watched items, and the statuses the
+# scheduler leader last observed for all of them.
+WATCHED_ITEMS_KEY = "watched_items:"
+WATCHED_AVAILABILITY_KEY = "watched_availability"
+# Events published from one worker for streams that may be connected to
+# another: shared under this prefix for a short while, and polled by
+# every worker at this interval.
+SHARED_EVENTS_KEY = "events:"
+SHARED_EVENTS_TTL = timedelta(minutes=1)
+EVENT_RELAY_SECONDS = 1
+
+
+@dataclass(frozen=True)
+class Event:
+    name: str
+    data: dict[str, Any]
+
+    def encode(self) -> bytes:
+        """
+        Serialize as one Server-Sent Events message.
+        """
+        payload = json.dumps(self.data, separators=(",", ":"))
+        return f"event: {self.name}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class EventBus:
+    """
+    In-process pub/sub fanning events out to each user's open event
+    streams, plus the feed items those users should hear availability
+    changes for.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: dict[int, set[asyncio.Queue[Event]]] = {}
+        # user_id -> {(media_type, tmdb_id): None}, oldest first.
+        self._watched: dict[int, dict[tuple[str, int], None]] = {}
+        # Last known availability per item, to publish only changes.
+        self._availability: dict[tuple[str, int], str] = {}
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int) -> AsyncIterator[asyncio.Queue[Event]]:
+        queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def connected_users(self) -> list[int]:
+        return list(self._subscribers)
+
+    def publish(self, user_id: int, name: str, **data: Any) -> None:
+        event = Event(name, data)
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def watch(self, user_id: int, items: list[tuple[str, int]]) -> None:
+        """
+        Remember items shown in a user's feed so availability changes for
+        them are pushed while the user is connected.
+        """
+        watched = self._watched.setdefault(user_id, {})
+        for item in items:
+            watched.pop(item, None)
+            watched[item] = None
+        while len(watched) > WATCHED_ITEMS_PER_USER:
+            watched.pop(next(iter(watched)))
+
+    def watched_items(self) -> set[tuple[str, int]]:
+        """
+        Items watched by currently connected users.
+        """
+        return {item for user_id in self._subscribers for item in self._watched.get(user_id, ())}
+
+    def note_availability(self, media_type: str, tmdb_id: int, status: str) -> None:
+        """
+        Record an observed availability status and, if it changed, notify
+        connected users watching the item.
+        """
+        if status == "unknown":
+            return
+        key = (media_type, tmdb_id)
+        previous = self._availability.get(key)
+        self._availability[key] = status
+        if previous is None or previous == status:
+            return
+        for user_id in list(self._subscribers):
+            if key in self._watched.get(user_id, ()):
+                self.publish(user_id, "availability", tmdb_id=tmdb_id, media_type=media_type, status=status)
+
+
+event_bus = EventBus()
+
+
+async def refresh_watched_availability(ttl: timedelta) -> int:
+    """
+    Re-check availability of every item watched on any worker once and
+    share the statuses for `ttl`. Runs on the scheduler leader only, so
+    Overseerr is polled once however many workers there are. Returns the
+    number of items checked.
+    """
+    if not overseerr_service.configured:
+        return 0
+    shared = await scan_shared(WATCHED_ITEMS_KEY)
+    items = sorted({(media_type, tmdb_id) for watched in shared.values() for media_type, tmdb_id in watched})
+    statuses = []
+    for media_type, tmdb_id in items:
+        data = await overseerr_service.check_availability(tmdb_id, media_type)
+        statuses.append((media_type, tmdb_id, availability_status(data)))
+    await put_shared(WATCHED_AVAILABILITY_KEY, statuses, ttl)
+    return len(items)
+
+
+async def sync_watched_availability(worker: str, ttl: timedelta) -> None:
+    """
+    Share this worker's watched items with the leader and publish the
+    changes among the statuses it last observed to this worker's streams.
+    """
+    watched = event_bus.watched_items()
+    await put_shared(f"{WATCHED_ITEMS_KEY}{worker}", sorted(watched), ttl)
+    for media_type, tmdb_id, status in await get_shared(WATCHED_AVAILABILITY_KEY) or ():
+        if (media_type, tmdb_id) in watched:
+            event_bus.note_availability(media_type, tmdb_id, status)
+
+
+# Shared event keys this worker has already published, with when it
+# first saw them; forgotten once the entries have expired.
+_relayed: dict[str, float] = {}
+
+
+async def publish_everywhere(events: list[tuple[int, str, dict[str, Any]]]) -> None:
+    """
+    Publish (user_id, name, data) events to the users' streams on every
+    worker: on this one right away, on the others through the shared cache
+    within EVENT_RELAY_SECONDS.
+    """
+    if not events:
+        return
+    key = f"{SHARED_EVENTS_KEY}{datetime.utcnow().isoformat()}:{uuid.uuid4().hex[:8]}"
+    _relayed[key] = time.monotonic()
+    for user_id, name, data in events:
+        event_bus.publish(user_id, name, **data)
+    try:
+        await put_shared(key, [[user_id, name, data] for user_id, name, data in events], SHARED_EVENTS_TTL)
+    except Exception:
+        # Clients refetch on reconnect; the work the events report is done.
+        log_exception("events", "Error sharing events with other workers", count=len(events))
+
+
+async def relay_shared_events() -> int:
+    """
+    Publish events shared by other workers to this worker's streams, each
+    once and in order. Returns the number of events published.
+    """
+    expired = time.monotonic() - 2 * SHARED_EVENTS_TTL.total_seconds()
+    for key in [key for key, seen in _relayed.items() if seen < expired]:
+        del _relayed[key]
+    if not event_bus.connected_users():
+        return 0
+    published = 0
+    for key, events in sorted((await scan_shared(SHARED_EVENTS_KEY)).items()):
+        if key in _relayed:
+            continue
+        _relayed[key] = time.monotonic()
+        for user_id, name, data in events:
+            event_bus.publish(user_id, name, **data)
+            published += 1
+    return published
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi import Response
+
+from ..telemetry import record_cache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Build a strong ETag from the given parts (e.g. cache row id and the
+    user's preference version).
+    """
+    raw = ":".join(str(p) for p in parts)
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _representation_etag(etag: str, coding: str | None) -> str:
+    # Each content coding is a different byte sequence, so it gets its own
+    # strong validator: "abc" (identity), "abc-gzip", "abc-br".
+    return etag if coding is None else f'{etag[:-1]}-{coding}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Evaluate an If-None-Match header against our ETag or any of its
+    per-encoding variants.
+
+    Uses the weak comparison mandated for If-None-Match, so a proxy that
+    downgrades our tag to W/"..." still gets a 304.
+    """
+    if not if_none_match:
+        return False
+    variants = {_representation_etag(etag, coding) for coding in (None, "gzip", "br")}
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in variants:
+            return True
+    return False
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        if name.strip() != coding:
+            continue
+        params = params.strip()
+        if not params.startswith("q="):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def _pick_coding(accept_encoding: str | None) -> str | None:
+    accept_encoding = (accept_encoding or "").lower()
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        return "br"
+    if _accepts(accept_encoding, "gzip"):
+        return "gzip"
+    return None
+
+
+def _headers(etag: str | None) -> dict[str, str]:
+    if etag is None:
+        # Incomplete bodies (e.g. TMDb was down) must be refetched.
+        return {"Cache-Control": "no-store", "Vary": "Accept-Encoding, Authorization, Cookie"}
+    return {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding, Authorization, Cookie",
+    }
+
+
+@dataclass(frozen=True)
+class EncodedFeed:
+    # None for bodies that must not be cached or revalidated.
+    etag: str | None
+    body: bytes
+    gzip_body: bytes
+    br_body: bytes | None = None
+
+    @classmethod
+    def encode(cls, etag: str | None, payload: dict[str, Any]) -> EncodedFeed:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return cls(
+            etag=etag,
+            body=body,
+            gzip_body=gzip.compress(body, compresslevel=6, mtime=0),
+            br_body=brotli.compress(body, quality=9) if brotli is not None else None,
+        )
+
+    def to_response(self, accept_encoding: str | None, headers: dict[str, str] | None = None) -> Response:
+        """
+        Pick the smallest precomputed body the client accepts, tagged with
+        that representation's ETag.
+        """
+        coding = _pick_coding(accept_encoding)
+        etag = _representation_etag(self.etag, coding) if self.etag is not None else None
+        all_headers = _headers(etag)
+        if headers:
+            all_headers.update(headers)
+
+        content = self.body
+        if coding == "br" and self.br_body is not None:
+            content = self.br_body
+            all_headers["Content-Encoding"] = "br"
+        elif coding == "gzip":
+            content = self.gzip_body
+            all_headers["Content-Encoding"] = "gzip"
+
+        return Response(content=content, media_type="application/json", headers=all_headers)
+
+
+def not_modified(etag: str, accept_encoding: str | None) -> Response:
+    """
+    304 carrying the ETag of the representation a 200 would have sent.
+    """
+    return Response(status_code=304, headers=_headers(_representation_etag(etag, _pick_coding(accept_encoding))))
+
+
+class FeedCache:
+    """
+    In-process cache of serialized, precompressed recommendation feeds.
+
+    Only the most recent feed per (user, variant) is kept: once the ETag
+    changes the old body can never be served again.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: dict[tuple, EncodedFeed] = {}
+
+    def get(self, key: tuple, etag: str) -> EncodedFeed | None:
+        entry = self._entries.get(key)
+        if entry is None or entry.etag != etag:
+            record_cache("feed", misses=1)
+            return None
+        record_cache("feed", hits=1)
+        return entry
+
+    def put(self, key: tuple, etag: str, payload: dict[str, Any]) -> EncodedFeed:
+        entry = EncodedFeed.encode(etag, payload)
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            # Dicts preserve insertion order, so this evicts the oldest entry.
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = entry
+        return entry
+
+    def invalidate_user(self, user_id: int) -> None:
+        for key in [k for k in self._entries if k and k[0] == user_id]:
+            self._entries.pop(key, None)
+
+
+feed_cache = FeedCache()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import Any
+
+import httpx
+
+from ..telemetry import record_upstream
+
+
+# How long a client replaced after a settings change stays open, so
+# requests already using it can finish.
+CLIENT_RETIRE_DELAY_SECONDS = 60
+
+
+def normalize_base_url(url: str) -> str:
+    """
+    Strip whitespace and trailing slashes, and allow shorthand like
+    "tautulli:8181" by assuming http://.
+    """
+    base_url = (url or "").strip().rstrip("/")
+    if base_url and not base_url.startswith(("http://", "https://")):
+        base_url = f"http://{base_url}"
+    return base_url
+
+
+def retire_client(client: httpx.AsyncClient | None) -> None:
+    """
+    Close a superseded client after a grace period.
+    """
+    if client is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No loop running, so nothing can be using it; let GC close it.
+        return
+    loop.call_later(CLIENT_RETIRE_DELAY_SECONDS, lambda: loop.create_task(client.aclose()))
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Records latency (to response headers) and status code of every request
+    to an upstream service; network errors are counted as status "error".
+    """
+
+    def __init__(self, service: str, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        self.service = service
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            record_upstream(self.service, "error", time.perf_counter() - started)
+            raise
+        record_upstream(self.service, response.status_code, time.perf_counter() - started)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def instrumented_client(service: str, **kwargs: Any) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=InstrumentedTransport(service), **kwargs)
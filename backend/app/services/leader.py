@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.dialects.sqlite import insert
+
+from ..database import AsyncSessionLocal
+from ..models import Lease
+
+
+# A leader that stops renewing (crashed or hung worker) is replaced once
+# its lease expires; renewals happen well within that window.
+LEASE_TTL_SECONDS = 30
+LEASE_RENEW_SECONDS = 10
+
+
+class LeaderLease:
+    """
+    Lease-based leader election over the `leases` table. Every worker calls
+    `renew()` periodically; the holder extends its lease, and any worker
+    takes it over once it has expired. One atomic upsert per renewal, so no
+    two workers can hold the same lease.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Monotonic deadline of our own lease, one renewal interval short of
+        # the stored expiry, so a worker that cannot reach the database steps
+        # down before anyone else can take over.
+        self._valid_until = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def renew(self) -> bool:
+        """
+        Acquire or extend the lease. Returns whether this worker holds it.
+        """
+        started = time.monotonic()
+        now = datetime.utcnow()
+        stmt = insert(Lease).values(
+            name=self.name,
+            holder=self.holder,
+            expires_at=now + timedelta(seconds=LEASE_TTL_SECONDS),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Lease.name],
+            set_={"holder": stmt.excluded.holder, "expires_at": stmt.excluded.expires_at},
+            where=or_(Lease.holder == self.holder, Lease.expires_at < now),
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt)
+            holder = (await db.execute(select(Lease.holder).where(Lease.name == self.name))).scalar_one()
+            await db.commit()
+        self._valid_until = started + LEASE_TTL_SECONDS - LEASE_RENEW_SECONDS if holder == self.holder else 0.0
+        return self.is_leader
+
+    async def release(self) -> None:
+        """
+        Give the lease up (on shutdown) so another worker takes over at its
+        next renewal instead of waiting for expiry.
+        """
+        self._valid_until = 0.0
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Lease).where(Lease.name == self.name, Lease.holder == self.holder))
+            await db.commit()
+
+
+# Held by the worker that runs the scheduled jobs (nightly refresh, seed feed).
+scheduler_lease = LeaderLease("scheduler")
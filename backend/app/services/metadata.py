@@ -1,45 +1,220 @@
+import json
+from datetime import datetime, timedelta
+from functools import partial
 from typing import Any
 
 import httpx
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
 
-from ..config import get_settings
+from ..config import Settings, get_settings, settings_store
+from ..database import AsyncSessionLocal
+from ..models import MediaMetadata
+from ..telemetry import log_exception, record_cache
+from .http import instrumented_client, normalize_base_url, retire_client
+from .singleflight import SingleFlight
+
+
+# How long cached TMDb details are trusted before being re-fetched.
+METADATA_CACHE_TTL = timedelta(days=30)
 
 
 class MetadataNotConfiguredError(RuntimeError):
     pass
 
 
-async def fetch_tmdb_details(tmdb_ids: list[int], media_type: str = "movie") -> list[dict[str, Any]]:
+# Concurrent lookups of the same title (e.g. several users' feeds built at
+# once) share one TMDb request.
+_tmdb_flight = SingleFlight("tmdb_details")
+
+# Shared TMDb client, rebuilt when TMDB_BASE_URL changes. Requests coalesced
+# onto another caller's fetch must not depend on that caller's client.
+_tmdb_client: httpx.AsyncClient | None = None
+
+
+def _get_tmdb_client() -> httpx.AsyncClient:
+    global _tmdb_client
+    if _tmdb_client is None:
+        base_url = normalize_base_url(get_settings().TMDB_BASE_URL)
+        _tmdb_client = instrumented_client("tmdb", base_url=base_url, timeout=30)
+    return _tmdb_client
+
+
+def _on_settings_change(settings: Settings, changed: frozenset[str]) -> None:
+    global _tmdb_client
+    if "TMDB_BASE_URL" in changed:
+        retire_client(_tmdb_client)
+        _tmdb_client = None
+
+
+settings_store.subscribe(_on_settings_change)
+
+
+def _row_to_details(row: MediaMetadata) -> dict[str, Any]:
+    try:
+        genres = json.loads(row.genres or "[]")
+    except json.JSONDecodeError:
+        genres = []
+    return {
+        "id": row.tmdb_id,
+        "title": row.title,
+        "overview": row.overview,
+        "poster_path": row.poster_path,
+        "genres": genres,
+        "adult": bool(row.adult),
+    }
+
+
+async def get_cached_details(tmdb_ids: list[int], media_type: str = "movie") -> dict[int, dict[str, Any]]:
+    """
+    Return fresh cached TMDb details keyed by ID (adult titles included).
+    """
+    if not tmdb_ids:
+        return {}
+    cutoff = datetime.utcnow() - METADATA_CACHE_TTL
+    stmt = select(MediaMetadata).where(
+        MediaMetadata.media_type == media_type,
+        MediaMetadata.tmdb_id.in_(set(tmdb_ids)),
+        MediaMetadata.fetched_at >= cutoff,
+    )
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(stmt)).scalars().all()
+    return {row.tmdb_id: _row_to_details(row) for row in rows}
+
+
+async def _store_details(details: list[dict[str, Any]], media_type: str) -> None:
+    if not details:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {
+            "tmdb_id": data["id"],
+            "media_type": media_type,
+            "title": data.get("title") or data.get("name"),
+            "overview": data.get("overview"),
+            "poster_path": data.get("poster_path"),
+            "adult": bool(data.get("adult")),
+            "genres": json.dumps(data.get("genres") or []),
+            "fetched_at": now,
+        }
+        for data in details
+        if isinstance(data.get("id"), int)
+    ]
+    stmt = insert(MediaMetadata).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MediaMetadata.tmdb_id, MediaMetadata.media_type],
+        set_={
+            "title": stmt.excluded.title,
+            "overview": stmt.excluded.overview,
+            "poster_path": stmt.excluded.poster_path,
+            "adult": stmt.excluded.adult,
+            "genres": stmt.excluded.genres,
+            "fetched_at": stmt.excluded.fetched_at,
+        },
+    )
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.execute(stmt)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            log_exception("metadata_cache", "Error caching metadata", media_type=media_type)
+
+
+async def _fetch_one(client: httpx.AsyncClient, api_key: str, tmdb_id: int, media_type: str) -> dict[str, Any] | None:
+    """
+    Details for one title, or None if TMDb does not know it. Timeouts and
+    other error responses raise.
+    """
+    resp = await client.get(f"/{media_type}/{tmdb_id}", params={"api_key": api_key, "language": "en-US"})
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    data = resp.json()
+    # Normalize title/name
+    if "name" in data and "title" not in data:
+        data["title"] = data["name"]
+    return data
+
+
+async def fetch_tmdb_details(
+    tmdb_ids: list[int],
+    media_type: str = "movie",
+    use_cache: bool = True,
+) -> list[dict[str, Any]]:
     """
     Fetch basic metadata (title, poster, overview) for a list of TMDb IDs.
-    
+
+    Details are served from the local `media_metadata` cache when fresh;
+    only missing IDs are fetched from TMDb and written back to the cache.
+    IDs whose lookup failed are left out.
+
     Args:
         tmdb_ids: List of integer TMDb IDs.
         media_type: 'movie' or 'tv'.
+        use_cache: Set to False to always hit TMDb (e.g. connectivity tests).
     """
-    settings = get_settings()
-    if not settings.tmdb_api_key:
-        raise MetadataNotConfiguredError("TMDb API key not configured.")
+    details, _ = await fetch_tmdb_details_checked(tmdb_ids, media_type, use_cache)
+    return details
 
-    api_key = settings.tmdb_api_key
-    base_url = "https://api.themoviedb.org/3"
 
-    results: list[dict[str, Any]] = []
-    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
-        for tmdb_id in tmdb_ids:
-            endpoint = f"/{media_type}/{tmdb_id}"
+async def fetch_tmdb_details_checked(
+    tmdb_ids: list[int],
+    media_type: str = "movie",
+    use_cache: bool = True,
+) -> tuple[list[dict[str, Any]], bool]:
+    """
+    Like `fetch_tmdb_details`, but also reports whether every ID was
+    resolved. False means a lookup failed (timeout, 5xx, rate limit) and
+    the result should not be cached as final.
+    """
+    cached = await get_cached_details(tmdb_ids, media_type) if use_cache else {}
+    missing = [tmdb_id for tmdb_id in dict.fromkeys(tmdb_ids) if tmdb_id not in cached]
+    if use_cache:
+        record_cache("metadata", hits=len(cached), misses=len(missing))
+
+    fetched: dict[int, dict[str, Any]] = {}
+    complete = True
+    if missing:
+        settings = get_settings()
+        if not settings.tmdb_api_key:
+            raise MetadataNotConfiguredError("TMDb API key not configured.")
+
+        api_key = settings.tmdb_api_key
+        client = _get_tmdb_client()
+        for tmdb_id in missing:
             try:
-                resp = await client.get(endpoint, params={"api_key": api_key, "language": "en-US"})
-                if resp.status_code == 200:
-                    data = resp.json()
-                    # Skip explicit adult content.
-                    if data.get("adult") is True:
-                        continue
-                    # Normalize title/name
-                    if "name" in data and "title" not in data:
-                        data["title"] = data["name"]
-                    results.append(data)
-            except Exception as e:
-                print(f"Error fetching metadata for {media_type} {tmdb_id}: {e}")
-
-    return results
+                data = await _tmdb_flight.do(
+                    (media_type, tmdb_id), partial(_fetch_one, client, api_key, tmdb_id, media_type)
+                )
+            except Exception:
+                log_exception("tmdb_details", "Error fetching metadata", media_type=media_type, tmdb_id=tmdb_id)
+                complete = False
+                continue
+            if data is not None:
+                fetched[tmdb_id] = data
+
+        await _store_details(list(fetched.values()), media_type)
+
+    results: list[dict[str, Any]] = []
+    for tmdb_id in dict.fromkeys(tmdb_ids):
+        data = cached.get(tmdb_id) or fetched.get(tmdb_id)
+        if data is None:
+            continue
+        # Skip explicit adult content.
+        if data.get("adult") is True:
+            continue
+        results.append(data)
+    return results, complete
+
+
+async def warm_metadata_cache(tmdb_ids: list[int], media_type: str = "movie") -> None:
+    """
+    Best-effort background fill of the metadata cache.
+    """
+    try:
+        await fetch_tmdb_details(tmdb_ids, media_type)
+    except MetadataNotConfiguredError:
+        pass
+    except Exception:
+        log_exception("metadata_warm", "Error warming metadata cache", media_type=media_type)
@@ -1,81 +1,88 @@
 import httpx
 
-from ..config import settings
+from ..config import Settings, get_settings, settings_store
+from .http import instrumented_client, normalize_base_url, retire_client
+from .singleflight import SingleFlight
 
 
 class OverseerrService:
     def __init__(self) -> None:
-        # Intentionally avoid caching URL/API key here; they can be updated
-        # at runtime via the admin settings, so we always read from settings.
-        pass
+        # URL/API key can be updated at runtime via the admin settings; the
+        # client (base URL and auth headers) is rebuilt whenever they change.
+        self._client: httpx.AsyncClient | None = None
+        # Concurrent status checks for the same title share one request.
+        self._availability_flight = SingleFlight("overseerr_availability")
+        self._configure(get_settings())
+        settings_store.subscribe(self._on_settings_change)
+
+    def _configure(self, settings: Settings) -> None:
+        base_url = normalize_base_url(settings.OVERSEERR_URL)
+        api_key = settings.OVERSEERR_API_KEY
+        self.configured = bool(base_url and api_key)
+        old_client = self._client
+        self._client = (
+            instrumented_client(
+                "overseerr",
+                base_url=f"{base_url}/api/v1",
+                headers={"X-Api-Key": api_key, "Accept": "application/json"},
+                timeout=30,
+            )
+            if self.configured
+            else None
+        )
+        retire_client(old_client)
+
+    def _on_settings_change(self, settings: Settings, changed: frozenset[str]) -> None:
+        if changed & {"OVERSEERR_URL", "OVERSEERR_API_KEY"}:
+            self._configure(settings)
 
     async def check_availability(self, tmdb_id: int, media_type: str):
         """
         Check if media is available or requested.
         Returns: { "status": "AVAILABLE" | "PARTIALLY_AVAILABLE" | "PROCESSING" | "PENDING" | "UNKNOWN", "plexUrl": ... }
         """
-        base_url = settings.OVERSEERR_URL.strip().rstrip("/")
-        if base_url and not base_url.startswith(("http://", "https://")):
-            base_url = f"http://{base_url}"
-        api_key = settings.OVERSEERR_API_KEY
-
-        if not base_url or not api_key:
+        if not self.configured:
+            return {"status": "UNKNOWN"}
+        return await self._availability_flight.do(
+            (media_type, tmdb_id), lambda: self._check_availability(tmdb_id, media_type)
+        )
+
+    async def _check_availability(self, tmdb_id: int, media_type: str) -> dict:
+        try:
+            resp = await self._client.get(f"/{media_type}/{tmdb_id}")
+            resp.raise_for_status()
+            data = resp.json()
+
+            media_info = data.get("mediaInfo")
+            if not media_info:
+                return {"status": "MISSING"}
+
+            status = media_info.get("status")
+
+            # Check if there are pending requests
+            requests = media_info.get("requests", [])
+            is_requested = any(r.get("status") == 1 for r in requests)  # 1 = PENDING_APPROVAL
+
+            if status == 5:  # AVAILABLE
+                return {"status": "AVAILABLE"}
+            elif status == 4:  # PARTIALLY_AVAILABLE
+                return {"status": "PARTIALLY_AVAILABLE"}
+            elif status == 3:  # PROCESSING
+                return {"status": "PROCESSING"}
+            elif is_requested or status == 2:  # PENDING
+                return {"status": "PENDING"}
+            else:
+                return {"status": "MISSING"}
+
+        except Exception as e:
+            print(f"Error checking Overseerr availability: {e}")
             return {"status": "UNKNOWN"}
 
-        headers = {
-            "X-Api-Key": api_key,
-            "Accept": "application/json",
-        }
-
-        async with httpx.AsyncClient() as client:
-            try:
-                url = f"{base_url}/api/v1/{media_type}/{tmdb_id}"
-                resp = await client.get(url, headers=headers)
-                resp.raise_for_status()
-                data = resp.json()
-
-                media_info = data.get("mediaInfo")
-                if not media_info:
-                    return {"status": "MISSING"}
-
-                status = media_info.get("status")
-
-                # Check if there are pending requests
-                requests = media_info.get("requests", [])
-                is_requested = any(r.get("status") == 1 for r in requests)  # 1 = PENDING_APPROVAL
-
-                if status == 5:  # AVAILABLE
-                    return {"status": "AVAILABLE"}
-                elif status == 4:  # PARTIALLY_AVAILABLE
-                    return {"status": "PARTIALLY_AVAILABLE"}
-                elif status == 3:  # PROCESSING
-                    return {"status": "PROCESSING"}
-                elif is_requested or status == 2:  # PENDING
-                    return {"status": "PENDING"}
-                else:
-                    return {"status": "MISSING"}
-
-            except Exception as e:
-                print(f"Error checking Overseerr availability: {e}")
-                return {"status": "UNKNOWN"}
-
-    async def request_media(self, tmdb_id: int, media_type: str, user_id: int | None = None):
+    async def submit_request(self, tmdb_id: int, media_type: str) -> None:
         """
-        Request media via Overseerr.
+        Create a request in Overseerr, raising httpx errors (including
+        non-2xx responses) so callers can decide whether to retry.
         """
-        base_url = settings.OVERSEERR_URL.strip().rstrip("/")
-        if base_url and not base_url.startswith(("http://", "https://")):
-            base_url = f"http://{base_url}"
-        api_key = settings.OVERSEERR_API_KEY
-
-        if not base_url or not api_key:
-            return False
-
-        headers = {
-            "X-Api-Key": api_key,
-            "Accept": "application/json",
-        }
-
         payload = {
             "mediaId": tmdb_id,
             "mediaType": media_type,
@@ -86,15 +93,22 @@ class OverseerrService:
         if media_type == "tv":
             payload["seasons"] = [1, 2, 3]
 
-        async with httpx.AsyncClient() as client:
-            try:
-                url = f"{base_url}/api/v1/request"
-                resp = await client.post(url, headers=headers, json=payload)
-                resp.raise_for_status()
-                return True
-            except Exception as e:
-                print(f"Error requesting media in Overseerr: {e}")
-                return False
+        resp = await self._client.post("/request", json=payload)
+        resp.raise_for_status()
+
+    async def request_media(self, tmdb_id: int, media_type: str, user_id: int | None = None):
+        """
+        Request media via Overseerr.
+        """
+        if not self.configured:
+            return False
+
+        try:
+            await self.submit_request(tmdb_id, media_type)
+            return True
+        except Exception as e:
+            print(f"Error requesting media in Overseerr: {e}")
+            return False
 
 
 overseerr_service = OverseerrService()
@@ -104,17 +118,32 @@ class OverseerrNotConfiguredError(RuntimeError):
     pass
 
 
+def availability_status(data: dict) -> str:
+    """
+    Map a `check_availability` result to the status shown on media cards:
+    "available", "requested", "missing" or "unknown".
+    """
+    status = data.get("status")
+    if status in ("AVAILABLE", "PARTIALLY_AVAILABLE"):
+        return "available"
+    if status in ("PROCESSING", "PENDING"):
+        return "requested"
+    if status == "MISSING":
+        return "missing"
+    return "unknown"
+
+
 async def check_availability(tmdb_id: int, media_type: str = "movie") -> dict:
     """
     Convenience wrapper used by media router.
     """
-    if not settings.OVERSEERR_URL or not settings.OVERSEERR_API_KEY:
+    if not overseerr_service.configured:
         raise OverseerrNotConfiguredError("Overseerr is not configured.")
     return await overseerr_service.check_availability(tmdb_id, media_type=media_type)
 
 
 async def request_media(tmdb_id: int, media_type: str) -> dict:
-    if not settings.OVERSEERR_URL or not settings.OVERSEERR_API_KEY:
+    if not overseerr_service.configured:
         raise OverseerrNotConfiguredError("Overseerr is not configured.")
     ok = await overseerr_service.request_media(tmdb_id, media_type)
     return {"success": ok}
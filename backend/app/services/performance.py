@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import json
+import math
+from collections import defaultdict
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import PerformanceRollup, User
+from ..telemetry import log_exception, recorder
+from .recommendations import queue_depth, sweep_status
+from .request_outbox import outbox_counts
+from .leader import scheduler_lease
+from .singleflight import single_flight_stats
+
+
+# How often in-memory samples are summarized into performance_rollups, and
+# how long those summaries are kept.
+ROLLUP_INTERVAL_SECONDS = 300
+ROLLUP_RETENTION = timedelta(days=30)
+ROLLUP_PRUNE_INTERVAL_SECONDS = 60 * 60
+SLOWEST_USERS = 10
+
+# USD per million (prompt, completion) tokens, matched by model-name prefix.
+# LLM_PRICES overrides or extends these.
+DEFAULT_LLM_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4.1-nano": (0.1, 0.4),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1": (2.0, 8.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "gemini-1.5-flash": (0.075, 0.3),
+    "gemini-1.5-pro": (1.25, 5.0),
+    "gemini-2.0-flash": (0.1, 0.4),
+}
+
+
+def _prices() -> dict[str, tuple[float, float]]:
+    prices = dict(DEFAULT_LLM_PRICES)
+    raw = get_settings().LLM_PRICES
+    if raw:
+        try:
+            for model, (prompt, completion) in json.loads(raw).items():
+                prices[model] = (float(prompt), float(completion))
+        except (ValueError, TypeError):
+            log_exception("llm_prices", "Ignoring invalid LLM_PRICES")
+    return prices
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float | None:
+    """
+    Estimated USD cost of a token count, or None for unknown models.
+    """
+    prices = _prices()
+    match = max((name for name in prices if model.startswith(name)), key=len, default=None)
+    if match is None:
+        return None
+    prompt_price, completion_price = prices[match]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def percentiles(values: list[float]) -> dict[str, float | None]:
+    """
+    Nearest-rank p50/p95/p99 of durations in seconds, in milliseconds.
+    """
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[max(math.ceil(q * len(ordered)) - 1, 0)] * 1000, 2)
+
+    return {"p50_ms": rank(0.50), "p95_ms": rank(0.95), "p99_ms": rank(0.99)}
+
+
+def _timing_row(period_start: datetime, kind: str, subject: str, samples: list[tuple[float, bool]], **kw: Any) -> PerformanceRollup:
+    durations = [seconds for seconds, _ in samples]
+    return PerformanceRollup(
+        period_start=period_start,
+        kind=kind,
+        subject=subject,
+        count=len(samples),
+        errors=sum(1 for _, ok in samples if not ok),
+        max_ms=round(max(durations) * 1000, 2),
+        total_ms=round(sum(durations) * 1000, 2),
+        **percentiles(durations),
+        **kw,
+    )
+
+
+async def rollup_performance() -> int:
+    """
+    Summarize everything this worker recorded since its last rollup into
+    performance_rollups. Returns the number of rows written.
+    """
+    drained = recorder.drain()
+    period_start = datetime.utcfromtimestamp(drained["since"])
+    rows: list[PerformanceRollup] = []
+
+    for service, samples in drained["upstream"].items():
+        if samples:
+            rows.append(_timing_row(period_start, "upstream", service, [(s, ok) for _, s, ok in samples]))
+
+    by_user: dict[int, list[tuple[float, bool]]] = defaultdict(list)
+    for _, user_id, seconds, ok in drained["generations"]:
+        by_user[user_id].append((seconds, ok))
+    for user_id, samples in by_user.items():
+        rows.append(_timing_row(period_start, "generation", "generate", samples, user_id=user_id))
+
+    for (user_id, provider, model), (calls, prompt, completion) in drained["llm"].items():
+        rows.append(
+            PerformanceRollup(
+                period_start=period_start,
+                kind="llm",
+                subject=model,
+                user_id=user_id,
+                count=calls,
+                prompt_tokens=prompt,
+                completion_tokens=completion,
+                cost_usd=estimate_cost(model, prompt, completion),
+            )
+        )
+
+    for cache, (lookups, hits) in drained["caches"].items():
+        rows.append(PerformanceRollup(period_start=period_start, kind="cache", subject=cache, count=lookups, hits=hits))
+
+    async with AsyncSessionLocal() as db:
+        db.add_all(rows)
+        await db.commit()
+    return len(rows)
+
+
+async def prune_performance_rollups() -> int:
+    """
+    Drop summaries past retention. Returns the number of rows deleted.
+    """
+    stmt = delete(PerformanceRollup).where(PerformanceRollup.period_start < datetime.utcnow() - ROLLUP_RETENTION)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(stmt)
+        await db.commit()
+    return result.rowcount
+
+
+def _merge_usage(bucket: dict[str, Any], usage: dict[str, Any]) -> None:
+    for field in ("calls", "prompt_tokens", "completion_tokens"):
+        bucket[field] = bucket.get(field, 0) + usage[field]
+    cost = bucket.get("cost_usd")
+    if usage["cost_usd"] is not None:
+        cost = round((cost or 0.0) + usage["cost_usd"], 6)
+    bucket["cost_usd"] = cost
+
+
+def _ratio(hits: int, lookups: int) -> float | None:
+    return round(hits / lookups, 4) if lookups else None
+
+
+async def get_performance(db: AsyncSession, hours: int = 24) -> dict[str, Any]:
+    """
+    Live upstream percentiles from the ring buffers, plus cache ratios,
+    LLM usage and generation times over the last `hours` from the rollups
+    and the samples not yet rolled up.
+    """
+    since = datetime.utcnow() - timedelta(hours=hours)
+    in_window = (PerformanceRollup.period_start >= since,)
+
+    # Upstream latency: live percentiles plus the rolled-up history.
+    upstreams: dict[str, dict[str, Any]] = {}
+    for service, samples in sorted(recorder.upstream_samples().items()):
+        upstreams[service] = {
+            "count": len(samples),
+            "errors": sum(1 for _, _, ok in samples if not ok),
+            **percentiles([seconds for _, seconds, _ in samples]),
+        }
+    history_stmt = (
+        select(PerformanceRollup)
+        .where(PerformanceRollup.kind == "upstream", *in_window)
+        .order_by(PerformanceRollup.period_start, PerformanceRollup.subject)
+    )
+    upstream_history = [
+        {
+            "period_start": row.period_start.isoformat(),
+            "service": row.subject,
+            "count": row.count,
+            "errors": row.errors,
+            "p50_ms": row.p50_ms,
+            "p95_ms": row.p95_ms,
+            "p99_ms": row.p99_ms,
+        }
+        for row in (await db.execute(history_stmt)).scalars().all()
+    ]
+
+    pending_generations, pending_llm, pending_caches = recorder.pending()
+
+    # Cache hit ratios.
+    cache_totals: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+    cache_stmt = (
+        select(PerformanceRollup.subject, func.sum(PerformanceRollup.count), func.sum(PerformanceRollup.hits))
+        .where(PerformanceRollup.kind == "cache", *in_window)
+        .group_by(PerformanceRollup.subject)
+    )
+    for cache, lookups, hits in (await db.execute(cache_stmt)).all():
+        cache_totals[cache][0] += lookups or 0
+        cache_totals[cache][1] += hits or 0
+    for cache, (lookups, hits) in pending_caches.items():
+        cache_totals[cache][0] += lookups
+        cache_totals[cache][1] += hits
+    caches = {
+        cache: {"lookups": lookups, "hits": hits, "hit_ratio": _ratio(hits, lookups)}
+        for cache, (lookups, hits) in sorted(cache_totals.items())
+    }
+
+    # LLM usage per user and model.
+    llm_usage: dict[tuple[int | None, str], dict[str, Any]] = defaultdict(
+        lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": None}
+    )
+
+    def add_usage(key: tuple[int | None, str], calls: int, prompt: int, completion: int, cost: float | None) -> None:
+        usage = llm_usage[key]
+        usage["calls"] += calls
+        usage["prompt_tokens"] += prompt
+        usage["completion_tokens"] += completion
+        if cost is not None:
+            usage["cost_usd"] = (usage["cost_usd"] or 0.0) + cost
+
+    llm_stmt = (
+        select(
+            PerformanceRollup.user_id,
+            PerformanceRollup.subject,
+            func.sum(PerformanceRollup.count),
+            func.sum(PerformanceRollup.prompt_tokens),
+            func.sum(PerformanceRollup.completion_tokens),
+            func.sum(PerformanceRollup.cost_usd),
+        )
+        .where(PerformanceRollup.kind == "llm", *in_window)
+        .group_by(PerformanceRollup.user_id, PerformanceRollup.subject)
+    )
+    for user_id, model, calls, prompt, completion, cost in (await db.execute(llm_stmt)).all():
+        add_usage((user_id, model), calls or 0, prompt or 0, completion or 0, cost)
+    for (user_id, _, model), (calls, prompt, completion) in pending_llm.items():
+        add_usage((user_id, model), calls, prompt, completion, estimate_cost(model, prompt, completion))
+
+    # Generation times per user.
+    generations: dict[int, dict[str, Any]] = defaultdict(
+        lambda: {"generations": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0}
+    )
+    generation_stmt = (
+        select(
+            PerformanceRollup.user_id,
+            func.sum(PerformanceRollup.count),
+            func.sum(PerformanceRollup.errors),
+            func.sum(PerformanceRollup.total_ms),
+            func.max(PerformanceRollup.max_ms),
+        )
+        .where(PerformanceRollup.kind == "generation", *in_window)
+        .group_by(PerformanceRollup.user_id)
+    )
+    for user_id, count, errors, total_ms, max_ms in (await db.execute(generation_stmt)).all():
+        entry = generations[user_id]
+        entry["generations"] += count or 0
+        entry["failures"] += errors or 0
+        entry["total_ms"] += total_ms or 0.0
+        entry["max_ms"] = max(entry["max_ms"], max_ms or 0.0)
+    for _, user_id, seconds, ok in pending_generations:
+        entry = generations[user_id]
+        entry["generations"] += 1
+        entry["failures"] += 0 if ok else 1
+        entry["total_ms"] += seconds * 1000
+        entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+
+    user_ids = {user_id for user_id, _ in llm_usage if user_id is not None} | set(generations)
+    usernames: dict[int, str] = {}
+    if user_ids:
+        rows = await db.execute(select(User.id, User.username).where(User.id.in_(user_ids)))
+        usernames = {user_id: username for user_id, username in rows.all()}
+
+    by_user: dict[int | None, dict[str, Any]] = {}
+    by_model: dict[str, dict[str, Any]] = {}
+    for (user_id, model), usage in llm_usage.items():
+        _merge_usage(by_user.setdefault(user_id, {"user_id": user_id, "username": usernames.get(user_id)}), usage)
+        _merge_usage(by_model.setdefault(model, {"model": model}), usage)
+
+    slowest = sorted(
+        (
+            {
+                "user_id": user_id,
+                "username": usernames.get(user_id),
+                "generations": entry["generations"],
+                "failures": entry["failures"],
+                "avg_ms": round(entry["total_ms"] / entry["generations"], 2),
+                "max_ms": round(entry["max_ms"], 2),
+            }
+            for user_id, entry in generations.items()
+            if entry["generations"]
+        ),
+        key=lambda row: row["avg_ms"],
+        reverse=True,
+    )[:SLOWEST_USERS]
+
+    return {
+        "window_hours": hours,
+        "upstreams": upstreams,
+        "upstream_history": upstream_history,
+        "caches": caches,
+        "coalescing": single_flight_stats(),
+        # Live samples and the sweep are per worker; only the leader runs the sweep.
+        "worker": {"id": scheduler_lease.holder, "leader": scheduler_lease.is_leader},
+        "request_outbox": await outbox_counts(db),
+        "sweep": {
+            **{key: value.isoformat() if isinstance(value, datetime) else value for key, value in asdict(sweep_status).items()},
+            "queue_depth": queue_depth(),
+        },
+        "llm": {
+            "by_user": sorted(by_user.values(), key=lambda row: row["prompt_tokens"] + row["completion_tokens"], reverse=True),
+            "by_model": sorted(by_model.values(), key=lambda row: row["model"]),
+        },
+        "slowest_users": slowest,
+    }
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import User, UserPreference
+from ..telemetry import record_cache
+from .stats import add_preference_deltas, apply_stat_deltas, bump_activity, record_preference_change
+
+
+# Batch event action -> stored rating (None removes the rating). A skip is
+# stored as a thumbs down, as the single-item endpoint does.
+PREFERENCE_ACTIONS: dict[str, int | None] = {
+    "up": 1,
+    "down": -1,
+    "skip": -1,
+    "unrate": None,
+}
+
+# Users whose rated-ID sets are kept; the least recently used go first.
+RATED_IDS_CACHE_MAX_USERS = 1024
+
+# user_id -> (preference_version, rated TMDb IDs)
+_rated_ids_cache: dict[int, tuple[int, frozenset[int]]] = {}
+
+
+async def bump_preference_version(db: AsyncSession, user_id: int) -> None:
+    """
+    Mark the user's ratings as changed, in the caller's transaction.
+    """
+    await db.execute(
+        update(User).where(User.id == user_id).values(preference_version=User.preference_version + 1)
+    )
+
+
+async def preference_version(db: AsyncSession, user_id: int) -> int:
+    """
+    Current preference version, read from the row rather than the cached
+    user snapshot (which may predate the last rating).
+    """
+    stmt = select(User.preference_version).where(User.id == user_id)
+    return (await db.execute(stmt)).scalar_one_or_none() or 0
+
+
+async def rated_ids(db: AsyncSession, user_id: int, version: int) -> frozenset[int]:
+    """
+    TMDb IDs the user has rated, requested or skipped, reloaded only when
+    the preference version has moved on.
+    """
+    cached = _rated_ids_cache.pop(user_id, None)
+    if cached is not None and cached[0] == version:
+        record_cache("rated_ids", hits=1)
+        _rated_ids_cache[user_id] = cached
+        return cached[1]
+    record_cache("rated_ids", misses=1)
+
+    stmt = select(UserPreference.tmdb_id).where(UserPreference.user_id == user_id)
+    ids = frozenset(tmdb_id for tmdb_id in (await db.execute(stmt)).scalars().all() if tmdb_id is not None)
+    _rated_ids_cache[user_id] = (version, ids)
+    while len(_rated_ids_cache) > RATED_IDS_CACHE_MAX_USERS:
+        _rated_ids_cache.pop(next(iter(_rated_ids_cache)))
+    return ids
+
+
+async def _current_rating(db: AsyncSession, user_id: int, tmdb_id: int) -> int | None:
+    stmt = select(UserPreference.rating).where(
+        UserPreference.user_id == user_id,
+        UserPreference.tmdb_id == tmdb_id,
+    )
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+
+async def upsert_preference(
+    db: AsyncSession,
+    user_id: int,
+    tmdb_id: int,
+    media_type: str,
+    rating: int,
+) -> None:
+    """
+    Insert or update a user's preference for a title in one statement,
+    relying on the unique (user_id, tmdb_id) index, and keep the admin
+    counters in step. Re-sending the rating a title already has is not
+    counted as activity and leaves the preference version alone. The
+    caller commits.
+    """
+    old_rating = await _current_rating(db, user_id, tmdb_id)
+    stmt = insert(UserPreference).values(
+        user_id=user_id,
+        tmdb_id=tmdb_id,
+        media_type=media_type,
+        rating=rating,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserPreference.user_id, UserPreference.tmdb_id],
+        set_={"rating": stmt.excluded.rating, "media_type": stmt.excluded.media_type},
+    )
+    await db.execute(stmt)
+    if old_rating == rating:
+        return
+    await record_preference_change(db, user_id, old_rating, rating)
+    await bump_preference_version(db, user_id)
+
+
+async def delete_preference(db: AsyncSession, user_id: int, tmdb_id: int) -> bool:
+    """
+    Delete a user's preference for a title. Returns False if none existed.
+    The caller commits.
+    """
+    result = await db.execute(
+        delete(UserPreference)
+        .where(
+            UserPreference.user_id == user_id,
+            UserPreference.tmdb_id == tmdb_id,
+        )
+        .returning(UserPreference.rating)
+    )
+    old_rating = result.scalar_one_or_none()
+    if old_rating is None:
+        return False
+    await record_preference_change(db, user_id, old_rating, None)
+    await bump_preference_version(db, user_id)
+    return True
+
+
+async def withdraw_request(db: AsyncSession, user_id: int, tmdb_id: int) -> bool:
+    """
+    Remove a "requested" preference (rating 2) after the request could not
+    be submitted, so the title is offered again. A rating the user changed
+    in the meantime is left alone. The caller commits.
+    """
+    result = await db.execute(
+        delete(UserPreference)
+        .where(
+            UserPreference.user_id == user_id,
+            UserPreference.tmdb_id == tmdb_id,
+            UserPreference.rating == 2,
+        )
+        .returning(UserPreference.rating)
+    )
+    if result.scalar_one_or_none() is None:
+        return False
+    await record_preference_change(db, user_id, 2, None)
+    await bump_preference_version(db, user_id)
+    return True
+
+
+async def apply_preference_events(
+    db: AsyncSession,
+    user_id: int,
+    events: list[tuple[int, str, str]],
+) -> tuple[int, int]:
+    """
+    Apply many (tmdb_id, media_type, action) events in one pass: the last
+    event per title wins, current ratings are read with one SELECT, and
+    the writes are one multi-row upsert, one DELETE and one counters
+    update. The caller commits. Returns (ratings written, ratings removed).
+    """
+    final: dict[int, tuple[str, int | None]] = {}
+    for tmdb_id, media_type, action in events:
+        final[tmdb_id] = (media_type, PREFERENCE_ACTIONS[action])
+    if not final:
+        return 0, 0
+
+    stmt = select(UserPreference.tmdb_id, UserPreference.rating).where(
+        UserPreference.user_id == user_id,
+        UserPreference.tmdb_id.in_(final),
+    )
+    current = {tmdb_id: rating for tmdb_id, rating in (await db.execute(stmt)).all()}
+
+    rows = [
+        {"user_id": user_id, "tmdb_id": tmdb_id, "media_type": media_type, "rating": rating}
+        for tmdb_id, (media_type, rating) in final.items()
+        if rating is not None
+    ]
+    removed = [tmdb_id for tmdb_id, (_, rating) in final.items() if rating is None and tmdb_id in current]
+
+    if rows:
+        upsert = insert(UserPreference).values(rows)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[UserPreference.user_id, UserPreference.tmdb_id],
+            set_={"rating": upsert.excluded.rating, "media_type": upsert.excluded.media_type},
+        )
+        await db.execute(upsert)
+    if removed:
+        await db.execute(
+            delete(UserPreference).where(
+                UserPreference.user_id == user_id,
+                UserPreference.tmdb_id.in_(removed),
+            )
+        )
+
+    deltas: dict[str, int] = {}
+    for tmdb_id, (_, rating) in final.items():
+        if rating is not None or tmdb_id in current:
+            deltas = add_preference_deltas(deltas, current.get(tmdb_id), rating)
+    if deltas:
+        await apply_stat_deltas(db, user_id, deltas)
+    # Re-sending a rating the title already has is not new activity.
+    changed = sum(1 for row in rows if current.get(row["tmdb_id"]) != row["rating"])
+    await bump_activity(db, ratings=changed)
+    if changed or removed:
+        await bump_preference_version(db, user_id)
+    return len(rows), len(removed)
@@ -1,244 +1,412 @@
 from __future__ import annotations
 
+import asyncio
+from dataclasses import dataclass
 from datetime import datetime
 import json
+import time
 from typing import Any
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session
-
-from ..models import RecommendationCache, UserPreference, User
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import (
+    RecommendationRun,
+    RecommendationRunCategory,
+    RecommendationRunItem,
+    UserPreference,
+    User,
+)
+from ..telemetry import attribute_to_user, log_exception, record_generation, span
 from .ai import get_ai_provider
+from .content_filter import adult_filter, to_text
+from .events import publish_everywhere
 from .tautulli import get_user_history
 
 
-ADULT_KEYWORDS = [
-    "porn",
-    "porno",
-    "xxx",
-    "adult",
-    "erotic",
-    "erotica",
-    "hentai",
-]
-
-
-def _to_text(value: Any) -> str:
-    if isinstance(value, list):
-        return " ".join(str(v) for v in value)
-    return str(value or "")
-
-
-def _looks_adult(item: dict[str, Any]) -> bool:
+def _build_categories(lane: str, raw_categories: list[Any]) -> list[RecommendationRunCategory]:
     """
-    Best-effort heuristic to filter out explicit adult content from the
-    AI context using Tautulli fields (library name, genres, title, etc.).
+    Convert the AI's category dicts for one lane into ORM rows, dropping
+    malformed entries and non-integer IDs.
     """
-    combined = " ".join(
-        [
-            _to_text(item.get("genres")),
-            _to_text(item.get("section_name")),
-            _to_text(item.get("library_name")),
-            _to_text(item.get("title")),
-            _to_text(item.get("grandparent_title")),
-            _to_text(item.get("tagline")),
-        ]
-    ).lower()
-
-    return any(keyword in combined for keyword in ADULT_KEYWORDS)
+    categories: list[RecommendationRunCategory] = []
+    for cat in raw_categories:
+        if not isinstance(cat, dict):
+            continue
+        tmdb_ids: list[int] = []
+        for raw_id in cat.get("items", []) or []:
+            try:
+                tmdb_ids.append(int(raw_id))
+            except (TypeError, ValueError):
+                continue
+        categories.append(
+            RecommendationRunCategory(
+                lane=lane,
+                position=len(categories),
+                title=str(cat.get("title") or "Recommendations"),
+                reason=str(cat.get("reason") or ""),
+                items=[
+                    RecommendationRunItem(position=pos, tmdb_id=tmdb_id)
+                    for pos, tmdb_id in enumerate(tmdb_ids)
+                ],
+            )
+        )
+    return categories
+
+
+async def prune_runs(db: AsyncSession, user_id: int | None, keep: int) -> None:
+    """
+    Delete all but the newest `keep` runs for a user (and their categories
+    and items) so the table stays small and lookups stay cheap.
+    """
+    keep = max(keep, 1)
+    owner = RecommendationRun.user_id.is_(None) if user_id is None else RecommendationRun.user_id == user_id
+    old_runs = (
+        select(RecommendationRun.id)
+        .where(owner)
+        .order_by(RecommendationRun.created_at.desc(), RecommendationRun.id.desc())
+        .offset(keep)
+    )
+    old_run_ids = (await db.execute(old_runs)).scalars().all()
+    if not old_run_ids:
+        return
+    old_categories = select(RecommendationRunCategory.id).where(RecommendationRunCategory.run_id.in_(old_run_ids))
+    await db.execute(delete(RecommendationRunItem).where(RecommendationRunItem.category_id.in_(old_categories)))
+    await db.execute(delete(RecommendationRunCategory).where(RecommendationRunCategory.run_id.in_(old_run_ids)))
+    await db.execute(delete(RecommendationRun).where(RecommendationRun.id.in_(old_run_ids)))
 
 
-async def generate_recommendations(db: Session, user_id: int) -> RecommendationCache:
+async def generate_recommendations(db: AsyncSession, user_id: int) -> RecommendationRun:
     """
-    Orchestrate fetching history, calling AI, and storing parsed JSON.
+    Orchestrate fetching history, calling AI, and storing the parsed
+    categories as a new RecommendationRun.
     Generates both Movie and TV recommendations.
     """
-    user = db.get(User, user_id)
+    started = time.perf_counter()
+    ok = False
+    try:
+        with span("generate_recommendations", user_id=user_id), attribute_to_user(user_id):
+            run = await _generate_recommendations(db, user_id)
+        ok = True
+        # The user's stream may be connected to another worker than the
+        # one generating (e.g. the leader's nightly sweep).
+        await publish_everywhere([(user_id, "recommendations", {"run_id": run.id})])
+        return run
+    finally:
+        record_generation(user_id, time.perf_counter() - started, ok)
+
+
+async def _generate_recommendations(db: AsyncSession, user_id: int) -> RecommendationRun:
+    user = await db.get(User, user_id)
     if user is None:
         raise ValueError(f"User {user_id} not found.")
 
     # Fetch history (limit increased to get enough of both types)
-    tautulli_history: list[dict[str, Any]] = []
-    if user.tautulli_user_id:
-        try:
-            # Increased limit to 1000 to get a deeper history pool
-            tautulli_history = await get_user_history(int(user.tautulli_user_id), limit=1000)
-        except Exception:
-            # If Tautulli fetch fails, proceed with empty history to avoid blocking login.
-            tautulli_history = []
-    else:
-        # User not mapped to Tautulli (new user or Tautulli down).
-        # Proceed with empty history so AI can generate generic recommendations.
-        pass
-
-    # Strip out explicit adult content before it ever reaches the AI.
-    tautulli_history = [item for item in tautulli_history if not _looks_adult(item)]
-
-    # Build a set of normalized titles the user has already watched so we can
-    # avoid recommending exact repeats later.
-    watched_titles: set[str] = set()
-    for item in tautulli_history:
-        name = item.get("grandparent_title") or item.get("title")
-        if not name:
-            continue
-        watched_titles.add(_to_text(name).strip().lower())
-
-    # Split history by media type
-    movies_history = [item for item in tautulli_history if item.get("media_type") == "movie"]
-    tv_history = [item for item in tautulli_history if item.get("media_type") in ("show", "episode", "season")]
-
-    # Randomly sample from history to give AI variety (avoiding recency bias)
-    import random
+    with span("history_fetch", tautulli_user_id=user.tautulli_user_id) as step:
+        tautulli_history: list[dict[str, Any]] = []
+        if user.tautulli_user_id:
+            try:
+                # Increased limit to 1000 to get a deeper history pool
+                tautulli_history = await get_user_history(int(user.tautulli_user_id), limit=1000)
+            except Exception:
+                # If Tautulli fetch fails, proceed with empty history to avoid blocking login.
+                tautulli_history = []
+        else:
+            # User not mapped to Tautulli (new user or Tautulli down).
+            # Proceed with empty history so AI can generate generic recommendations.
+            pass
+        step.set(items=len(tautulli_history))
+
+    with span("filter") as step:
+        # Strip out explicit adult content before it ever reaches the AI.
+        tautulli_history = await adult_filter.filter_history(tautulli_history)
+
+        # Build a set of normalized titles the user has already watched so we can
+        # avoid recommending exact repeats later.
+        watched_titles: set[str] = set()
+        for item in tautulli_history:
+            name = item.get("grandparent_title") or item.get("title")
+            if not name:
+                continue
+            watched_titles.add(to_text(name).strip().lower())
+
+        # Split history by media type
+        movies_history = [item for item in tautulli_history if item.get("media_type") == "movie"]
+        tv_history = [item for item in tautulli_history if item.get("media_type") in ("show", "episode", "season")]
+
+        # Randomly sample from history to give AI variety (avoiding recency bias)
+        import random
     
-    # Sample 50 random movies (if available)
-    sampled_movies = random.sample(movies_history, min(len(movies_history), 50))
+        # Sample 50 random movies (if available)
+        sampled_movies = random.sample(movies_history, min(len(movies_history), 50))
     
-    # Sample 20 random TV items (if available)
-    sampled_tv = random.sample(tv_history, min(len(tv_history), 20))
-
-    # Prepare context slices
-    # We use the sampled lists instead of just the top/recent slices
-    top_movies = sampled_movies
-    recent_movies = movies_history[:10] # Keep a few actual recent ones for context
-
-    top_tv = sampled_tv
-    recent_tv = tv_history[:10]
-
-    # Derive a compact list of unique series titles (max 10) from TV history.
-    series_titles: list[str] = []
-    seen_series: set[str] = set()
-    for item in tv_history:
-        # Tautulli typically uses grandparent_title for series name on episodes.
-        name = item.get("grandparent_title") or item.get("title")
-        if not name:
-            continue
-        if name in seen_series:
-            continue
-        seen_series.add(name)
-        series_titles.append(name)
-        if len(series_titles) >= 15: # Increased to 15 for more variety
-            break
-
-    # Heuristic: collect up to 10 documentary items from history based on
-    # genres or library/section naming (best-effort signal for the AI).
-    documentaries: list[dict[str, Any]] = []
-    for item in tautulli_history:
-        genres = (item.get("genres") or "").lower()
-        section = (item.get("section_name") or item.get("library_name") or "").lower()
-        if "documentary" in genres or "documentary" in section:
-            documentaries.append(item)
-            if len(documentaries) >= 10:
+        # Sample 20 random TV items (if available)
+        sampled_tv = random.sample(tv_history, min(len(tv_history), 20))
+
+        # Prepare context slices
+        # We use the sampled lists instead of just the top/recent slices
+        top_movies = sampled_movies
+        recent_movies = movies_history[:10] # Keep a few actual recent ones for context
+
+        top_tv = sampled_tv
+        recent_tv = tv_history[:10]
+
+        # Derive a compact list of unique series titles (max 10) from TV history.
+        series_titles: list[str] = []
+        seen_series: set[str] = set()
+        for item in tv_history:
+            # Tautulli typically uses grandparent_title for series name on episodes.
+            name = item.get("grandparent_title") or item.get("title")
+            if not name:
+                continue
+            if name in seen_series:
+                continue
+            seen_series.add(name)
+            series_titles.append(name)
+            if len(series_titles) >= 15: # Increased to 15 for more variety
                 break
 
-    # Fetch explicit likes and dislikes from UserPreference
-    likes_stmt = (
-        select(UserPreference)
-        .where(UserPreference.user_id == user_id)
-        .where(UserPreference.rating == 1)
-    )
-    likes_rows = db.execute(likes_stmt).scalars().all()
-    likes = [{"tmdb_id": row.tmdb_id, "media_type": row.media_type} for row in likes_rows]
+        # Heuristic: collect up to 10 documentary items from history based on
+        # genres or library/section naming (best-effort signal for the AI).
+        documentaries: list[dict[str, Any]] = []
+        for item in tautulli_history:
+            genres = (item.get("genres") or "").lower()
+            section = (item.get("section_name") or item.get("library_name") or "").lower()
+            if "documentary" in genres or "documentary" in section:
+                documentaries.append(item)
+                if len(documentaries) >= 10:
+                    break
+        step.set(
+            history=len(tautulli_history),
+            movies=len(movies_history),
+            tv=len(tv_history),
+            documentaries=len(documentaries),
+        )
+
+    # Fetch explicit likes/dislikes and every rated ID in a single pass over
+    # the user's (user_id, tmdb_id) index range.
+    with span("preferences_fetch") as step:
+        prefs_stmt = select(UserPreference.tmdb_id, UserPreference.media_type, UserPreference.rating).where(
+            UserPreference.user_id == user_id
+        )
+        likes: list[dict[str, Any]] = []
+        dislikes: list[dict[str, Any]] = []
+        # Any item that has been rated (up/down/seen) in Sagarr should no longer be
+        # re-suggested. We treat all UserPreference rows as "already seen here".
+        rated_ids: set[int] = set()
+        for tmdb_id, media_type, rating in (await db.execute(prefs_stmt)).all():
+            if tmdb_id is None:
+                continue
+            rated_ids.add(tmdb_id)
+            if rating == 1:
+                likes.append({"tmdb_id": tmdb_id, "media_type": media_type})
+            elif rating == -1:
+                dislikes.append({"tmdb_id": tmdb_id, "media_type": media_type})
+        step.set(rated=len(rated_ids), likes=len(likes), dislikes=len(dislikes))
+
+    with span("prompt_build") as step:
+        user_context: dict[str, Any] = {
+            "movies": {
+                "top": top_movies,
+                "recent": recent_movies,
+            },
+            "tv": {
+                "top": top_tv,
+                "recent": recent_tv,
+                "series_titles": series_titles,
+            },
+            "documentaries": {
+                "sample": documentaries,
+            },
+            "likes": likes,
+            "dislikes": dislikes,
+            "watched_titles": sorted(watched_titles),
+            "rated_tmdb_ids": sorted(rated_ids),
+        }
+
+        system_prompt = (
+            "You are an AI that creates creative, descriptive recommendation categories "
+            "for a single user based on their Plex/Tautulli watch history and explicit likes/dislikes. "
+            "Never recommend explicit pornography or adult-only content. "
+            "You must generate recommendations for Movies, TV Series, AND Documentaries. "
+            "Respond ONLY with valid JSON in the following shape: "
+            '{"movies": [{"title": "...", "reason": "...", "items": [123]}], '
+            '"tv": [{"title": "...", "reason": "...", "items": [456]}], '
+            '"documentaries": [{"title": "...", "reason": "...", "items": [789]}]}. '
+            "Each item in 'items' must be an integer TMDb ID. "
+            "Ensure 'items' contains valid TMDb IDs for the respective media type."
+        )
+
+        prompt = (
+            "Here is the user's viewing context as JSON.\n\n"
+            f"{json.dumps(user_context, ensure_ascii=False)}\n\n"
+            "Using this data, generate a LARGE volume of recommendations to create an endless feed experience.\n"
+            "- Generate at least 10-15 distinct categories for 'movies'.\n"
+            "- Generate at least 10-15 distinct categories for 'tv'.\n"
+            "- Generate at least 5-8 distinct categories for 'documentaries'.\n"
+            "- Each category should contain 5-10 items.\n"
+            "IMPORTANT: Even if the user has NO documentary history, you MUST generate 5-8 categories of popular, high-quality documentaries (e.g., Nature, True Crime, Science, History). Do not return an empty list for documentaries.\n"
+            "Be specific and niche with your categories (e.g., 'Cyberpunk Thrillers', 'Slow-Burn Sci-Fi', '80s Action Classics'). "
+        )
+
+        # Apply user settings
+        settings = {}
+        if user.settings:
+            try:
+                settings = json.loads(user.settings)
+            except json.JSONDecodeError:
+                pass
+    
+        date_cutoff = settings.get("date_cutoff")
+        if date_cutoff:
+            prompt += f"\nCRITICAL: The user has requested to ONLY see content released AFTER the year {date_cutoff}. Do NOT recommend anything older than {date_cutoff}.\n"
 
-    dislikes_stmt = (
-        select(UserPreference)
-        .where(UserPreference.user_id == user_id)
-        .where(UserPreference.rating == -1)
-    )
-    dislikes_rows = db.execute(dislikes_stmt).scalars().all()
-    dislikes = [{"tmdb_id": row.tmdb_id, "media_type": row.media_type} for row in dislikes_rows]
-
-    # Any item that has been rated (up/down/seen) in Sagarr should no longer be
-    # re-suggested. We treat all UserPreference rows as "already seen here".
-    rated_stmt = select(UserPreference.tmdb_id).where(UserPreference.user_id == user_id)
-    rated_ids = {tmdb_id for tmdb_id in db.execute(rated_stmt).scalars().all() if tmdb_id is not None}
-
-    user_context: dict[str, Any] = {
-        "movies": {
-            "top": top_movies,
-            "recent": recent_movies,
-        },
-        "tv": {
-            "top": top_tv,
-            "recent": recent_tv,
-            "series_titles": series_titles,
-        },
-        "documentaries": {
-            "sample": documentaries,
-        },
-        "likes": likes,
-        "dislikes": dislikes,
-        "watched_titles": sorted(watched_titles),
-        "rated_tmdb_ids": sorted(rated_ids),
-    }
-
-    system_prompt = (
-        "You are an AI that creates creative, descriptive recommendation categories "
-        "for a single user based on their Plex/Tautulli watch history and explicit likes/dislikes. "
-        "Never recommend explicit pornography or adult-only content. "
-        "You must generate recommendations for Movies, TV Series, AND Documentaries. "
-        "Respond ONLY with valid JSON in the following shape: "
-        '{"movies": [{"title": "...", "reason": "...", "items": [123]}], '
-        '"tv": [{"title": "...", "reason": "...", "items": [456]}], '
-        '"documentaries": [{"title": "...", "reason": "...", "items": [789]}]}. '
-        "Each item in 'items' must be an integer TMDb ID. "
-        "Ensure 'items' contains valid TMDb IDs for the respective media type."
-    )
+        prompt += "Remember: respond only with JSON and no extra commentary."
+        step.set(prompt_chars=len(prompt))
 
-    prompt = (
-        "Here is the user's viewing context as JSON.\n\n"
-        f"{json.dumps(user_context, ensure_ascii=False)}\n\n"
-        "Using this data, generate a LARGE volume of recommendations to create an endless feed experience.\n"
-        "- Generate at least 10-15 distinct categories for 'movies'.\n"
-        "- Generate at least 10-15 distinct categories for 'tv'.\n"
-        "- Generate at least 5-8 distinct categories for 'documentaries'.\n"
-        "- Each category should contain 5-10 items.\n"
-        "IMPORTANT: Even if the user has NO documentary history, you MUST generate 5-8 categories of popular, high-quality documentaries (e.g., Nature, True Crime, Science, History). Do not return an empty list for documentaries.\n"
-        "Be specific and niche with your categories (e.g., 'Cyberpunk Thrillers', 'Slow-Burn Sci-Fi', '80s Action Classics'). "
-    )
+    provider = get_ai_provider()
+    with span("llm_call", provider=provider.name) as step:
+        raw_text = await provider.generate(prompt=prompt, system_prompt=system_prompt)
+        step.set(response_chars=len(raw_text or ""))
 
-    # Apply user settings
-    settings = {}
-    if user.settings:
+    with span("parse") as step:
         try:
-            settings = json.loads(user.settings)
+            parsed: dict[str, Any] = json.loads(raw_text or "{}")
         except json.JSONDecodeError:
-            pass
+            parsed = {}
+
+        # Normalize structure
+        movies_cats = parsed.get("movies", []) or []
+        tv_cats = parsed.get("tv", []) or []
+        docs_cats = parsed.get("documentaries", []) or []
     
-    date_cutoff = settings.get("date_cutoff")
-    if date_cutoff:
-        prompt += f"\nCRITICAL: The user has requested to ONLY see content released AFTER the year {date_cutoff}. Do NOT recommend anything older than {date_cutoff}.\n"
+        # Fallback for old single-list format if AI hallucinates
+        if "categories" in parsed and not movies_cats and not tv_cats:
+            movies_cats = parsed["categories"]
+
+        run = RecommendationRun(
+            user_id=user_id,
+            created_at=datetime.utcnow(),
+            watched_titles=json.dumps(sorted(watched_titles)),
+        )
+        run.categories = (
+            _build_categories("movies", movies_cats)
+            + _build_categories("tv", tv_cats)
+            + _build_categories("documentaries", docs_cats)
+        )
+        step.set(categories=len(run.categories), items=sum(len(c.items) for c in run.categories))
+    with span("db_write"):
+        db.add(run)
+        await db.flush()
+        await prune_runs(db, user_id, get_settings().RECOMMENDATION_RUNS_RETAINED)
+        await db.commit()
+    return run
+
+
+# user_id -> in-flight background generation, so a user never has two
+# generations running at once.
+_generation_tasks: dict[int, asyncio.Task] = {}
+
+
+def pending_generation(user_id: int) -> asyncio.Task | None:
+    task = _generation_tasks.get(user_id)
+    return task if task is not None and not task.done() else None
+
+
+def schedule_generation(user_id: int) -> asyncio.Task:
+    """
+    Generate recommendations for a user in the background with its own
+    session, reusing the in-flight task if one is already running.
+    """
+    task = pending_generation(user_id)
+    if task is not None:
+        return task
 
-    prompt += "Remember: respond only with JSON and no extra commentary."
+    task = asyncio.create_task(_generate_in_background(user_id))
+    _generation_tasks[user_id] = task
 
-    provider = get_ai_provider()
-    raw_text = await provider.generate(prompt=prompt, system_prompt=system_prompt)
+    def _forget(done: asyncio.Task) -> None:
+        if _generation_tasks.get(user_id) is done:
+            del _generation_tasks[user_id]
+        # Already logged; callers that await the task get the exception.
+        if not done.cancelled():
+            done.exception()
 
-    try:
-        parsed: dict[str, Any] = json.loads(raw_text or "{}")
-    except json.JSONDecodeError:
-        parsed = {}
-
-    # Normalize structure
-    movies_cats = parsed.get("movies", []) or []
-    tv_cats = parsed.get("tv", []) or []
-    docs_cats = parsed.get("documentaries", []) or []
-    
-    # Fallback for old single-list format if AI hallucinates
-    if "categories" in parsed and not movies_cats and not tv_cats:
-        movies_cats = parsed["categories"]
-
-    payload = {
-        "movies": movies_cats,
-        "tv": tv_cats,
-        "documentaries": docs_cats
-    }
-
-    cache = RecommendationCache(
-        user_id=user_id,
-        recommendations=json.dumps(payload),
-        created_at=datetime.utcnow(),
-    )
-    db.add(cache)
-    db.commit()
-    db.refresh(cache)
-    return cache
+    task.add_done_callback(_forget)
+    return task
+
+
+async def _generate_in_background(user_id: int) -> int:
+    """
+    Generate and return the new run's ID. Failures are logged and re-raised
+    for whoever awaits the task.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            run = await generate_recommendations(db, user_id)
+            return run.id
+        except Exception:
+            await db.rollback()
+            log_exception("background_generation", "Error generating recommendations", user_id=user_id)
+            raise
+
+
+@dataclass
+class SweepStatus:
+    """
+    Progress of the nightly refresh of every user's recommendations.
+    """
+    running: bool = False
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    duration_seconds: float | None = None
+    users_total: int = 0
+    users_done: int = 0
+    failures: int = 0
+
+
+sweep_status = SweepStatus()
+
+
+def queue_depth() -> int:
+    """
+    Generations waiting or in progress: background tasks plus users the
+    running sweep has not reached yet.
+    """
+    depth = sum(1 for task in _generation_tasks.values() if not task.done())
+    if sweep_status.running:
+        depth += sweep_status.users_total - sweep_status.users_done
+    return depth
+
+
+async def refresh_all_recommendations() -> SweepStatus:
+    """
+    Regenerate recommendations for every user in turn, recording progress
+    and duration in `sweep_status`.
+    """
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        user_ids = (await db.execute(select(User.id))).scalars().all()
+        sweep_status.running = True
+        sweep_status.started_at = datetime.utcnow()
+        sweep_status.users_total = len(user_ids)
+        sweep_status.users_done = 0
+        sweep_status.failures = 0
+        try:
+            with span("nightly_sweep", users=len(user_ids)) as step:
+                for user_id in user_ids:
+                    try:
+                        await generate_recommendations(db, user_id)
+                    except Exception:
+                        await db.rollback()
+                        sweep_status.failures += 1
+                        log_exception("nightly_sweep", "Error refreshing recommendations", user_id=user_id)
+                    sweep_status.users_done += 1
+                step.set(failures=sweep_status.failures)
+        finally:
+            sweep_status.running = False
+            sweep_status.finished_at = datetime.utcnow()
+            sweep_status.duration_seconds = time.perf_counter() - started
+    return sweep_status
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import AsyncSessionLocal
+from ..models import MediaRequestOutbox
+from ..telemetry import log_event, log_exception
+from .events import publish_everywhere
+from .overseerr import availability_status, overseerr_service
+from .preferences import withdraw_request
+
+
+# Due requests claimed per pass, and how many titles are submitted to
+# Overseerr at once while working through a batch.
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_CONCURRENCY = 4
+# Retry schedule for timeouts, connection errors, 429 and 5xx responses:
+# exponential from the base delay, capped, with jitter.
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_BASE_SECONDS = 15
+OUTBOX_BACKOFF_MAX_SECONDS = 30 * 60
+# How long a claimed batch is left to the worker that claimed it before
+# other workers may pick it up again.
+OUTBOX_CLAIM_TIMEOUT = timedelta(minutes=5)
+# How often the scheduler leader looks for retries that became due and
+# for requests queued by a worker that stopped before submitting them.
+OUTBOX_POLL_SECONDS = 30
+# Finished rows are kept this long (for the admin view), then deleted.
+OUTBOX_RETENTION = timedelta(days=30)
+
+_wakeup = asyncio.Event()
+_lock = asyncio.Lock()
+
+
+async def enqueue_request(db: AsyncSession, user_id: int, tmdb_id: int, media_type: str) -> None:
+    """
+    Add a request to the outbox. Repeating a request that is still pending
+    changes nothing; repeating a finished one queues it again (the worker
+    skips it if Overseerr already has it). The caller commits and then
+    calls `notify_outbox()`.
+    """
+    now = datetime.utcnow()
+    stmt = insert(MediaRequestOutbox).values(
+        user_id=user_id,
+        tmdb_id=tmdb_id,
+        media_type=media_type,
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MediaRequestOutbox.user_id, MediaRequestOutbox.tmdb_id, MediaRequestOutbox.media_type],
+        set_={
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "last_error": None,
+            "created_at": now,
+            "submitted_at": None,
+        },
+        where=MediaRequestOutbox.status != "pending",
+    )
+    await db.execute(stmt)
+
+
+def notify_outbox() -> None:
+    """
+    Wake this worker's outbox loop so a request it just queued is
+    submitted right away, whichever worker holds the scheduler lease.
+    """
+    _wakeup.set()
+
+
+async def wait_for_outbox() -> None:
+    await _wakeup.wait()
+    _wakeup.clear()
+
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+async def _submit(tmdb_id: int, media_type: str) -> tuple[str, str | None]:
+    """
+    Submit one title unless Overseerr already has it. Returns the outcome
+    ("submitted", "skipped", "retry" or "failed") and an error message.
+    """
+    status = availability_status(await overseerr_service.check_availability(tmdb_id, media_type))
+    if status in ("available", "requested"):
+        return "skipped", None
+    try:
+        await overseerr_service.submit_request(tmdb_id, media_type)
+        return "submitted", None
+    except httpx.HTTPStatusError as e:
+        code = e.response.status_code
+        if 400 <= code < 500 and code not in (408, 429):
+            return "failed", f"HTTP {code}: {e.response.text[:200]}"
+        return "retry", f"HTTP {code}"
+    except httpx.HTTPError as e:
+        return "retry", str(e) or type(e).__name__
+
+
+async def process_outbox() -> int:
+    """
+    Submit due requests in batches until none are left. Requests for the
+    same title from several users are submitted once. Safe to run in
+    several worker processes: each batch is claimed by one of them. Returns the number
+    of outbox rows handled.
+    """
+    if not overseerr_service.configured:
+        return 0
+    handled = 0
+    async with _lock:
+        while True:
+            now = datetime.utcnow()
+            async with AsyncSessionLocal() as db:
+                # Claim the batch by pushing its due time out, in one
+                # statement, so other workers skip these rows; if this
+                # worker dies they become due again after the claim expires.
+                due = (
+                    select(MediaRequestOutbox.id)
+                    .where(MediaRequestOutbox.status == "pending", MediaRequestOutbox.next_attempt_at <= now)
+                    .order_by(MediaRequestOutbox.next_attempt_at, MediaRequestOutbox.id)
+                    .limit(OUTBOX_BATCH_SIZE)
+                )
+                stmt = (
+                    update(MediaRequestOutbox)
+                    .where(
+                        MediaRequestOutbox.id.in_(due.scalar_subquery()),
+                        MediaRequestOutbox.status == "pending",
+                        MediaRequestOutbox.next_attempt_at <= now,
+                    )
+                    .values(next_attempt_at=now + OUTBOX_CLAIM_TIMEOUT)
+                    .returning(MediaRequestOutbox)
+                )
+                rows = (await db.execute(stmt)).scalars().all()
+                await db.commit()
+            if not rows:
+                break
+
+            # No transaction is held while Overseerr is being called.
+            by_title: dict[tuple[int, str], list[MediaRequestOutbox]] = defaultdict(list)
+            for row in rows:
+                by_title[(row.tmdb_id, row.media_type)].append(row)
+            semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+
+            async def submit(title: tuple[int, str]) -> tuple[str, str | None]:
+                async with semaphore:
+                    try:
+                        return await _submit(*title)
+                    except Exception as e:
+                        # Counted as an attempt like any other failure, so
+                        # a title that always raises still reaches the cap.
+                        log_exception(
+                            "request_outbox",
+                            "Unexpected error submitting media request",
+                            tmdb_id=title[0],
+                            media_type=title[1],
+                        )
+                        return "retry", f"{type(e).__name__}: {e}"
+
+            outcomes = dict(zip(by_title, await asyncio.gather(*(submit(title) for title in by_title))))
+
+            finished_at = datetime.utcnow()
+            notices: list[tuple[MediaRequestOutbox, str]] = []
+            async with AsyncSessionLocal() as db:
+                for title, (outcome, error) in outcomes.items():
+                    for row in by_title[title]:
+                        values: dict = {"attempts": row.attempts + 1, "last_error": error}
+                        if outcome == "retry" and row.attempts + 1 < OUTBOX_MAX_ATTEMPTS:
+                            values["next_attempt_at"] = finished_at + _backoff(row.attempts + 1)
+                        elif outcome == "retry":
+                            values["status"] = "failed"
+                        else:
+                            values["status"] = outcome
+                            if outcome != "failed":
+                                values["submitted_at"] = finished_at
+                        result = await db.execute(
+                            update(MediaRequestOutbox).where(MediaRequestOutbox.id == row.id).values(**values)
+                        )
+                        if result.rowcount and "status" in values:
+                            notices.append((row, values["status"]))
+                            if values["status"] == "failed":
+                                # Undo the "requested" preference written
+                                # with the request, in the same transaction.
+                                await withdraw_request(db, row.user_id, row.tmdb_id)
+                await db.execute(
+                    delete(MediaRequestOutbox).where(
+                        MediaRequestOutbox.status != "pending",
+                        MediaRequestOutbox.created_at < finished_at - OUTBOX_RETENTION,
+                    )
+                )
+                await db.commit()
+
+            events = []
+            for row, status in notices:
+                if status == "failed":
+                    error = outcomes[(row.tmdb_id, row.media_type)][1]
+                    log_event(
+                        "request_outbox",
+                        "Giving up on Overseerr request",
+                        logging.WARNING,
+                        tmdb_id=row.tmdb_id,
+                        media_type=row.media_type,
+                        error=error,
+                    )
+                # A failed request shows the Request button again. The
+                # user's stream may be connected to another worker.
+                data = {
+                    "tmdb_id": row.tmdb_id,
+                    "media_type": row.media_type,
+                    "status": "missing" if status == "failed" else "requested",
+                }
+                events.append((row.user_id, "request", data))
+            await publish_everywhere(events)
+            handled += len(rows)
+            if len(rows) < OUTBOX_BATCH_SIZE:
+                break
+    return handled
+
+
+async def outbox_counts(db: AsyncSession) -> dict[str, int]:
+    """
+    Number of outbox rows per status.
+    """
+    stmt = select(MediaRequestOutbox.status, func.count()).group_by(MediaRequestOutbox.status)
+    return {status: count for status, count in (await db.execute(stmt)).all()}
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import case, desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import (
+    MediaMetadata,
+    RecommendationRun,
+    RecommendationRunCategory,
+    RecommendationRunItem,
+    UserPreference,
+)
+from .recommendations import prune_runs
+from .tautulli import tautulli_service
+
+
+# The seed feed is rebuilt in the background once it is older than this.
+SEED_FEED_MAX_AGE = timedelta(hours=6)
+SEED_ITEMS_PER_CATEGORY = 10
+SEED_GENRE_CATEGORIES = 6
+# A genre row needs at least this many titles to be worth showing.
+SEED_MIN_CATEGORY_ITEMS = 3
+DOCUMENTARY_GENRE_ID = 99
+
+# Score weights for the server-wide popularity signal.
+PREFERENCE_WEIGHTS = {1: 3, 2: 2, -1: -2}
+RECOMMENDED_WEIGHT = 1
+TAUTULLI_PLAY_WEIGHT = 3
+
+Key = tuple[int, str]
+
+
+async def _preference_scores(db: AsyncSession, scores: dict[Key, float]) -> None:
+    # Likes and requests across every user, minus dislikes.
+    weight = case(
+        *((UserPreference.rating == rating, value) for rating, value in PREFERENCE_WEIGHTS.items()),
+        else_=0,
+    )
+    stmt = (
+        select(UserPreference.tmdb_id, UserPreference.media_type, func.sum(weight))
+        .where(UserPreference.tmdb_id.is_not(None))
+        .group_by(UserPreference.tmdb_id, UserPreference.media_type)
+    )
+    for tmdb_id, media_type, score in (await db.execute(stmt)).all():
+        scores[(tmdb_id, media_type or "movie")] += score or 0
+
+
+async def _recommended_scores(db: AsyncSession, scores: dict[Key, float]) -> None:
+    # Titles the AI keeps suggesting to different users on this server.
+    media_type = case((RecommendationRunCategory.lane == "tv", "tv"), else_="movie")
+    stmt = (
+        select(RecommendationRunItem.tmdb_id, media_type, func.count(func.distinct(RecommendationRun.user_id)))
+        .join(RecommendationRunCategory, RecommendationRunItem.category_id == RecommendationRunCategory.id)
+        .join(RecommendationRun, RecommendationRunCategory.run_id == RecommendationRun.id)
+        .where(RecommendationRun.user_id.is_not(None))
+        .group_by(RecommendationRunItem.tmdb_id, media_type)
+    )
+    for tmdb_id, kind, users in (await db.execute(stmt)).all():
+        scores[(tmdb_id, kind)] += RECOMMENDED_WEIGHT * users
+
+
+async def _tautulli_scores(db: AsyncSession, scores: dict[Key, float]) -> None:
+    # Tautulli reports titles, not TMDb IDs; match them against the
+    # metadata cache.
+    for stat_id, media_type in (("popular_movies", "movie"), ("popular_tv", "tv")):
+        rows = await tautulli_service.get_home_stats(stat_id)
+        watched: dict[str, int] = {}
+        for row in rows:
+            title = (row.get("title") or row.get("grandparent_title") or "").strip().lower()
+            if title:
+                watched[title] = max(int(row.get("users_watched") or 1), 1)
+        if not watched:
+            continue
+        stmt = select(MediaMetadata.tmdb_id, MediaMetadata.title).where(
+            MediaMetadata.media_type == media_type,
+            func.lower(MediaMetadata.title).in_(list(watched)),
+        )
+        for tmdb_id, title in (await db.execute(stmt)).all():
+            scores[(tmdb_id, media_type)] += TAUTULLI_PLAY_WEIGHT * watched[title.lower()]
+
+
+def _genres(row: MediaMetadata | None) -> list[dict[str, Any]]:
+    if row is None:
+        return []
+    try:
+        genres = json.loads(row.genres or "[]")
+    except json.JSONDecodeError:
+        return []
+    return [g for g in genres if isinstance(g, dict)]
+
+
+def _category(lane: str, position: int, title: str, reason: str, tmdb_ids: list[int]) -> RecommendationRunCategory:
+    return RecommendationRunCategory(
+        lane=lane,
+        position=position,
+        title=title,
+        reason=reason,
+        items=[
+            RecommendationRunItem(position=pos, tmdb_id=tmdb_id)
+            for pos, tmdb_id in enumerate(tmdb_ids[:SEED_ITEMS_PER_CATEGORY])
+        ],
+    )
+
+
+def _lane_categories(
+    lane: str,
+    ranked: list[int],
+    metadata: dict[int, MediaMetadata],
+) -> list[RecommendationRunCategory]:
+    """
+    One "popular" row followed by genre clusters, each ordered by score.
+    """
+    categories: list[RecommendationRunCategory] = []
+    if not ranked:
+        return categories
+    categories.append(
+        _category(lane, 0, "Popular on this server", "Most watched, liked and requested by other viewers here.", ranked)
+    )
+
+    by_genre: dict[int, list[int]] = defaultdict(list)
+    genre_names: dict[int, str] = {}
+    for tmdb_id in ranked:
+        for genre in _genres(metadata.get(tmdb_id)):
+            gid = genre.get("id")
+            if not isinstance(gid, int) or gid == DOCUMENTARY_GENRE_ID:
+                continue
+            by_genre[gid].append(tmdb_id)
+            genre_names[gid] = str(genre.get("name") or "")
+
+    clusters = sorted(
+        (gid for gid, ids in by_genre.items() if len(ids) >= SEED_MIN_CATEGORY_ITEMS and genre_names[gid]),
+        key=lambda gid: len(by_genre[gid]),
+        reverse=True,
+    )
+    for gid in clusters[:SEED_GENRE_CATEGORIES]:
+        categories.append(
+            _category(
+                lane,
+                len(categories),
+                f"Popular {genre_names[gid]}",
+                f"{genre_names[gid]} titles viewers on this server keep coming back to.",
+                by_genre[gid],
+            )
+        )
+    return categories
+
+
+async def build_seed_feed(db: AsyncSession) -> RecommendationRun | None:
+    """
+    Build the server-wide seed feed (a RecommendationRun without a user)
+    from aggregate Tautulli plays, local likes/requests and past
+    recommendations, clustered by the genres in the metadata cache.
+    Returns None when there is nothing to seed from yet.
+    """
+    scores: dict[Key, float] = defaultdict(float)
+    await _preference_scores(db, scores)
+    await _recommended_scores(db, scores)
+    await _tautulli_scores(db, scores)
+
+    candidates = [key for key, score in scores.items() if score > 0]
+    if not candidates:
+        return None
+
+    metadata: dict[Key, MediaMetadata] = {}
+    stmt = select(MediaMetadata).where(MediaMetadata.tmdb_id.in_({tmdb_id for tmdb_id, _ in candidates}))
+    for row in (await db.execute(stmt)).scalars().all():
+        metadata[(row.tmdb_id, row.media_type)] = row
+
+    ranked = sorted(candidates, key=lambda key: scores[key], reverse=True)
+    lanes: dict[str, list[int]] = {"movies": [], "tv": [], "documentaries": []}
+    for key in ranked:
+        row = metadata.get(key)
+        if row is not None and row.adult:
+            continue
+        tmdb_id, media_type = key
+        if media_type == "tv":
+            lanes["tv"].append(tmdb_id)
+        elif any(g.get("id") == DOCUMENTARY_GENRE_ID for g in _genres(row)):
+            lanes["documentaries"].append(tmdb_id)
+        else:
+            lanes["movies"].append(tmdb_id)
+
+    movie_meta = {tmdb_id: row for (tmdb_id, media_type), row in metadata.items() if media_type == "movie"}
+    tv_meta = {tmdb_id: row for (tmdb_id, media_type), row in metadata.items() if media_type == "tv"}
+
+    run = RecommendationRun(user_id=None, created_at=datetime.utcnow())
+    run.categories = _lane_categories("movies", lanes["movies"], movie_meta) + _lane_categories(
+        "tv", lanes["tv"], tv_meta
+    )
+    if lanes["documentaries"]:
+        run.categories.append(
+            _category(
+                "documentaries",
+                0,
+                "Popular documentaries",
+                "Documentaries viewers on this server enjoyed.",
+                lanes["documentaries"],
+            )
+        )
+    db.add(run)
+    await db.flush()
+    # Keep the previous seed too, so cursors into it stay valid briefly.
+    await prune_runs(db, None, keep=2)
+    await db.commit()
+    return run
+
+
+async def get_seed_run(db: AsyncSession) -> RecommendationRun | None:
+    """
+    The newest seed feed, or None until the leader has built one. Requests
+    only read it; building scans every user's ratings and runs.
+    """
+    stmt = (
+        select(RecommendationRun)
+        .where(RecommendationRun.user_id.is_(None))
+        .order_by(desc(RecommendationRun.created_at), desc(RecommendationRun.id))
+        .limit(1)
+    )
+    return (await db.execute(stmt)).scalars().first()
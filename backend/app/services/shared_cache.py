@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from ..database import AsyncSessionLocal
+from ..models import SharedCacheEntry
+from ..telemetry import record_cache
+
+
+async def get_shared(key: str) -> Any | None:
+    """
+    Cached JSON value for `key`, or None if missing or expired.
+    """
+    stmt = select(SharedCacheEntry.value).where(
+        SharedCacheEntry.key == key, SharedCacheEntry.expires_at > datetime.utcnow()
+    )
+    async with AsyncSessionLocal() as db:
+        raw = (await db.execute(stmt)).scalar_one_or_none()
+    record_cache("shared", hits=int(raw is not None), misses=int(raw is None))
+    return json.loads(raw) if raw is not None else None
+
+
+async def put_shared(key: str, value: Any, ttl: timedelta) -> None:
+    """
+    Store a JSON-serializable value for all workers until `ttl` has passed,
+    dropping other expired entries on the way.
+    """
+    now = datetime.utcnow()
+    stmt = insert(SharedCacheEntry).values(key=key, value=json.dumps(value), expires_at=now + ttl)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SharedCacheEntry.key],
+        set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+    )
+    async with AsyncSessionLocal() as db:
+        await db.execute(stmt)
+        await db.execute(delete(SharedCacheEntry).where(SharedCacheEntry.expires_at <= now))
+        await db.commit()
+
+
+async def pop_shared(key: str) -> Any | None:
+    """
+    Remove and return a live entry in one statement, so it is handed out
+    at most once across all workers (e.g. single-use tickets).
+    """
+    stmt = (
+        delete(SharedCacheEntry)
+        .where(SharedCacheEntry.key == key, SharedCacheEntry.expires_at > datetime.utcnow())
+        .returning(SharedCacheEntry.value)
+    )
+    async with AsyncSessionLocal() as db:
+        raw = (await db.execute(stmt)).scalar_one_or_none()
+        await db.commit()
+    return json.loads(raw) if raw is not None else None
+
+
+async def scan_shared(prefix: str) -> dict[str, Any]:
+    """
+    All live entries whose key starts with `prefix`, e.g. one per worker.
+    """
+    stmt = select(SharedCacheEntry.key, SharedCacheEntry.value).where(
+        SharedCacheEntry.key.startswith(prefix, autoescape=True), SharedCacheEntry.expires_at > datetime.utcnow()
+    )
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(stmt)).all()
+    return {key: json.loads(raw) for key, raw in rows}
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, TypeVar
+
+from ..telemetry import registry
+
+
+T = TypeVar("T")
+
+coalesced_calls = registry.counter(
+    "sagarr_singleflight_calls_total",
+    "Upstream calls by single-flight group; result is 'leader' (made the call) or 'coalesced' (shared it).",
+)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls: while a call for a key is in
+    flight, later callers with the same key await its result (or exception)
+    instead of starting another one. Nothing is cached once it completes.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        _groups.append(self)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            coalesced_calls.inc(group=self.name, result="leader")
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+            coalesced_calls.inc(group=self.name, result="coalesced")
+        # A caller that is cancelled must not cancel the call for the others.
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, done: asyncio.Task) -> None:
+        if self._in_flight.get(key) is done:
+            del self._in_flight[key]
+        if not done.cancelled():
+            # Mark the exception retrieved even if every caller went away.
+            done.exception()
+
+    def stats(self) -> dict[str, Any]:
+        total = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else None,
+        }
+
+
+_groups: list[SingleFlight] = []
+
+
+def single_flight_stats() -> dict[str, dict[str, Any]]:
+    return {group.name: group.stats() for group in _groups}
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import ActivityDaily, User, UserStats
+
+
+# UserPreference.rating -> UserStats counter column
+RATING_COLUMNS: dict[int, str] = {
+    1: "likes",
+    -1: "dislikes",
+    0: "seen",
+    2: "requested",
+}
+
+
+async def record_preference_change(
+    db: AsyncSession,
+    user_id: int,
+    old_rating: int | None,
+    new_rating: int | None,
+) -> None:
+    """
+    Adjust the user's counters (and today's activity bucket) for a single
+    preference write. `None` means "no row" (insert / delete). Runs in the
+    caller's transaction so counters never drift from user_preferences.
+    """
+    deltas = add_preference_deltas({}, old_rating, new_rating)
+    if deltas:
+        await apply_stat_deltas(db, user_id, deltas)
+
+    if new_rating is not None:
+        is_request = new_rating == 2
+        await bump_activity(db, ratings=0 if is_request else 1, requests=1 if is_request else 0)
+
+
+def add_preference_deltas(deltas: dict[str, int], old_rating: int | None, new_rating: int | None) -> dict[str, int]:
+    """
+    Add the counter changes for one preference write to `deltas` and
+    return it without zero entries.
+    """
+    if old_rating in RATING_COLUMNS:
+        deltas[RATING_COLUMNS[old_rating]] = deltas.get(RATING_COLUMNS[old_rating], 0) - 1
+    if new_rating in RATING_COLUMNS:
+        deltas[RATING_COLUMNS[new_rating]] = deltas.get(RATING_COLUMNS[new_rating], 0) + 1
+    return {column: delta for column, delta in deltas.items() if delta}
+
+
+async def apply_stat_deltas(db: AsyncSession, user_id: int, deltas: dict[str, int]) -> None:
+    stmt = sqlite_insert(UserStats).values(
+        user_id=user_id,
+        **{column: max(deltas.get(column, 0), 0) for column in RATING_COLUMNS.values()},
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            **{column: getattr(UserStats, column) + delta for column, delta in deltas.items()},
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(stmt)
+
+
+async def bump_activity(db: AsyncSession, ratings: int = 0, requests: int = 0, day: date | None = None) -> None:
+    if not ratings and not requests:
+        return
+    day = day or datetime.utcnow().date()
+    stmt = sqlite_insert(ActivityDaily).values(day=day, ratings=ratings, requests=requests)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ActivityDaily.day],
+        set_={
+            "ratings": ActivityDaily.ratings + ratings,
+            "requests": ActivityDaily.requests + requests,
+        },
+    )
+    await db.execute(stmt)
+
+
+async def get_admin_stats(db: AsyncSession, days: int = 30) -> dict[str, Any]:
+    """
+    Build the admin statistics payload from the counter tables: one query
+    for per-user counters joined to users, one for the activity series.
+    """
+    stmt = (
+        select(
+            User.id,
+            User.username,
+            User.email,
+            *(func.coalesce(getattr(UserStats, column), 0).label(column) for column in RATING_COLUMNS.values()),
+        )
+        .outerjoin(UserStats, UserStats.user_id == User.id)
+    )
+    rows = (await db.execute(stmt)).all()
+
+    totals = {column: 0 for column in RATING_COLUMNS.values()}
+    user_stats = []
+    for row in rows:
+        for column in totals:
+            totals[column] += getattr(row, column)
+        user_stats.append({
+            "username": row.username or row.email or f"User {row.id}",
+            "likes": row.likes,
+            "dislikes": row.dislikes,
+            "seen": row.seen,
+            "requested": row.requested,
+            "total": row.likes + row.dislikes + row.seen,
+        })
+
+    # Sort by total activity
+    user_stats.sort(key=lambda x: x["total"], reverse=True)
+
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    activity_rows = (
+        await db.execute(select(ActivityDaily).where(ActivityDaily.day >= start))
+    ).scalars().all()
+    by_day = {row.day: row for row in activity_rows}
+    activity = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = by_day.get(day)
+        activity.append({
+            "date": day.isoformat(),
+            "ratings": row.ratings if row else 0,
+            "requests": row.requests if row else 0,
+        })
+
+    return {
+        "total_users": len(rows),
+        "interactions": {
+            **totals,
+            "total": totals["likes"] + totals["dislikes"] + totals["seen"],
+        },
+        "user_stats": user_stats,
+        "activity": activity,
+    }
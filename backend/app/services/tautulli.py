@@ -1,79 +1,233 @@
+import asyncio
+import time
+from datetime import timedelta
+from typing import Any
+
 import httpx
 from fastapi import HTTPException
 
-from ..config import settings
+from ..config import Settings, get_settings, settings_store
+from ..telemetry import log_exception
+from .http import instrumented_client, normalize_base_url, retire_client
+from .shared_cache import get_shared, put_shared
+from .singleflight import SingleFlight
 
 
 class TautulliService:
     def __init__(self) -> None:
-        # Intentionally do not cache URL/API key here; they can be updated
-        # at runtime via the admin settings, so we always read from settings.
-        pass
-
-    def _build_url(self, params: dict) -> str:
-        base_url = settings.TAUTULLI_URL.strip().rstrip("/")
-        # Allow shorthand like "tautulli:8181" by assuming http://
-        if base_url and not base_url.startswith(("http://", "https://")):
-            base_url = f"http://{base_url}"
+        # URL/API key can be updated at runtime via the admin settings; the
+        # client is rebuilt whenever they change.
+        self._client: httpx.AsyncClient | None = None
+        # Concurrent user list fetches (logins, directory refresh) share one request.
+        self._users_flight = SingleFlight("tautulli_users")
+        self._configure(get_settings())
+        settings_store.subscribe(self._on_settings_change)
+
+    def _configure(self, settings: Settings) -> None:
+        base_url = normalize_base_url(settings.TAUTULLI_URL)
         api_key = settings.TAUTULLI_API_KEY
-        query = "&".join([f"{k}={v}" for k, v in params.items()])
-        return f"{base_url}/api/v2?apikey={api_key}&{query}"
+        self.configured = bool(base_url and api_key)
+        old_client = self._client
+        self._client = (
+            instrumented_client("tautulli", base_url=base_url, params={"apikey": api_key}, timeout=30)
+            if self.configured
+            else None
+        )
+        retire_client(old_client)
+
+    def _on_settings_change(self, settings: Settings, changed: frozenset[str]) -> None:
+        if changed & {"TAUTULLI_URL", "TAUTULLI_API_KEY"}:
+            self._configure(settings)
+
+    async def _get(self, params: dict) -> dict:
+        resp = await self._client.get("/api/v2", params=params)
+        resp.raise_for_status()
+        return resp.json()
 
     async def get_users(self):
         """Fetch all users from Tautulli."""
-        if not settings.TAUTULLI_URL or not settings.TAUTULLI_API_KEY:
+        if not self.configured:
             return []
+        return await self._users_flight.do("users", self._get_users)
+
+    async def _get_users(self) -> list:
+        try:
+            data = await self._get({"cmd": "get_users"})
+            response_obj = data.get("response", {})
+            data_obj = response_obj.get("data", [])
+
+            # Tautulli may return the users list either directly as `data: []`
+            # or nested under `data: { users: [] }`. Handle both.
+            if isinstance(data_obj, list):
+                return data_obj
+            if isinstance(data_obj, dict):
+                users = data_obj.get("users")
+                if isinstance(users, list):
+                    return users
 
-        async with httpx.AsyncClient() as client:
-            try:
-                url = self._build_url({"cmd": "get_users"})
-                resp = await client.get(url)
-                resp.raise_for_status()
-                data = resp.json()
-                response_obj = data.get("response", {})
-                data_obj = response_obj.get("data", [])
-
-                # Tautulli may return the users list either directly as `data: []`
-                # or nested under `data: { users: [] }`. Handle both.
-                if isinstance(data_obj, list):
-                    return data_obj
-                if isinstance(data_obj, dict):
-                    users = data_obj.get("users")
-                    if isinstance(users, list):
-                        return users
-
-                return []
-            except Exception as e:
-                print(f"Error fetching Tautulli users: {e}")
-                return []
+            return []
+        except Exception as e:
+            print(f"Error fetching Tautulli users: {e}")
+            return []
 
     async def get_user_history(self, user_id: int, length: int = 50):
         """Fetch watch history for a specific user."""
-        if not settings.TAUTULLI_URL or not settings.TAUTULLI_API_KEY:
+        if not self.configured:
+            return []
+
+        try:
+            data = await self._get(
+                {
+                    "cmd": "get_history",
+                    "user_id": user_id,
+                    "length": length,
+                    "media_type": "movie,episode",
+                }
+            )
+            return data.get("response", {}).get("data", {}).get("data", [])
+        except Exception as e:
+            print(f"Error fetching Tautulli history: {e}")
+            return []
+
+    async def get_home_stats(self, stat_id: str, time_range: int = 90, count: int = 50):
+        """
+        Fetch a server-wide home statistic (e.g. 'popular_movies',
+        'popular_tv') aggregated across all users.
+        """
+        if not self.configured:
             return []
 
-        async with httpx.AsyncClient() as client:
-            try:
-                url = self._build_url(
-                    {
-                        "cmd": "get_history",
-                        "user_id": user_id,
-                        "length": length,
-                        "media_type": "movie,episode",
-                    }
-                )
-                resp = await client.get(url)
-                resp.raise_for_status()
-                data = resp.json()
-                return data.get("response", {}).get("data", {}).get("data", [])
-            except Exception as e:
-                print(f"Error fetching Tautulli history: {e}")
-                return []
+        try:
+            data = await self._get(
+                {
+                    "cmd": "get_home_stats",
+                    "stat_id": stat_id,
+                    "time_range": time_range,
+                    "stats_count": count,
+                }
+            )
+            data = data.get("response", {}).get("data", {})
+            # A single stat comes back as {stat_id, rows}; older versions
+            # return a list of stats.
+            if isinstance(data, list):
+                data = next((d for d in data if d.get("stat_id") == stat_id), {})
+            rows = data.get("rows", []) if isinstance(data, dict) else []
+            return rows if isinstance(rows, list) else []
+        except Exception:
+            log_exception("tautulli_home_stats", "Error fetching Tautulli home stats", stat_id=stat_id)
+            return []
 
 
 tautulli_service = TautulliService()
 
 
+# How long the cached Tautulli user list is trusted before a refresh.
+USER_DIRECTORY_TTL_SECONDS = 15 * 60
+
+
+class TautulliUserDirectory:
+    """
+    In-memory copy of Tautulli's user list, indexed by email, username,
+    friendly name and id so a login can map a Plex user without a request
+    to Tautulli. Refreshed in the background (see main.py); the list is
+    shared through the database so only one worker fetches it per TTL.
+    """
+
+    def __init__(self) -> None:
+        self._by_email: dict[str, Any] = {}
+        self._by_name: dict[str, Any] = {}
+        self._by_id: dict[str, Any] = {}
+        self._refreshed_at: float | None = None
+        self._lock = asyncio.Lock()
+        settings_store.subscribe(self._on_settings_change)
+
+    def _on_settings_change(self, settings: Settings, changed: frozenset[str]) -> None:
+        # The cached directory belongs to the previous Tautulli server.
+        if changed & {"TAUTULLI_URL", "TAUTULLI_API_KEY"}:
+            self.invalidate()
+
+    @property
+    def is_fresh(self) -> bool:
+        return (
+            self._refreshed_at is not None
+            and time.monotonic() - self._refreshed_at < USER_DIRECTORY_TTL_SECONDS
+        )
+
+    def invalidate(self) -> None:
+        """Drop the directory, e.g. after the Tautulli settings change."""
+        self._by_email, self._by_name, self._by_id = {}, {}, {}
+        self._refreshed_at = None
+
+    async def _load_users(self) -> tuple[list[dict[str, Any]], float]:
+        """
+        The user list and when it was fetched: the copy another worker
+        stored in the shared cache if it is fresh, else from Tautulli.
+        """
+        key = f"tautulli_users:{normalize_base_url(get_settings().TAUTULLI_URL)}"
+        shared = await get_shared(key)
+        if shared is not None:
+            return shared["users"], shared["fetched_at"]
+        fetched_at = time.time()
+        users = [
+            {field: t_user.get(field) for field in ("user_id", "email", "username", "friendly_name")}
+            for t_user in await tautulli_service.get_users()
+        ]
+        if users:
+            await put_shared(
+                key,
+                {"users": users, "fetched_at": fetched_at},
+                timedelta(seconds=USER_DIRECTORY_TTL_SECONDS),
+            )
+        return users, fetched_at
+
+    async def refresh(self) -> None:
+        async with self._lock:
+            users, fetched_at = await self._load_users()
+            if not users and self._by_id:
+                # Tautulli unreachable: keep serving the last good copy and
+                # retry on the next refresh.
+                return
+            by_email: dict[str, Any] = {}
+            by_name: dict[str, Any] = {}
+            by_id: dict[str, Any] = {}
+            for t_user in users:
+                t_id = t_user.get("user_id")
+                if t_id is None:
+                    continue
+                # First entry wins, matching the old linear scan.
+                email = (t_user.get("email") or "").lower()
+                if email:
+                    by_email.setdefault(email, t_id)
+                for name in (t_user.get("username"), t_user.get("friendly_name")):
+                    if name:
+                        by_name.setdefault(name.lower(), t_id)
+                # Sometimes Tautulli returns user_id as integer, sometimes string.
+                by_id.setdefault(str(t_id), t_id)
+            self._by_email, self._by_name, self._by_id = by_email, by_name, by_id
+            # Age a shared copy from when it was fetched, not when we read it.
+            self._refreshed_at = time.monotonic() - max(0.0, time.time() - fetched_at)
+
+    async def refresh_if_stale(self) -> None:
+        if not self.is_fresh:
+            await self.refresh()
+
+    def lookup(self, plex_id: Any = None, email: str | None = None, username: str | None = None) -> Any:
+        """
+        Map a Plex user to a Tautulli user id. Prefer email match, then
+        username/friendly_name, falling back to id if they align.
+        """
+        if email and email.lower() in self._by_email:
+            return self._by_email[email.lower()]
+        if username and username.lower() in self._by_name:
+            return self._by_name[username.lower()]
+        if plex_id is not None:
+            return self._by_id.get(str(plex_id))
+        return None
+
+
+tautulli_user_directory = TautulliUserDirectory()
+
+
 # Convenience functions used by newer services
 async def get_users():
     return await tautulli_service.get_users()
@@ -0,0 +1,389 @@
+"""
+Lightweight in-process instrumentation: timed spans written to structured
+(JSON) logs, plus counters and histograms exposed in Prometheus text format
+at /metrics.
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import math
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+
+logger = logging.getLogger("sagarr.telemetry")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Iterable[tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self._values: dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # label key -> (bucket counts, sum, count)
+        self._values: dict[LabelKey, tuple[list[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = {key: (list(c), s, n) for key, (c, s, n) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {bucket_count}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram] = {}
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+span_duration = registry.histogram(
+    "sagarr_span_duration_seconds", "Duration of instrumented pipeline steps."
+)
+span_errors = registry.counter("sagarr_span_errors_total", "Instrumented steps that raised.")
+handled_errors = registry.counter(
+    "sagarr_handled_errors_total", "Errors caught and logged by background jobs, by where they were caught."
+)
+upstream_requests = registry.counter(
+    "sagarr_upstream_requests_total", "HTTP requests to upstream services by status code."
+)
+upstream_duration = registry.histogram(
+    "sagarr_upstream_request_duration_seconds", "Latency of HTTP requests to upstream services."
+)
+llm_tokens = registry.counter("sagarr_llm_tokens_total", "LLM tokens used, by provider, model and kind.")
+
+cache_lookups = registry.counter("sagarr_cache_lookups_total", "Cache lookups by cache and result.")
+
+_trace_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("sagarr_trace_id", default=None)
+_user_id: contextvars.ContextVar[int | None] = contextvars.ContextVar("sagarr_user_id", default=None)
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("sagarr_span", default=None)
+
+
+class Span:
+    """
+    Times a block of work. Use as a context manager (in sync or async
+    code); attributes such as sizes and counts can be attached with
+    `set()` and end up in the log record.
+    """
+
+    def __init__(self, name: str, **attrs: Any) -> None:
+        self.name = name
+        self.attrs: dict[str, Any] = dict(attrs)
+        self.duration = 0.0
+        self._started = 0.0
+        self._tokens: list[contextvars.Token] = []
+        self.parent: Span | None = None
+        # Set by `fail()` when an error is handled inside the span.
+        self.error: BaseException | None = None
+
+    def set(self, **attrs: Any) -> Span:
+        self.attrs.update(attrs)
+        return self
+
+    def fail(self, exc: BaseException) -> Span:
+        """
+        Mark the span as errored for an exception that was caught inside it.
+        """
+        self.error = exc
+        return self
+
+    def __enter__(self) -> Span:
+        self.parent = _current_span.get()
+        if _trace_id.get() is None:
+            self._tokens.append(_trace_id.set(uuid.uuid4().hex[:16]))
+        self._tokens.append(_current_span.set(self))
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.duration = time.perf_counter() - self._started
+        span_duration.observe(self.duration, span=self.name)
+        record: dict[str, Any] = {
+            "span": self.name,
+            "trace_id": _trace_id.get(),
+            "parent": self.parent.name if self.parent else None,
+            "duration_ms": round(self.duration * 1000, 2),
+            **self.attrs,
+        }
+        error = exc if exc is not None else self.error
+        if error is not None:
+            span_errors.inc(span=self.name)
+            record["error"] = f"{type(error).__name__}: {error}"
+        for token in reversed(self._tokens):
+            token.var.reset(token)
+        self._tokens.clear()
+        logger.info(json.dumps(record, default=str))
+
+
+# Recent samples kept per series for live percentiles.
+RING_SIZE = 2048
+
+
+class PerformanceRecorder:
+    """
+    In-memory ring buffers of recent upstream requests and generations,
+    plus token and cache counters accumulated since the last rollup.
+    `drain()` hands everything newer than the previous drain to the
+    periodic SQLite rollup.
+    """
+
+    def __init__(self, size: int = RING_SIZE) -> None:
+        self.size = size
+        # service -> (time, seconds, ok)
+        self.upstream: dict[str, deque[tuple[float, float, bool]]] = {}
+        # (time, user_id, seconds, ok)
+        self.generations: deque[tuple[float, int, float, bool]] = deque(maxlen=size)
+        # (user_id, provider, model) -> [calls, prompt tokens, completion tokens]
+        self.llm: dict[tuple[int | None, str, str], list[int]] = {}
+        # cache -> [lookups, hits]
+        self.caches: dict[str, list[int]] = {}
+        self.drained_at = time.time()
+        self._lock = threading.Lock()
+
+    def add_upstream(self, service: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            ring = self.upstream.get(service)
+            if ring is None:
+                ring = self.upstream[service] = deque(maxlen=self.size)
+            ring.append((time.time(), seconds, ok))
+
+    def add_generation(self, user_id: int, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.generations.append((time.time(), user_id, seconds, ok))
+
+    def add_llm(self, user_id: int | None, provider: str, model: str, prompt: int, completion: int) -> None:
+        with self._lock:
+            totals = self.llm.setdefault((user_id, provider, model), [0, 0, 0])
+            totals[0] += 1
+            totals[1] += prompt
+            totals[2] += completion
+
+    def add_cache(self, cache: str, hits: int, misses: int) -> None:
+        with self._lock:
+            totals = self.caches.setdefault(cache, [0, 0])
+            totals[0] += hits + misses
+            totals[1] += hits
+
+    def upstream_samples(self) -> dict[str, list[tuple[float, float, bool]]]:
+        with self._lock:
+            return {service: list(ring) for service, ring in self.upstream.items()}
+
+    def pending(self) -> tuple[list[tuple[float, int, float, bool]], dict, dict]:
+        """
+        Generations, LLM usage and cache counts not yet rolled up.
+        """
+        with self._lock:
+            since = self.drained_at
+            generations = [g for g in self.generations if g[0] > since]
+            return generations, {k: list(v) for k, v in self.llm.items()}, {k: list(v) for k, v in self.caches.items()}
+
+    def drain(self) -> dict[str, Any]:
+        """
+        Everything recorded since the previous drain; counters are reset.
+        """
+        with self._lock:
+            since, now = self.drained_at, time.time()
+            drained = {
+                "since": since,
+                "until": now,
+                "upstream": {
+                    service: [sample for sample in ring if since < sample[0] <= now]
+                    for service, ring in self.upstream.items()
+                },
+                "generations": [g for g in self.generations if since < g[0] <= now],
+                "llm": self.llm,
+                "caches": self.caches,
+            }
+            self.llm = {}
+            self.caches = {}
+            self.drained_at = now
+            return drained
+
+
+recorder = PerformanceRecorder()
+
+
+def span(name: str, **attrs: Any) -> Span:
+    return Span(name, **attrs)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def log_exception(where: str, message: str, **attrs: Any) -> None:
+    """
+    Log the exception being handled as a JSON line with its traceback,
+    count it in `sagarr_handled_errors_total` and mark the active span (if
+    any) as errored. For errors a background job recovers from.
+    """
+    exc = sys.exc_info()[1]
+    active = _current_span.get()
+    if active is not None and exc is not None:
+        active.fail(exc)
+    handled_errors.inc(where=where)
+    record: dict[str, Any] = {
+        "error_in": where,
+        "message": message,
+        "trace_id": _trace_id.get(),
+        "span": active.name if active else None,
+        **attrs,
+    }
+    if exc is not None:
+        record["error"] = f"{type(exc).__name__}: {exc}"
+    logger.exception(json.dumps(record, default=str))
+
+
+def log_event(event: str, message: str, level: int = logging.INFO, **attrs: Any) -> None:
+    """
+    Log a notable state change that is not an error (e.g. a worker taking
+    the scheduler lease) as a JSON line.
+    """
+    record: dict[str, Any] = {"event": event, "message": message, "trace_id": _trace_id.get(), **attrs}
+    logger.log(level, json.dumps(record, default=str))
+
+
+@contextmanager
+def attribute_to_user(user_id: int) -> Iterator[None]:
+    """
+    Attribute LLM usage recorded inside the block to a user.
+    """
+    token = _user_id.set(user_id)
+    try:
+        yield
+    finally:
+        _user_id.reset(token)
+
+
+def record_upstream(service: str, status: int | str, duration: float) -> None:
+    upstream_requests.inc(service=service, status=status)
+    upstream_duration.observe(duration, service=service)
+    recorder.add_upstream(service, duration, ok=isinstance(status, int) and status < 500)
+
+
+def record_generation(user_id: int, duration: float, ok: bool) -> None:
+    recorder.add_generation(user_id, duration, ok)
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    if hits:
+        cache_lookups.inc(hits, cache=cache, result="hit")
+    if misses:
+        cache_lookups.inc(misses, cache=cache, result="miss")
+    recorder.add_cache(cache, hits, misses)
+
+
+def record_llm_usage(provider: str, model: str, prompt_tokens: int | None, completion_tokens: int | None) -> None:
+    """
+    Count tokens reported by a provider and attach them to the current span
+    and user.
+    """
+    prompt_tokens = int(prompt_tokens or 0)
+    completion_tokens = int(completion_tokens or 0)
+    llm_tokens.inc(prompt_tokens, provider=provider, model=model, kind="prompt")
+    llm_tokens.inc(completion_tokens, provider=provider, model=model, kind="completion")
+    recorder.add_llm(_user_id.get(), provider, model, prompt_tokens, completion_tokens)
+    active = _current_span.get()
+    if active is not None:
+        active.set(
+            prompt_tokens=active.attrs.get("prompt_tokens", 0) + prompt_tokens,
+            completion_tokens=active.attrs.get("completion_tokens", 0) + completion_tokens,
+        )
+
+
+def configure_logging() -> None:
+    """
+    Emit span records as one JSON object per line on stderr.
+    """
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
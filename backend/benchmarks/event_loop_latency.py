@@ -0,0 +1,144 @@
+"""
+Measure how SQLite lock waits affect unrelated requests on the event loop,
+comparing a synchronous `Session` (the old request path) with the
+`AsyncSession` dependency.
+
+A background thread plays the nightly job, repeatedly holding the write lock
+for a few milliseconds. Meanwhile, concurrent "rating" coroutines write to
+the database and a probe coroutine stands in for an unrelated cheap request,
+recording how late the event loop lets it run. Run from the backend
+directory:
+
+    python -m benchmarks.event_loop_latency --seconds 5 --writers 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, apply_sqlite_pragmas
+from app import models  # noqa: F401
+from app.models import UserPreference
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+def _nightly_writer(url: str, stop: threading.Event, hold_ms: float) -> None:
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    with engine.connect() as conn:
+        while not stop.is_set():
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            conn.execute(insert(UserPreference).values(user_id=0, tmdb_id=0, media_type="movie", rating=0))
+            time.sleep(hold_ms / 1000)
+            conn.exec_driver_sql("COMMIT")
+            time.sleep(hold_ms / 1000)
+    engine.dispose()
+
+
+async def run_mode(mode: str, seconds: float, writers: int, hold_ms: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        sync_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+        event.listen(sync_engine, "connect", apply_sqlite_pragmas)
+        Base.metadata.create_all(bind=sync_engine)
+        SyncSession = sessionmaker(bind=sync_engine)
+
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 30})
+        event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+        AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+        stop_thread = threading.Event()
+        nightly = threading.Thread(
+            target=_nightly_writer, args=(f"sqlite:///{path}", stop_thread, hold_ms), daemon=True
+        )
+        nightly.start()
+
+        deadline = time.perf_counter() + seconds
+        request_latencies: list[float] = []
+        probe_latencies: list[float] = []
+
+        async def rating_request(n: int) -> None:
+            i = 0
+            while time.perf_counter() < deadline:
+                i += 1
+                started = time.perf_counter()
+                row = {"user_id": n, "tmdb_id": i, "media_type": "movie", "rating": 1}
+                if mode == "sync":
+                    db = SyncSession()
+                    try:
+                        db.execute(insert(UserPreference).values(**row))
+                        db.commit()
+                    finally:
+                        db.close()
+                else:
+                    async with AsyncSessionLocal() as db:
+                        await db.execute(insert(UserPreference).values(**row))
+                        await db.commit()
+                request_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0)
+
+        async def probe() -> None:
+            interval = 0.01
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await asyncio.sleep(interval)
+                probe_latencies.append(max(time.perf_counter() - started - interval, 0.0))
+
+        await asyncio.gather(probe(), *(rating_request(n) for n in range(1, writers + 1)))
+
+        stop_thread.set()
+        nightly.join()
+        async with async_engine.connect() as conn:
+            rows = (await conn.execute(text("SELECT count(*) FROM user_preferences"))).scalar_one()
+        await async_engine.dispose()
+        sync_engine.dispose()
+
+    return {
+        "mode": mode,
+        "rows_written": rows,
+        "unrelated_request_delay": _percentiles(probe_latencies),
+        "rating_request_latency": _percentiles(request_latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--hold-ms", type=float, default=20.0, help="How long the nightly writer holds the lock.")
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(run_mode(mode, args.seconds, args.writers, args.hold_ms))
+        for mode in ("sync", "async")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
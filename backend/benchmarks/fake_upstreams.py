@@ -0,0 +1,327 @@
+"""
+Local stand-ins for Tautulli, Overseerr, TMDb and an OpenAI-compatible LLM,
+served by one FastAPI app under /tautulli, /overseerr, /tmdb and /llm.
+
+Every service has its own latency, jitter, error rate and payload size, so
+benchmarks can reproduce a slow TMDb or a flaky LLM without network access.
+Responses are deterministic for a given seed. With --dataset, users, watch
+history and titles come from the upstreams.db written by
+benchmarks.synthetic_data instead of being made up per request. Run
+standalone with:
+
+    python -m benchmarks.fake_upstreams --port 8765 --set llm.latency_ms=1500
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field, fields
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+SERVICES = ("tautulli", "overseerr", "tmdb", "llm")
+
+
+@dataclass
+class FakeServiceConfig:
+    latency_ms: float = 0.0
+    # Uniform extra delay in [0, jitter_ms].
+    jitter_ms: float = 0.0
+    # Fraction of requests answered with HTTP 500.
+    error_rate: float = 0.0
+    # Service specific: history rows (Tautulli), overview bytes (TMDb),
+    # categories per lane (LLM), request entries (Overseerr).
+    payload_size: int = 0
+
+
+def default_configs() -> dict[str, FakeServiceConfig]:
+    return {
+        "tautulli": FakeServiceConfig(latency_ms=20, jitter_ms=10, payload_size=500),
+        "overseerr": FakeServiceConfig(latency_ms=15, jitter_ms=10, payload_size=1),
+        "tmdb": FakeServiceConfig(latency_ms=40, jitter_ms=20, payload_size=400),
+        "llm": FakeServiceConfig(latency_ms=800, jitter_ms=400, payload_size=10),
+    }
+
+
+def apply_overrides(configs: dict[str, FakeServiceConfig], overrides: list[str]) -> None:
+    """
+    Apply "service.field=value" overrides, e.g. "tmdb.error_rate=0.05".
+    """
+    for override in overrides:
+        target, _, value = override.partition("=")
+        service, _, name = target.partition(".")
+        if service not in configs or name not in {f.name for f in fields(FakeServiceConfig)}:
+            raise ValueError(f"Unknown override {override!r}")
+        kind = type(getattr(configs[service], name))
+        setattr(configs[service], name, kind(value))
+
+
+# TMDb-style ids the fakes hand out; the LLM recommends from this pool and
+# the Tautulli history draws titles from it.
+CATALOG_SIZE = 5000
+GENRES = [
+    {"id": 28, "name": "Action"},
+    {"id": 35, "name": "Comedy"},
+    {"id": 18, "name": "Drama"},
+    {"id": 878, "name": "Science Fiction"},
+    {"id": 27, "name": "Horror"},
+    {"id": 99, "name": "Documentary"},
+]
+
+
+@dataclass
+class FakeUpstreams:
+    configs: dict[str, FakeServiceConfig] = field(default_factory=default_configs)
+    seed: int = 0
+    # Path to an upstreams.db from benchmarks.synthetic_data.
+    dataset: str | None = None
+    requests: dict[str, int] = field(default_factory=lambda: {name: 0 for name in SERVICES})
+
+    def __post_init__(self) -> None:
+        self._random = random.Random(self.seed)
+        self._db: sqlite3.Connection | None = None
+        self.catalog_size = CATALOG_SIZE
+        if self.dataset:
+            self._db = sqlite3.connect(f"file:{self.dataset}?mode=ro", uri=True, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self.catalog_size = self._db.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+        self.app = self._build_app()
+
+    def _query(self, sql: str, *params) -> list[sqlite3.Row]:
+        return self._db.execute(sql, params).fetchall()
+
+    async def _delay(self, service: str) -> JSONResponse | None:
+        config = self.configs[service]
+        self.requests[service] += 1
+        await asyncio.sleep((config.latency_ms + self._random.uniform(0, config.jitter_ms)) / 1000)
+        if config.error_rate and self._random.random() < config.error_rate:
+            return JSONResponse({"error": f"fake {service} failure"}, status_code=500)
+        return None
+
+    def _title(self, tmdb_id: int) -> str:
+        return f"Title {tmdb_id}"
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/tautulli/api/v2")
+        async def tautulli(request: Request):
+            if (failure := await self._delay("tautulli")) is not None:
+                return failure
+            params = request.query_params
+            cmd = params.get("cmd")
+            size = self.configs["tautulli"].payload_size
+            if cmd == "get_users" and self._db is not None:
+                users = [dict(row) for row in self._query("SELECT * FROM users")]
+                return {"response": {"result": "success", "data": users}}
+            if cmd == "get_users":
+                users = [
+                    {"user_id": i, "username": f"user{i}", "friendly_name": f"User {i}", "email": f"user{i}@example.com"}
+                    for i in range(1, 1001)
+                ]
+                return {"response": {"result": "success", "data": users}}
+            if cmd == "get_history" and self._db is not None:
+                rows = [
+                    {
+                        "title": f"Episode {row['watched_at'] % 20 + 1}" if row["media_type"] == "tv" else row["title"],
+                        "grandparent_title": row["title"] if row["media_type"] == "tv" else "",
+                        "media_type": "episode" if row["media_type"] == "tv" else "movie",
+                        "genres": ", ".join(g["name"] for g in json.loads(row["genres"])),
+                        "section_name": "TV Shows" if row["media_type"] == "tv" else "Movies",
+                    }
+                    for row in self._query(
+                        "SELECT h.watched_at, t.media_type, t.title, t.genres FROM history h "
+                        "JOIN titles t ON t.tmdb_id = h.tmdb_id WHERE h.user_id = ? "
+                        "ORDER BY h.watched_at DESC LIMIT ?",
+                        int(params.get("user_id") or 0),
+                        int(params.get("length") or size),
+                    )
+                ]
+                return {"response": {"result": "success", "data": {"data": rows}}}
+            if cmd == "get_history":
+                rng = random.Random(f"{self.seed}:{params.get('user_id')}")
+                length = min(int(params.get("length") or size), size)
+                rows = []
+                for _ in range(length):
+                    tmdb_id = rng.randrange(1, CATALOG_SIZE)
+                    is_tv = rng.random() < 0.4
+                    rows.append(
+                        {
+                            "title": f"Episode {rng.randrange(1, 20)}" if is_tv else self._title(tmdb_id),
+                            "grandparent_title": self._title(tmdb_id) if is_tv else "",
+                            "media_type": "episode" if is_tv else "movie",
+                            "genres": rng.choice(GENRES)["name"],
+                            "section_name": "TV Shows" if is_tv else "Movies",
+                        }
+                    )
+                return {"response": {"result": "success", "data": {"data": rows}}}
+            if cmd == "get_home_stats" and self._db is not None:
+                rows = [
+                    dict(row)
+                    for row in self._query(
+                        "SELECT t.title, p.users_watched FROM popular p JOIN titles t ON t.tmdb_id = p.tmdb_id "
+                        "WHERE p.stat_id = ? ORDER BY p.users_watched DESC LIMIT ?",
+                        params.get("stat_id"),
+                        int(params.get("stats_count") or 50),
+                    )
+                ]
+                return {"response": {"result": "success", "data": {"rows": rows}}}
+            if cmd == "get_home_stats":
+                rng = random.Random(f"{self.seed}:{params.get('stat_id')}")
+                rows = [
+                    {"title": self._title(rng.randrange(1, CATALOG_SIZE)), "users_watched": rng.randrange(1, 30)}
+                    for _ in range(int(params.get("stats_count") or 50))
+                ]
+                return {"response": {"result": "success", "data": {"rows": rows}}}
+            return {"response": {"result": "error", "data": {}}}
+
+        @app.get("/overseerr/api/v1/{media_type}/{tmdb_id}")
+        async def overseerr_media(media_type: str, tmdb_id: int):
+            if (failure := await self._delay("overseerr")) is not None:
+                return failure
+            status = tmdb_id % 6
+            if status == 0:
+                return {"id": tmdb_id}
+            requests = [{"status": 1} for _ in range(self.configs["overseerr"].payload_size)]
+            return {"id": tmdb_id, "mediaInfo": {"status": status, "requests": requests}}
+
+        @app.post("/overseerr/api/v1/request")
+        async def overseerr_request(request: Request):
+            if (failure := await self._delay("overseerr")) is not None:
+                return failure
+            body = await request.json()
+            return {"id": self._random.randrange(1, 10**6), "media": body}
+
+        @app.get("/tmdb/3/{media_type}/{tmdb_id}")
+        async def tmdb(media_type: str, tmdb_id: int):
+            if (failure := await self._delay("tmdb")) is not None:
+                return failure
+            rng = random.Random(f"{self.seed}:{media_type}:{tmdb_id}")
+            key = "name" if media_type == "tv" else "title"
+            genres = rng.sample(GENRES, 2)
+            if self._db is not None:
+                found = self._query("SELECT genres FROM titles WHERE tmdb_id = ?", tmdb_id)
+                if not found:
+                    return JSONResponse({"status_message": "not found"}, status_code=404)
+                genres = json.loads(found[0]["genres"])
+            return {
+                "id": tmdb_id,
+                key: self._title(tmdb_id),
+                "overview": "x" * self.configs["tmdb"].payload_size,
+                "poster_path": f"/{tmdb_id}.jpg",
+                "genres": genres,
+                "adult": False,
+            }
+
+        @app.post("/llm/v1/chat/completions")
+        async def llm(request: Request):
+            if (failure := await self._delay("llm")) is not None:
+                return failure
+            body = await request.json()
+            prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+            rng = random.Random(f"{self.seed}:{prompt_chars}:{self._random.random()}")
+            categories = self.configs["llm"].payload_size
+
+            def lane(name: str) -> list[dict]:
+                return [
+                    {
+                        "title": f"{name} picks {i + 1}",
+                        "reason": "Because you watched similar titles.",
+                        "items": [rng.randrange(1, self.catalog_size) for _ in range(8)],
+                    }
+                    for i in range(categories)
+                ]
+
+            content = json.dumps({"movies": lane("Movie"), "tv": lane("TV"), "documentaries": lane("Documentary")})
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": prompt_chars // 4 + len(content) // 4,
+                },
+            }
+
+        return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeUpstreamServer:
+    """
+    Serves FakeUpstreams on 127.0.0.1 from a background thread.
+    """
+
+    def __init__(self, upstreams: FakeUpstreams, port: int | None = None) -> None:
+        self.upstreams = upstreams
+        self.port = port or free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(upstreams.app, host="127.0.0.1", port=self.port, log_level="warning", access_log=False)
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def env(self) -> dict[str, str]:
+        """
+        Settings pointing the backend at these fakes.
+        """
+        return {
+            "TAUTULLI_URL": f"{self.base_url}/tautulli",
+            "TAUTULLI_API_KEY": "fake",
+            "OVERSEERR_URL": f"{self.base_url}/overseerr",
+            "OVERSEERR_API_KEY": "fake",
+            "TMDB_BASE_URL": f"{self.base_url}/tmdb/3",
+            "TMDB_API_KEY": "fake",
+            "AI_PROVIDER": "generic",
+            "AI_BASE_URL": f"{self.base_url}/llm/v1",
+            "AI_API_KEY": "fake",
+            "AI_MODEL": "fake-model",
+        }
+
+    def __enter__(self) -> FakeUpstreamServer:
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake upstream server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dataset", help="upstreams.db written by benchmarks.synthetic_data.")
+    parser.add_argument("--set", action="append", default=[], metavar="SERVICE.FIELD=VALUE")
+    args = parser.parse_args()
+
+    configs = default_configs()
+    apply_overrides(configs, args.set)
+    upstreams = FakeUpstreams(configs=configs, seed=args.seed, dataset=args.dataset)
+    uvicorn.run(upstreams.app, host="127.0.0.1", port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark the UserPreference hot paths for heavy raters, comparing the
+legacy schema (only a tmdb_id index, select-then-write ratings, three
+preference queries per generation) with the composite indexes, upserts and
+single grouped fetch.
+
+Run from the backend directory:
+
+    python -m benchmarks.preference_queries --users 200 --heavy-ratings 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, delete, desc, event, insert, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database import Base, apply_sqlite_pragmas
+from app import models  # noqa: F401
+from app.models import UserPreference
+
+HEAVY_USER_ID = 1
+
+
+def _timed(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+def _build(path: str, legacy: bool, users: int, heavy_ratings: int, per_user: int):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        if legacy:
+            conn.execute(text("DROP INDEX IF EXISTS uq_user_preferences_user_tmdb"))
+            conn.execute(text("DROP INDEX IF EXISTS ix_user_preferences_user_created"))
+        rnd = random.Random(42)
+        rows = []
+        for user_id in range(1, users + 1):
+            count = heavy_ratings if user_id == HEAVY_USER_ID else per_user
+            for tmdb_id in rnd.sample(range(1, 2_000_000), count):
+                rows.append(
+                    {
+                        "user_id": user_id,
+                        "tmdb_id": tmdb_id,
+                        "media_type": rnd.choice(("movie", "tv")),
+                        "rating": rnd.choice((1, 1, -1, 0, 2)),
+                    }
+                )
+                if len(rows) >= 50_000:
+                    conn.execute(insert(UserPreference), rows)
+                    rows = []
+        if rows:
+            conn.execute(insert(UserPreference), rows)
+        conn.execute(text("ANALYZE"))
+    return engine
+
+
+def _legacy_ops(engine, rnd: random.Random) -> dict:
+    def preference_queries():
+        with engine.connect() as conn:
+            base = select(UserPreference).where(UserPreference.user_id == HEAVY_USER_ID)
+            conn.execute(base.where(UserPreference.rating == 1)).all()
+            conn.execute(base.where(UserPreference.rating == -1)).all()
+            conn.execute(select(UserPreference.tmdb_id).where(UserPreference.user_id == HEAVY_USER_ID)).all()
+
+    def rate():
+        tmdb_id = rnd.randint(1, 2_000_000)
+        with engine.begin() as conn:
+            existing = conn.execute(
+                select(UserPreference.id).where(
+                    UserPreference.user_id == HEAVY_USER_ID, UserPreference.tmdb_id == tmdb_id
+                )
+            ).first()
+            if existing:
+                conn.execute(
+                    UserPreference.__table__.update().where(UserPreference.id == existing.id).values(rating=1)
+                )
+            else:
+                conn.execute(
+                    insert(UserPreference).values(
+                        user_id=HEAVY_USER_ID, tmdb_id=tmdb_id, media_type="movie", rating=1
+                    )
+                )
+
+    return {"preference_queries": preference_queries, "rate": rate}
+
+
+def _indexed_ops(engine, rnd: random.Random) -> dict:
+    def preference_queries():
+        with engine.connect() as conn:
+            conn.execute(
+                select(UserPreference.tmdb_id, UserPreference.media_type, UserPreference.rating).where(
+                    UserPreference.user_id == HEAVY_USER_ID
+                )
+            ).all()
+
+    def rate():
+        stmt = sqlite_insert(UserPreference).values(
+            user_id=HEAVY_USER_ID, tmdb_id=rnd.randint(1, 2_000_000), media_type="movie", rating=1
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserPreference.user_id, UserPreference.tmdb_id],
+            set_={"rating": stmt.excluded.rating},
+        )
+        with engine.begin() as conn:
+            conn.execute(stmt)
+
+    return {"preference_queries": preference_queries, "rate": rate}
+
+
+def _shared_ops(engine, rnd: random.Random) -> dict:
+    def history_page():
+        with engine.connect() as conn:
+            conn.execute(
+                select(UserPreference)
+                .where(UserPreference.user_id == HEAVY_USER_ID)
+                .order_by(desc(UserPreference.created_at), desc(UserPreference.id))
+                .limit(50)
+            ).all()
+
+    def unrate():
+        with engine.begin() as conn:
+            conn.execute(
+                delete(UserPreference).where(
+                    UserPreference.user_id == HEAVY_USER_ID,
+                    UserPreference.tmdb_id == rnd.randint(1, 2_000_000),
+                )
+            )
+
+    return {"history_page": history_page, "unrate": unrate}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--per-user", type=int, default=500, help="Ratings for every other user.")
+    parser.add_argument("--heavy-ratings", type=int, default=20_000, help="Ratings for the heavy user.")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for legacy in (True, False):
+            engine = _build(
+                os.path.join(tmp, f"{'legacy' if legacy else 'indexed'}.db"),
+                legacy,
+                args.users,
+                args.heavy_ratings,
+                args.per_user,
+            )
+            rnd = random.Random(7)
+            ops = _legacy_ops(engine, rnd) if legacy else _indexed_ops(engine, rnd)
+            ops.update(_shared_ops(engine, rnd))
+            results.append(
+                {
+                    "schema": "legacy" if legacy else "indexed",
+                    "heavy_user_ratings": args.heavy_ratings,
+                    "total_rows": args.heavy_ratings + (args.users - 1) * args.per_user,
+                    **{name: _timed(fn, args.repeat) for name, fn in ops.items()},
+                }
+            )
+            engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
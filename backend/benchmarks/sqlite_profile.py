@@ -0,0 +1,150 @@
+"""
+Compare SQLite throughput with the default rollback-journal settings against
+the tuned profile from `app.database` (WAL, synchronous=NORMAL, busy_timeout,
+cache/mmap sizing).
+
+A few writer threads insert ratings (like the nightly job and rating
+endpoints) while reader threads run the history/preference lookups the API
+does. Run from the backend directory:
+
+    python -m benchmarks.sqlite_profile --seconds 10 --writers 2 --readers 8
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.exc import OperationalError
+
+from app.database import Base, apply_sqlite_pragmas
+from app import models  # noqa: F401
+from app.models import UserPreference
+
+
+def _make_engine(path: str, tuned: bool):
+    url = f"sqlite:///{path}"
+    if tuned:
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": 5},
+            pool_size=16,
+            max_overflow=16,
+        )
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+    else:
+        # Equivalent to the previous engine: default journal, no busy wait.
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": 0},
+            pool_size=16,
+            max_overflow=16,
+        )
+    return engine
+
+
+def _seed(engine, users: int, rows_per_user: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(UserPreference),
+            [
+                {"user_id": u, "tmdb_id": t, "media_type": "movie", "rating": random.choice((1, -1, 0))}
+                for u in range(1, users + 1)
+                for t in range(rows_per_user)
+            ],
+        )
+
+
+def run_profile(tuned: bool, seconds: float, writers: int, readers: int, users: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(os.path.join(tmp, "bench.db"), tuned)
+        _seed(engine, users, 200)
+
+        stop = threading.Event()
+        counts = {"reads": 0, "writes": 0, "locked_errors": 0}
+        lock = threading.Lock()
+
+        def writer(seed: int) -> None:
+            rnd = random.Random(seed)
+            while not stop.is_set():
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(
+                            insert(UserPreference),
+                            [
+                                {
+                                    "user_id": rnd.randint(1, users),
+                                    "tmdb_id": rnd.randint(1, 1_000_000),
+                                    "media_type": "movie",
+                                    "rating": 1,
+                                }
+                                for _ in range(20)
+                            ],
+                        )
+                    key = "writes"
+                except OperationalError:
+                    key = "locked_errors"
+                with lock:
+                    counts[key] += 1
+
+        def reader(seed: int) -> None:
+            rnd = random.Random(seed)
+            while not stop.is_set():
+                try:
+                    with engine.connect() as conn:
+                        stmt = (
+                            select(UserPreference.tmdb_id, UserPreference.rating)
+                            .where(UserPreference.user_id == rnd.randint(1, users))
+                            .order_by(UserPreference.created_at.desc())
+                            .limit(100)
+                        )
+                        conn.execute(stmt).all()
+                    key = "reads"
+                except OperationalError:
+                    key = "locked_errors"
+                with lock:
+                    counts[key] += 1
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        threads += [threading.Thread(target=reader, args=(100 + i,)) for i in range(readers)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        engine.dispose()
+
+    return {
+        "profile": "tuned" if tuned else "default",
+        "seconds": round(elapsed, 2),
+        "reads_per_sec": round(counts["reads"] / elapsed, 1),
+        "write_txns_per_sec": round(counts["writes"] / elapsed, 1),
+        "locked_errors": counts["locked_errors"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    results = [
+        run_profile(tuned, args.seconds, args.writers, args.readers, args.users)
+        for tuned in (False, True)
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
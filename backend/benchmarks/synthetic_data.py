@@ -0,0 +1,339 @@
+"""
+Generate deterministic, production-sized synthetic data for load tests.
+
+Writes two SQLite files into --out:
+
+  sagarr.db     the Sagarr schema (migrated to head) with users, ratings and
+                requests, the admin counters, the TMDb metadata cache and
+                one recommendation run per user;
+  upstreams.db  the title catalog and Tautulli watch history, served by
+                `benchmarks.fake_upstreams --dataset` and used by
+                `benchmarks.upstream_suite --dataset`.
+
+Volumes follow heavy-tailed distributions: per-user activity is Pareto
+distributed (a few users watch and rate far more than the rest) and titles
+are drawn with Zipf popularity skew. The same --seed always produces the
+same data. Run from the backend directory:
+
+    python -m benchmarks.synthetic_data --out /tmp/sagarr-data --users 5000 \\
+        --history 2000000 --preferences 300000 --titles 40000
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fake_upstreams import GENRES
+
+
+BATCH_SIZE = 10_000
+# Pareto shape for per-user activity; lower is more skewed.
+ACTIVITY_ALPHA = 1.2
+# Zipf exponent for title popularity.
+POPULARITY_EXPONENT = 1.07
+TV_SHARE = 0.35
+# Rating mix for user_preferences: like, seen, dislike, requested.
+RATING_WEIGHTS = {1: 0.55, 0: 0.25, -1: 0.12, 2: 0.08}
+# Documentaries are rare in the catalog but get their own lane.
+DOCUMENTARY_GENRE = next(g for g in GENRES if g["name"] == "Documentary")
+CATEGORIES_PER_LANE = {"movies": 12, "tv": 12, "documentaries": 6}
+ITEMS_PER_CATEGORY = 8
+
+
+class Catalog:
+    """
+    Titles 1..N with a media type, genres and Zipf popularity over a
+    shuffled rank, so popular ids are spread across the id range.
+    """
+
+    def __init__(self, rng: random.Random, size: int) -> None:
+        self.size = size
+        self.media_type = {tmdb_id: "tv" if rng.random() < TV_SHARE else "movie" for tmdb_id in range(1, size + 1)}
+        other_genres = [g for g in GENRES if g is not DOCUMENTARY_GENRE]
+        self.genres: dict[int, list[dict]] = {}
+        for tmdb_id in range(1, size + 1):
+            if rng.random() < 0.05:
+                self.genres[tmdb_id] = [DOCUMENTARY_GENRE]
+            else:
+                self.genres[tmdb_id] = rng.sample(other_genres, rng.randint(1, 3))
+        self.by_rank = list(range(1, size + 1))
+        rng.shuffle(self.by_rank)
+        weights = [1 / (rank ** POPULARITY_EXPONENT) for rank in range(1, size + 1)]
+        self.cum_weights = list(itertools.accumulate(weights))
+
+    def title(self, tmdb_id: int) -> str:
+        return f"Title {tmdb_id}"
+
+    def draw(self, rng: random.Random, k: int) -> list[int]:
+        return rng.choices(self.by_rank, cum_weights=self.cum_weights, k=k)
+
+    def draw_distinct(self, rng: random.Random, k: int) -> list[int]:
+        k = min(k, self.size)
+        chosen: dict[int, None] = {}
+        while len(chosen) < k:
+            for tmdb_id in self.draw(rng, k - len(chosen)):
+                chosen[tmdb_id] = None
+        return list(chosen)
+
+
+def _split(rng: random.Random, total: int, weights: list[float], cap: int | None = None) -> list[int]:
+    """
+    Distribute `total` across users proportionally to `weights`.
+    """
+    scale = total / sum(weights)
+    counts = [min(int(w * scale), cap) if cap else int(w * scale) for w in weights]
+    # Hand out the rounding remainder by weight.
+    cum = list(itertools.accumulate(weights))
+    remaining = total - sum(counts)
+    if cap is not None:
+        remaining = min(remaining, sum(cap - c for c in counts))
+    while remaining > 0:
+        i = bisect.bisect_left(cum, rng.random() * cum[-1])
+        if cap is None or counts[i] < cap:
+            counts[i] += 1
+            remaining -= 1
+    return counts
+
+
+def _timestamp(rng: random.Random, now: datetime, days: int) -> datetime:
+    # Skewed towards the recent past.
+    return now - timedelta(seconds=int((rng.random() ** 2) * days * 86400))
+
+
+def _batched(rows, size: int = BATCH_SIZE):
+    iterator = iter(rows)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _create_sagarr_schema(path: str) -> None:
+    # The app reads DATABASE_URL at import time.
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from app.db import init_db
+
+    init_db()
+
+
+def generate(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    now = datetime(2026, 1, 1) if args.fixed_clock else datetime.utcnow()
+    os.makedirs(args.out, exist_ok=True)
+    sagarr_path = os.path.join(args.out, "sagarr.db")
+    upstreams_path = os.path.join(args.out, "upstreams.db")
+    for path in (sagarr_path, upstreams_path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    catalog = Catalog(rng, args.titles)
+    activity = [rng.paretovariate(ACTIVITY_ALPHA) for _ in range(args.users)]
+    history_counts = _split(rng, args.history, activity)
+    # Heavy watchers rate more, but nobody rates more than a fifth of the catalog.
+    preference_counts = _split(rng, args.preferences, [a ** 0.8 for a in activity], cap=max(args.titles // 5, 1))
+
+    _create_sagarr_schema(sagarr_path)
+    sagarr = sqlite3.connect(sagarr_path)
+    sagarr.execute("PRAGMA synchronous=OFF")
+    upstreams = sqlite3.connect(upstreams_path)
+    upstreams.executescript(
+        """
+        PRAGMA journal_mode=OFF;
+        PRAGMA synchronous=OFF;
+        CREATE TABLE titles (tmdb_id INTEGER PRIMARY KEY, media_type TEXT, title TEXT, genres TEXT, popularity_rank INTEGER);
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, friendly_name TEXT, email TEXT);
+        CREATE TABLE history (user_id INTEGER, tmdb_id INTEGER, media_type TEXT, watched_at INTEGER);
+        """
+    )
+
+    started = time.perf_counter()
+    rank_of = {tmdb_id: rank for rank, tmdb_id in enumerate(catalog.by_rank, 1)}
+    upstreams.executemany(
+        "INSERT INTO titles VALUES (?, ?, ?, ?, ?)",
+        (
+            (tmdb_id, catalog.media_type[tmdb_id], catalog.title(tmdb_id), json.dumps(catalog.genres[tmdb_id]), rank_of[tmdb_id])
+            for tmdb_id in range(1, args.titles + 1)
+        ),
+    )
+
+    users = [
+        (user_id, f"user{user_id}", f"user{user_id}@example.com", _timestamp(rng, now, args.days).isoformat(" "))
+        for user_id in range(1, args.users + 1)
+    ]
+    sagarr.executemany(
+        "INSERT INTO users (id, plex_id, username, email, is_admin, tautulli_user_id, created_at, settings) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, '{}')",
+        ((user_id, user_id, name, email, user_id == 1, user_id, created) for user_id, name, email, created in users),
+    )
+    upstreams.executemany(
+        "INSERT INTO users VALUES (?, ?, ?, ?)",
+        ((user_id, name, f"User {user_id}", email) for user_id, name, email, _ in users),
+    )
+
+    # Tautulli history: repeat plays allowed (rewatches, episodes of a show).
+    def history_rows():
+        for user_id, count in enumerate(history_counts, 1):
+            for tmdb_id in catalog.draw(rng, count):
+                watched = _timestamp(rng, now, args.days)
+                yield user_id, tmdb_id, catalog.media_type[tmdb_id], int(watched.timestamp())
+
+    for batch in _batched(history_rows()):
+        upstreams.executemany("INSERT INTO history VALUES (?, ?, ?, ?)", batch)
+    upstreams.executescript(
+        """
+        CREATE INDEX ix_history_user_watched ON history (user_id, watched_at);
+        CREATE TABLE popular AS
+            SELECT CASE media_type WHEN 'tv' THEN 'popular_tv' ELSE 'popular_movies' END AS stat_id,
+                   tmdb_id, COUNT(DISTINCT user_id) AS users_watched
+            FROM history GROUP BY tmdb_id ORDER BY users_watched DESC;
+        CREATE INDEX ix_popular_stat ON popular (stat_id, users_watched);
+        """
+    )
+    upstreams.commit()
+
+    # Ratings and requests: distinct titles per user, popularity skewed.
+    ratings = list(RATING_WEIGHTS)
+    rating_weights = list(RATING_WEIGHTS.values())
+
+    def preference_rows():
+        for user_id, count in enumerate(preference_counts, 1):
+            for tmdb_id in catalog.draw_distinct(rng, count):
+                yield (
+                    user_id,
+                    tmdb_id,
+                    catalog.media_type[tmdb_id],
+                    rng.choices(ratings, rating_weights)[0],
+                    _timestamp(rng, now, args.days).isoformat(" "),
+                )
+
+    for batch in _batched(preference_rows()):
+        sagarr.executemany(
+            "INSERT INTO user_preferences (user_id, tmdb_id, media_type, rating, created_at) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+
+    # Same aggregates migration 0004 backfills, so the counters match.
+    sagarr.execute(
+        "INSERT INTO user_stats (user_id, likes, dislikes, seen, requested, updated_at) "
+        "SELECT user_id, "
+        "SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = -1 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 0 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END), ? "
+        "FROM user_preferences GROUP BY user_id",
+        (now.isoformat(" "),),
+    )
+    sagarr.execute(
+        "INSERT INTO activity_daily (day, ratings, requests) "
+        "SELECT date(created_at), "
+        "SUM(CASE WHEN rating = 2 THEN 0 ELSE 1 END), "
+        "SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END) "
+        "FROM user_preferences GROUP BY date(created_at)"
+    )
+
+    # Metadata cache: the most popular share of the catalog is cached.
+    cached_ids = catalog.by_rank[: int(args.titles * args.metadata_coverage)]
+    fetched_at = now.isoformat(" ")
+    for batch in _batched(
+        (
+            tmdb_id,
+            catalog.media_type[tmdb_id],
+            catalog.title(tmdb_id),
+            "x" * args.overview_bytes,
+            f"/{tmdb_id}.jpg",
+            False,
+            json.dumps(catalog.genres[tmdb_id]),
+            fetched_at,
+        )
+        for tmdb_id in cached_ids
+    ):
+        sagarr.executemany(
+            "INSERT INTO media_metadata (tmdb_id, media_type, title, overview, poster_path, adult, genres, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+
+    # One recommendation run per user, skewed towards popular titles.
+    run_id = category_id = 0
+    items = 0
+    movie_ids = [t for t in catalog.by_rank if catalog.media_type[t] == "movie"]
+    tv_ids = [t for t in catalog.by_rank if catalog.media_type[t] == "tv"]
+    docs = [t for t in catalog.by_rank if catalog.genres[t] == [DOCUMENTARY_GENRE]] or movie_ids
+    pools = {"movies": movie_ids, "tv": tv_ids or movie_ids, "documentaries": docs}
+    for user_batch in _batched(range(1, args.users + 1), 500):
+        runs, categories, run_items = [], [], []
+        for user_id in user_batch:
+            run_id += 1
+            runs.append((run_id, user_id, _timestamp(rng, now, 1).isoformat(" ")))
+            for lane, count in CATEGORIES_PER_LANE.items():
+                pool = pools[lane]
+                for position in range(count):
+                    category_id += 1
+                    categories.append((category_id, run_id, lane, position, f"{lane.title()} picks {position + 1}", ""))
+                    # Bias picks towards the head of the (popularity-ordered) pool.
+                    picks = {pool[int(len(pool) * rng.random() ** 3)] for _ in range(ITEMS_PER_CATEGORY)}
+                    run_items.extend((category_id, pos, tmdb_id) for pos, tmdb_id in enumerate(picks))
+        sagarr.executemany("INSERT INTO recommendation_runs (id, user_id, created_at) VALUES (?, ?, ?)", runs)
+        sagarr.executemany(
+            "INSERT INTO recommendation_categories (id, run_id, lane, position, title, reason) VALUES (?, ?, ?, ?, ?, ?)",
+            categories,
+        )
+        sagarr.executemany(
+            "INSERT INTO recommendation_items (category_id, position, tmdb_id) VALUES (?, ?, ?)", run_items
+        )
+        items += len(run_items)
+
+    sagarr.commit()
+    sagarr.execute("ANALYZE")
+    sagarr.close()
+    upstreams.execute("ANALYZE")
+    upstreams.close()
+
+    top_user = max(range(args.users), key=lambda i: history_counts[i])
+    return {
+        "seed": args.seed,
+        "out": args.out,
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "users": args.users,
+        "titles": args.titles,
+        "history_rows": sum(history_counts),
+        "preference_rows": sum(preference_counts),
+        "metadata_rows": len(cached_ids),
+        "recommendation_items": items,
+        "history_per_user": {
+            "median": sorted(history_counts)[len(history_counts) // 2],
+            "max": history_counts[top_user],
+        },
+        "preferences_per_user": {
+            "median": sorted(preference_counts)[len(preference_counts) // 2],
+            "max": max(preference_counts),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="Directory for sagarr.db and upstreams.db.")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--titles", type=int, default=40000)
+    parser.add_argument("--history", type=int, default=2_000_000, help="Total Tautulli history rows.")
+    parser.add_argument("--preferences", type=int, default=300_000, help="Total user_preferences rows.")
+    parser.add_argument("--days", type=int, default=365, help="Time span of history and ratings.")
+    parser.add_argument("--metadata-coverage", type=float, default=0.8, help="Share of titles in the metadata cache.")
+    parser.add_argument("--overview-bytes", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixed-clock", action="store_true", help="Date everything relative to 2026-01-01 for byte-identical output.")
+    args = parser.parse_args()
+
+    print(json.dumps(generate(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+End-to-end benchmark of the API against local fake upstreams (see
+benchmarks/fake_upstreams.py), so it runs offline and reproducibly.
+
+Measures:
+  - the nightly sweep (`refresh_all_recommendations`) for N users,
+  - `/api/recommendations` cold (empty metadata and feed caches) and warm,
+    plus ETag revalidation,
+  - `/api/media/{id}/status` throughput at a fixed concurrency,
+  - SQLite contention: rating writes from every user while a second sweep
+    writes recommendation runs.
+
+Results are printed (or written with --output) as JSON for tracking over
+time. Run from the backend directory:
+
+    python -m benchmarks.upstream_suite --users 20 --set llm.latency_ms=200 --output bench.json
+
+With --dataset DIR (from benchmarks.synthetic_data) the run starts from a
+copy of DIR/sagarr.db and the fakes serve DIR/upstreams.db; the sweeps then
+cover every user in the dataset and --users picks how many of them make
+requests.
+
+With --replay FILE the LLM calls are answered by a ReplayProvider from a
+fixture recorded with AI_REPLAY_RECORD=true, instead of the fake LLM.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.fake_upstreams import FakeUpstreams, FakeUpstreamServer, apply_overrides, default_configs
+
+
+def _latency(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+async def _timed(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> tuple[float, int]:
+    started = time.perf_counter()
+    resp = await client.request(method, url, **kwargs)
+    return time.perf_counter() - started, resp.status_code
+
+
+async def run_suite(args: argparse.Namespace, fakes: FakeUpstreamServer) -> dict:
+    # The app reads its settings and database URL at import time, so it is
+    # only imported once the environment points at the fakes.
+    from sqlalchemy import delete
+
+    from app.database import AsyncSessionLocal
+    from app.db import init_db
+    from app.main import app
+    from app.models import MediaMetadata, User
+    from app.security import create_access_token
+    from app.services.recommendations import refresh_all_recommendations
+    from app.telemetry import recorder
+
+    init_db()
+    rng = random.Random(args.seed)
+
+    if not args.dataset:
+        async with AsyncSessionLocal() as db:
+            db.add_all(
+                User(plex_id=i, username=f"user{i}", email=f"user{i}@example.com", tautulli_user_id=i)
+                for i in range(1, args.users + 1)
+            )
+            await db.commit()
+    headers = {i: {"Authorization": f"Bearer {create_access_token(i)}"} for i in range(1, args.users + 1)}
+    feed_url = f"/api/recommendations?{args.feed_query}"
+    results: dict = {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        # Nightly sweep over every user.
+        sweep = await refresh_all_recommendations()
+        results["nightly_sweep"] = {
+            "users": sweep.users_total,
+            "failures": sweep.failures,
+            "duration_s": round(sweep.duration_seconds or 0.0, 3),
+            "per_user_ms": round((sweep.duration_seconds or 0.0) * 1000 / max(sweep.users_total, 1), 2),
+        }
+
+        # Cold: nothing cached, so every title is fetched from TMDb.
+        cold: list[float] = []
+        cold_users = list(range(1, min(args.cold_samples, args.users) + 1))
+        for user_id in cold_users:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(MediaMetadata))
+                await db.commit()
+            elapsed, _ = await _timed(client, "GET", feed_url, headers=headers[user_id])
+            cold.append(elapsed)
+        results["recommendations_cold"] = _latency(cold)
+
+        # Warm: the serialized feed is cached; revalidation only checks the ETag.
+        warm: list[float] = []
+        revalidate: list[float] = []
+        etags: dict[int, str] = {}
+        for _ in range(args.warm_requests):
+            user_id = rng.choice(cold_users)
+            started = time.perf_counter()
+            resp = await client.get(feed_url, headers=headers[user_id])
+            warm.append(time.perf_counter() - started)
+            etags[user_id] = resp.headers.get("etag", "")
+            elapsed, _ = await _timed(
+                client, "GET", feed_url, headers={**headers[user_id], "If-None-Match": etags[user_id]}
+            )
+            revalidate.append(elapsed)
+        results["recommendations_warm"] = _latency(warm)
+        results["recommendations_revalidate"] = _latency(revalidate)
+
+        # Availability lookups at fixed concurrency.
+        status_samples: list[float] = []
+        status_codes: dict[int, int] = {}
+        deadline = time.perf_counter() + args.seconds
+
+        async def status_worker() -> None:
+            while time.perf_counter() < deadline:
+                tmdb_id = rng.randrange(1, 5000)
+                elapsed, code = await _timed(client, "GET", f"/api/media/{tmdb_id}/status")
+                status_samples.append(elapsed)
+                status_codes[code] = status_codes.get(code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(status_worker() for _ in range(args.concurrency)))
+        results["media_status"] = {
+            "concurrency": args.concurrency,
+            "requests_per_s": round(len(status_samples) / (time.perf_counter() - started), 1),
+            "status_codes": status_codes,
+            "latency": _latency(status_samples),
+        }
+
+        # Ratings from every user while a sweep writes runs.
+        rating_samples: list[float] = []
+        rating_errors = 0
+        sweep_task = asyncio.create_task(refresh_all_recommendations())
+
+        async def rater(user_id: int) -> None:
+            nonlocal rating_errors
+            while not sweep_task.done():
+                body = {"rating": rng.choice(["up", "down"]), "media_type": "movie"}
+                elapsed, code = await _timed(
+                    client, "POST", f"/api/media/{rng.randrange(1, 5000)}/rate", json=body, headers=headers[user_id]
+                )
+                rating_samples.append(elapsed)
+                if code != 200:
+                    rating_errors += 1
+                await asyncio.sleep(args.rating_interval_ms / 1000)
+
+        await asyncio.gather(*(rater(user_id) for user_id in headers))
+        contended = sweep_task.result()
+        results["sqlite_contention"] = {
+            "writers": len(headers),
+            "rating_errors": rating_errors,
+            "rating_latency": _latency(rating_samples),
+            "sweep_duration_s": round(contended.duration_seconds or 0.0, 3),
+            "sweep_failures": contended.failures,
+        }
+
+    results["upstreams"] = {
+        service: {
+            "errors": sum(1 for _, _, ok in samples if not ok),
+            **_latency([seconds for _, seconds, _ in samples]),
+        }
+        for service, samples in sorted(recorder.upstream_samples().items())
+    }
+    results["fake_requests"] = dict(fakes.upstreams.requests)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--cold-samples", type=int, default=5, help="Users measured with empty caches.")
+    parser.add_argument("--warm-requests", type=int, default=200)
+    parser.add_argument("--feed-query", default="lane=movies&limit=5", help="Query string for /api/recommendations.")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of the media status phase.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rating-interval-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dataset", help="Directory written by benchmarks.synthetic_data.")
+    parser.add_argument("--replay", help="LLM fixture (JSON lines) to replay instead of calling the fake LLM.")
+    parser.add_argument("--replay-latency-ms", type=float, default=0.0)
+    parser.add_argument("--replay-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--set", action="append", default=[], metavar="SERVICE.FIELD=VALUE",
+                        help="Fake upstream override, e.g. tmdb.latency_ms=80 or llm.error_rate=0.1.")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    configs = default_configs()
+    apply_overrides(configs, args.set)
+
+    upstreams_db = os.path.join(args.dataset, "upstreams.db") if args.dataset else None
+    fakes_app = FakeUpstreams(configs, seed=args.seed, dataset=upstreams_db)
+    with tempfile.TemporaryDirectory() as tmp, FakeUpstreamServer(fakes_app) as fakes:
+        db_path = os.path.join(tmp, "bench.db")
+        if args.dataset:
+            shutil.copyfile(os.path.join(args.dataset, "sagarr.db"), db_path)
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ.update(fakes.env())
+        if args.replay:
+            os.environ.update(
+                AI_PROVIDER="replay",
+                AI_REPLAY_PATH=os.path.abspath(args.replay),
+                AI_REPLAY_LATENCY_MS=str(args.replay_latency_ms),
+                AI_REPLAY_TOKENS_PER_SECOND=str(args.replay_tokens_per_second),
+            )
+        started = time.perf_counter()
+        results = asyncio.run(run_suite(args, fakes))
+
+    report = {
+        "benchmark": "upstream_suite",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "parameters": {key: value for key, value in vars(args).items() if key not in {"set", "output"}},
+        "fakes": {name: asdict(config) for name, config in configs.items()},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Idempotent building blocks for revisions. Databases created before
+migrations existed already have some of these tables and indexes, so every
+operation checks first instead of failing.
+"""
+from collections.abc import Callable
+from typing import Any
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def has_column(table: str, column: str) -> bool:
+    return any(c["name"] == column for c in sa.inspect(op.get_bind()).get_columns(table))
+
+
+def has_index(table: str, name: str) -> bool:
+    return any(ix["name"] == name for ix in sa.inspect(op.get_bind()).get_indexes(table))
+
+
+def create_table_if_missing(name: str, *columns: Any, **kw: Any) -> bool:
+    """
+    Create a table unless it already exists. Returns True if it was created.
+    """
+    if has_table(name):
+        return False
+    op.create_table(name, *columns, **kw)
+    return True
+
+
+def create_index_online(name: str, table: str, columns: list[str], unique: bool = False) -> None:
+    """
+    Create an index without blocking readers where the backend allows it.
+
+    On PostgreSQL this is CREATE INDEX CONCURRENTLY outside the migration
+    transaction. SQLite has no concurrent build; in WAL mode readers carry
+    on and writers wait up to busy_timeout, and the revision commits on its
+    own so the lock is held only for the build.
+    """
+    if has_index(table, name):
+        return
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+    else:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def backfill(
+    select_sql: str,
+    handle_batch: Callable[[sa.Connection, list[sa.Row]], None],
+    key: str = "id",
+    batch_size: int = 500,
+) -> int:
+    """
+    Walk `select_sql` in keyset batches and pass each batch to
+    `handle_batch`. The query must accept a `:after` parameter, filter on
+    `key > :after` and order by `key`. Returns the number of rows seen.
+    """
+    bind = op.get_bind()
+    after: Any = 0
+    seen = 0
+    while True:
+        rows = bind.execute(sa.text(select_sql + " LIMIT :limit"), {"after": after, "limit": batch_size}).all()
+        if not rows:
+            return seen
+        handle_batch(bind, rows)
+        seen += len(rows)
+        after = getattr(rows[-1], key)
+
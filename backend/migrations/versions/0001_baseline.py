@@ -0,0 +1,76 @@
+"""Baseline schema from 0.1.0
+
+Creates the original tables on fresh databases and brings pre-migration
+databases to the same shape (replacing the one-off migrate_settings.py).
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-11-25
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import create_index_online, create_table_if_missing, has_column
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_table_if_missing(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("plex_id", sa.Integer(), nullable=True),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("thumb", sa.String(), nullable=True),
+        sa.Column("auth_token", sa.String(), nullable=True),
+        sa.Column("is_admin", sa.Boolean(), nullable=True),
+        sa.Column("tautulli_user_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column("settings", sa.Text(), nullable=True),
+    )
+    if not has_column("users", "settings"):
+        with op.batch_alter_table("users") as batch:
+            batch.add_column(sa.Column("settings", sa.Text(), server_default="{}", nullable=True))
+    create_index_online("ix_users_id", "users", ["id"])
+    create_index_online("ix_users_plex_id", "users", ["plex_id"], unique=True)
+    create_index_online("ix_users_username", "users", ["username"], unique=True)
+    create_index_online("ix_users_email", "users", ["email"], unique=True)
+
+    create_table_if_missing(
+        "recommendation_cache",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("recommendations", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    create_index_online("ix_recommendation_cache_id", "recommendation_cache", ["id"])
+
+    create_table_if_missing(
+        "user_preferences",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("tmdb_id", sa.Integer(), nullable=True),
+        sa.Column("media_type", sa.String(), nullable=True),
+        sa.Column("rating", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    create_index_online("ix_user_preferences_id", "user_preferences", ["id"])
+    create_index_online("ix_user_preferences_tmdb_id", "user_preferences", ["tmdb_id"])
+
+    create_table_if_missing(
+        "app_settings",
+        sa.Column("key", sa.String(), primary_key=True),
+        sa.Column("value", sa.Text(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    create_index_online("ix_app_settings_key", "app_settings", ["key"])
+
+
+def downgrade() -> None:
+    for table in ("app_settings", "user_preferences", "recommendation_cache", "users"):
+        op.drop_table(table)
@@ -0,0 +1,155 @@
+"""Metadata cache and normalized recommendation runs
+
+Adds media_metadata and the recommendation_runs / categories / items tables,
+and backfills each user's newest recommendation_cache blob as a run.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import backfill, create_index_online, create_table_if_missing
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+LANES = ("movies", "tv", "documentaries")
+
+
+def upgrade() -> None:
+    create_table_if_missing(
+        "media_metadata",
+        sa.Column("tmdb_id", sa.Integer(), primary_key=True),
+        sa.Column("media_type", sa.String(), primary_key=True),
+        sa.Column("title", sa.String(), nullable=True),
+        sa.Column("overview", sa.Text(), nullable=True),
+        sa.Column("poster_path", sa.String(), nullable=True),
+        sa.Column("adult", sa.Boolean(), nullable=True),
+        sa.Column("genres", sa.Text(), nullable=True),
+        sa.Column("fetched_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+
+    create_table_if_missing(
+        "recommendation_runs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    create_index_online("ix_recommendation_runs_id", "recommendation_runs", ["id"])
+    create_index_online(
+        "ix_recommendation_runs_user_created", "recommendation_runs", ["user_id", "created_at"]
+    )
+
+    create_table_if_missing(
+        "recommendation_categories",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "run_id",
+            sa.Integer(),
+            sa.ForeignKey("recommendation_runs.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("lane", sa.String(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("reason", sa.Text(), nullable=True),
+    )
+    create_index_online(
+        "ix_recommendation_categories_run_lane_position",
+        "recommendation_categories",
+        ["run_id", "lane", "position"],
+    )
+
+    create_table_if_missing(
+        "recommendation_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "category_id",
+            sa.Integer(),
+            sa.ForeignKey("recommendation_categories.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.Column("tmdb_id", sa.Integer(), nullable=False),
+    )
+    create_index_online(
+        "ix_recommendation_items_category_position", "recommendation_items", ["category_id", "position"]
+    )
+
+    # Carry over the newest cached feed for users that have no run yet.
+    backfill(
+        "SELECT c.id, c.user_id, c.recommendations, c.created_at FROM recommendation_cache c "
+        "WHERE c.id > :after "
+        "AND c.id = (SELECT MAX(id) FROM recommendation_cache WHERE user_id = c.user_id) "
+        "AND NOT EXISTS (SELECT 1 FROM recommendation_runs r WHERE r.user_id = c.user_id) "
+        "ORDER BY c.id",
+        _copy_cache_rows,
+        batch_size=100,
+    )
+
+
+def _copy_cache_rows(bind: sa.Connection, rows: list[sa.Row]) -> None:
+    for row in rows:
+        try:
+            payload = json.loads(row.recommendations or "{}")
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(payload, dict):
+            continue
+        run_id = bind.execute(
+            sa.text("INSERT INTO recommendation_runs (user_id, created_at) VALUES (:user_id, :created_at)"),
+            {"user_id": row.user_id, "created_at": row.created_at},
+        ).lastrowid
+        for lane in LANES:
+            raw_categories = payload.get(lane) or []
+            # Blobs from before the lanes split only have "categories",
+            # which the old router served as movies.
+            if lane == "movies" and not raw_categories:
+                raw_categories = payload.get("categories") or []
+            position = 0
+            for cat in raw_categories if isinstance(raw_categories, list) else []:
+                if not isinstance(cat, dict):
+                    continue
+                category_id = bind.execute(
+                    sa.text(
+                        "INSERT INTO recommendation_categories (run_id, lane, position, title, reason) "
+                        "VALUES (:run_id, :lane, :position, :title, :reason)"
+                    ),
+                    {
+                        "run_id": run_id,
+                        "lane": lane,
+                        "position": position,
+                        "title": str(cat.get("title") or "Recommendations"),
+                        "reason": str(cat.get("reason") or ""),
+                    },
+                ).lastrowid
+                position += 1
+                tmdb_ids = []
+                for raw_id in cat.get("items") or []:
+                    try:
+                        tmdb_ids.append(int(raw_id))
+                    except (TypeError, ValueError):
+                        continue
+                if tmdb_ids:
+                    bind.execute(
+                        sa.text(
+                            "INSERT INTO recommendation_items (category_id, position, tmdb_id) "
+                            "VALUES (:category_id, :position, :tmdb_id)"
+                        ),
+                        [
+                            {"category_id": category_id, "position": pos, "tmdb_id": tmdb_id}
+                            for pos, tmdb_id in enumerate(tmdb_ids)
+                        ],
+                    )
+
+
+def downgrade() -> None:
+    for table in ("recommendation_items", "recommendation_categories", "recommendation_runs", "media_metadata"):
+        op.drop_table(table)
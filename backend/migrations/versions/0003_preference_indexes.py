@@ -0,0 +1,36 @@
+"""Composite user_preferences indexes
+
+Collapses duplicate (user_id, tmdb_id) rows to the newest one, then adds the
+unique upsert target and the history index.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+from migrations.helpers import create_index_online
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "DELETE FROM user_preferences WHERE id NOT IN "
+        "(SELECT MAX(id) FROM user_preferences GROUP BY user_id, tmdb_id)"
+    )
+    create_index_online(
+        "uq_user_preferences_user_tmdb", "user_preferences", ["user_id", "tmdb_id"], unique=True
+    )
+    create_index_online(
+        "ix_user_preferences_user_created", "user_preferences", ["user_id", "created_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_preferences_user_created", table_name="user_preferences")
+    op.drop_index("uq_user_preferences_user_tmdb", table_name="user_preferences")
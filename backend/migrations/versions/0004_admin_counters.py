@@ -0,0 +1,61 @@
+"""Admin statistics counters
+
+Adds user_stats and activity_daily and backfills them from user_preferences.
+Afterwards they are maintained by every preference write.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import create_table_if_missing
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if create_table_if_missing(
+        "user_stats",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("likes", sa.Integer(), nullable=False),
+        sa.Column("dislikes", sa.Integer(), nullable=False),
+        sa.Column("seen", sa.Integer(), nullable=False),
+        sa.Column("requested", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    ):
+        op.execute(
+            "INSERT INTO user_stats (user_id, likes, dislikes, seen, requested) "
+            "SELECT user_id, "
+            "SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END), "
+            "SUM(CASE WHEN rating = -1 THEN 1 ELSE 0 END), "
+            "SUM(CASE WHEN rating = 0 THEN 1 ELSE 0 END), "
+            "SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END) "
+            "FROM user_preferences WHERE user_id IS NOT NULL GROUP BY user_id"
+        )
+
+    if create_table_if_missing(
+        "activity_daily",
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("ratings", sa.Integer(), nullable=False),
+        sa.Column("requests", sa.Integer(), nullable=False),
+    ):
+        # Only the latest action per title survives in user_preferences, so
+        # days before the counters existed are a lower bound.
+        op.execute(
+            "INSERT INTO activity_daily (day, ratings, requests) "
+            "SELECT date(created_at), "
+            "SUM(CASE WHEN rating = 2 THEN 0 ELSE 1 END), "
+            "SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END) "
+            "FROM user_preferences WHERE created_at IS NOT NULL GROUP BY date(created_at)"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("activity_daily")
+    op.drop_table("user_stats")
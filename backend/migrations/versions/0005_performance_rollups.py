@@ -0,0 +1,50 @@
+"""Performance rollups
+
+Adds performance_rollups, the periodic summary of upstream latency,
+generation times, LLM token usage and cache hit ratios behind
+GET /api/admin/performance.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import create_index_online, create_table_if_missing
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_table_if_missing(
+        "performance_rollups",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("period_start", sa.DateTime(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("subject", sa.String(), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("errors", sa.Integer(), nullable=False),
+        sa.Column("hits", sa.Integer(), nullable=False),
+        sa.Column("p50_ms", sa.Float(), nullable=True),
+        sa.Column("p95_ms", sa.Float(), nullable=True),
+        sa.Column("p99_ms", sa.Float(), nullable=True),
+        sa.Column("max_ms", sa.Float(), nullable=True),
+        sa.Column("total_ms", sa.Float(), nullable=True),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=False),
+        sa.Column("completion_tokens", sa.Integer(), nullable=False),
+        sa.Column("cost_usd", sa.Float(), nullable=True),
+    )
+    create_index_online(
+        "ix_performance_rollups_kind_period", "performance_rollups", ["kind", "period_start"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_performance_rollups_kind_period", table_name="performance_rollups")
+    op.drop_table("performance_rollups")
@@ -0,0 +1,50 @@
+"""Media request outbox
+
+Adds media_request_outbox: requests are stored here and answered right
+away, then submitted to Overseerr by a background worker with retries.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import create_index_online, create_table_if_missing
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_table_if_missing(
+        "media_request_outbox",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("tmdb_id", sa.Integer(), nullable=False),
+        sa.Column("media_type", sa.String(length=10), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("submitted_at", sa.DateTime(), nullable=True),
+    )
+    create_index_online(
+        "uq_media_request_outbox_user_media",
+        "media_request_outbox",
+        ["user_id", "tmdb_id", "media_type"],
+        unique=True,
+    )
+    create_index_online(
+        "ix_media_request_outbox_status_due", "media_request_outbox", ["status", "next_attempt_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_request_outbox_status_due", table_name="media_request_outbox")
+    op.drop_index("uq_media_request_outbox_user_media", table_name="media_request_outbox")
+    op.drop_table("media_request_outbox")
@@ -0,0 +1,33 @@
+"""User preference version
+
+Adds users.preference_version, bumped with every rating write so the
+feed and exclusion caches validate with one integer instead of
+rescanning user_preferences.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_column
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_column("users", "preference_version"):
+        with op.batch_alter_table("users") as batch:
+            batch.add_column(
+                sa.Column("preference_version", sa.Integer(), server_default="0", nullable=False)
+            )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("preference_version")
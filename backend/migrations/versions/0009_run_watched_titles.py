@@ -0,0 +1,58 @@
+"""Watched titles per recommendation run
+
+Adds recommendation_runs.watched_titles, the normalized titles from the
+user's watch history at generation time, so feeds hide titles the model
+recommended despite the prompt. Runs carried over from
+recommendation_cache get the titles stored in their blob.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import backfill, has_column
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_column("recommendation_runs", "watched_titles"):
+        with op.batch_alter_table("recommendation_runs") as batch:
+            batch.add_column(sa.Column("watched_titles", sa.Text(), nullable=True))
+
+    backfill(
+        "SELECT r.id, c.recommendations FROM recommendation_runs r "
+        "JOIN recommendation_cache c ON c.user_id = r.user_id AND c.created_at = r.created_at "
+        "WHERE r.id > :after AND r.watched_titles IS NULL "
+        "ORDER BY r.id",
+        _copy_watched_titles,
+    )
+
+
+def _copy_watched_titles(bind: sa.Connection, rows: list[sa.Row]) -> None:
+    for row in rows:
+        try:
+            payload = json.loads(row.recommendations or "{}")
+        except json.JSONDecodeError:
+            continue
+        titles = payload.get("watched_titles") if isinstance(payload, dict) else None
+        if not isinstance(titles, list):
+            continue
+        normalized = sorted({t.strip().lower() for t in titles if isinstance(t, str) and t.strip()})
+        bind.execute(
+            sa.text("UPDATE recommendation_runs SET watched_titles = :titles WHERE id = :id"),
+            {"titles": json.dumps(normalized), "id": row.id},
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("recommendation_runs") as batch:
+        batch.drop_column("watched_titles")
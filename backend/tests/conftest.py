@@ -0,0 +1,121 @@
+"""
+Tests run against a throwaway SQLite database migrated to head once per
+session; each test gets freshly emptied tables.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="sagarr-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/sagarr.db"
+os.environ.setdefault("AI_API_KEY", "sk-test")
+
+from datetime import datetime
+
+import httpx
+import pytest
+from sqlalchemy import delete
+
+from app.database import AsyncSessionLocal, Base, async_engine
+from app.db import init_db
+from app.main import app
+from app.models import MediaMetadata, RecommendationRun, User
+from app.security import clear_auth_cache, create_access_token
+from app.services import preferences, recommendations
+from app.services.feed_cache import feed_cache
+
+
+@pytest.fixture(scope="session")
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def migrated_db() -> None:
+    init_db()
+
+
+@pytest.fixture(autouse=True)
+async def clean_tables(anyio_backend):
+    yield
+    async with AsyncSessionLocal() as db:
+        for table in reversed(Base.metadata.sorted_tables):
+            await db.execute(delete(table))
+        await db.commit()
+    # Pooled aiosqlite connections belong to this test's event loop.
+    await async_engine.dispose()
+    # SQLite reuses the IDs of deleted rows, so per-process caches keyed by
+    # user ID would leak into the next test.
+    clear_auth_cache()
+    feed_cache._entries.clear()
+    preferences._rated_ids_cache.clear()
+    recommendations._generation_tasks.clear()
+
+
+@pytest.fixture
+async def user(anyio_backend) -> User:
+    async with AsyncSessionLocal() as db:
+        row = User(plex_id=1, username="alice", email="alice@example.com")
+        db.add(row)
+        await db.commit()
+    return row
+
+
+@pytest.fixture
+def auth_headers(user) -> dict[str, str]:
+    return {"Authorization": f"Bearer {create_access_token(user.id)}"}
+
+
+@pytest.fixture
+async def client(anyio_backend) -> httpx.AsyncClient:
+    # No lifespan: startup would run migrations again and start the loops.
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def make_run(anyio_backend):
+    """
+    Store a recommendation run: `await make_run(user_id, movies=[...])`
+    with lanes given as the AI's category dicts.
+    """
+
+    async def make(user_id: int | None, created_at: datetime | None = None, **lanes: list[dict]) -> RecommendationRun:
+        run = RecommendationRun(user_id=user_id, created_at=created_at or datetime.utcnow())
+        run.categories = [
+            category
+            for lane, raw in lanes.items()
+            for category in recommendations._build_categories(lane, raw)
+        ]
+        async with AsyncSessionLocal() as db:
+            db.add(run)
+            await db.commit()
+        return run
+
+    return make
+
+
+@pytest.fixture
+def cache_metadata(anyio_backend):
+    """
+    Put fresh TMDb details in the metadata cache so feeds are enriched
+    without calling TMDb: `await cache_metadata("movie", {603: "The Matrix"})`.
+    """
+
+    async def cache(media_type: str, titles: dict[int, str], **fields) -> None:
+        async with AsyncSessionLocal() as db:
+            for tmdb_id, title in titles.items():
+                db.add(
+                    MediaMetadata(
+                        tmdb_id=tmdb_id,
+                        media_type=media_type,
+                        title=title,
+                        adult=False,
+                        genres="[]",
+                        fetched_at=datetime.utcnow(),
+                        **fields,
+                    )
+                )
+            await db.commit()
+
+    return cache
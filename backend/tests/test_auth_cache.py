@@ -0,0 +1,97 @@
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import security
+from app.database import AsyncSessionLocal, async_engine
+from app.models import User
+from app.security import create_access_token
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def user_queries() -> list[str]:
+    """
+    SELECTs against the users table issued while the test runs.
+    """
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+async def get_settings(client, headers):
+    return await client.get("/api/user/settings", headers=headers)
+
+
+async def test_repeated_requests_reuse_the_decoded_token_and_user(client, auth_headers, user, user_queries):
+    assert (await get_settings(client, auth_headers)).status_code == 200
+    assert (await get_settings(client, auth_headers)).status_code == 200
+    assert (await get_settings(client, auth_headers)).status_code == 200
+
+    assert len(user_queries) == 1
+
+
+async def test_cached_user_can_be_modified_by_the_handler(client, auth_headers, user):
+    await get_settings(client, auth_headers)
+
+    saved = await client.post("/api/user/settings", headers=auth_headers, json={"date_cutoff": 2000})
+    again = await get_settings(client, auth_headers)
+
+    assert saved.status_code == 200
+    assert again.json() == {"date_cutoff": 2000}
+
+
+async def test_committed_user_changes_drop_the_snapshot(client, auth_headers, user):
+    assert (await client.get("/api/admin/stats", headers=auth_headers)).status_code == 403
+
+    async with AsyncSessionLocal() as db:
+        row = await db.get(User, user.id)
+        row.is_admin = True
+        await db.commit()
+
+    assert (await client.get("/api/admin/stats", headers=auth_headers)).status_code == 200
+
+
+async def test_deleted_user_is_rejected(client, auth_headers, user):
+    await get_settings(client, auth_headers)
+    async with AsyncSessionLocal() as db:
+        await db.delete(await db.get(User, user.id))
+        await db.commit()
+
+    response = await get_settings(client, auth_headers)
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "User not found"
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "not-a-jwt",
+        create_access_token(1, expires_delta=timedelta(seconds=-1)),
+        security.jwt.encode({"sub": "1"}, "another-secret", algorithm="HS256"),
+    ],
+)
+async def test_invalid_tokens_are_rejected(client, user, token):
+    response = await get_settings(client, {"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 401
+    assert token not in security._token_cache
+
+
+async def test_cached_decode_never_outlives_the_token(client, user):
+    token = create_access_token(user.id, expires_delta=timedelta(seconds=5))
+
+    await get_settings(client, {"Authorization": f"Bearer {token}"})
+
+    _, cached_until = security._token_cache[token]
+    assert cached_until <= time.monotonic() + 5
@@ -0,0 +1,137 @@
+from datetime import datetime
+
+import pytest
+
+from app.config import settings_store
+from app.database import AsyncSessionLocal
+from app.models import MediaMetadata
+from app.services.content_filter import AdultContentFilter, tmdb_id_from_guid
+
+
+@pytest.fixture
+def content_filter() -> AdultContentFilter:
+    return AdultContentFilter()
+
+
+@pytest.fixture
+def restore_settings():
+    keys = ("ADULT_KEYWORDS", "ADULT_ALLOWLIST", "ADULT_CONTENT_RATINGS")
+    saved = {key: getattr(settings_store.current, key) for key in keys}
+    yield
+    settings_store.update(**saved)
+
+
+def looks_adult(content_filter: AdultContentFilter, **item) -> bool:
+    return content_filter.looks_adult(item)[0]
+
+
+@pytest.mark.parametrize(
+    "item",
+    [
+        # Caught by the original substring check and still caught.
+        {"title": "Hot XXX Night"},
+        {"title": "Pornography"},
+        {"title": "The Pornstar Diaries"},
+        {"title": "Pornographic Tales"},
+        {"genres": ["Erotica"]},
+        {"genres": ["Erotic Thriller"]},
+        {"section_name": "Adult"},
+        {"library_name": "Adult Movies"},
+        {"grandparent_title": "Hentai Collection"},
+        {"tagline": "An adult film"},
+    ],
+)
+def test_keywords_match_words_starting_with_them(content_filter, item):
+    assert looks_adult(content_filter, **item)
+
+
+@pytest.mark.parametrize(
+    "item",
+    [
+        {"section_name": "Adult Swim", "grandparent_title": "Rick and Morty"},
+        {"genres": ["Young Adult", "Drama"]},
+        {"genres": ["Adult Animation"]},
+        {"title": "Adulthood"},
+        {"title": "Fatal Attraction", "genres": ["Adultery"]},
+        {"title": "Scunthorpe United"},
+        {"title": "Hexxxagon"},
+        {"title": "The Matrix", "section_name": "Movies", "genres": ["Action", "Science Fiction"]},
+    ],
+)
+def test_allowlist_and_embedded_keywords_are_kept(content_filter, item):
+    assert not looks_adult(content_filter, **item)
+
+
+def test_allowlist_only_exempts_the_phrase(content_filter):
+    assert looks_adult(content_filter, section_name="Adult Swim", title="Porn Parody")
+
+
+def test_fields_are_not_joined_into_words(content_filter):
+    # "X" at the end of one field and "XX" at the start of the next.
+    assert not looks_adult(content_filter, title="Malcolm X", grandparent_title="XX Files")
+
+
+def test_content_rating(content_filter):
+    assert looks_adult(content_filter, title="Anything", content_rating="X")
+    assert looks_adult(content_filter, title="Anything", content_rating=" xxx ")
+    assert not looks_adult(content_filter, title="Anything", content_rating="R")
+
+
+def test_verdicts_are_cached_per_rating_key(content_filter):
+    item = {"rating_key": 42, "title": "Pornography"}
+    assert content_filter.looks_adult(item) == (True, False)
+    assert content_filter.looks_adult(item) == (True, True)
+    assert content_filter.looks_adult({"title": "Pornography"}) == (True, False)
+
+
+def test_settings_change_rebuilds_patterns_and_clears_cache(content_filter, restore_settings):
+    assert content_filter.looks_adult({"rating_key": 1, "title": "Cartoons"}) == (False, False)
+
+    settings_store.update(ADULT_KEYWORDS="cartoon", ADULT_ALLOWLIST="")
+
+    assert content_filter.looks_adult({"rating_key": 1, "title": "Cartoons"}) == (True, False)
+    assert not looks_adult(content_filter, title="Pornography")
+
+
+def test_empty_keyword_list_disables_keyword_matching(content_filter, restore_settings):
+    settings_store.update(ADULT_KEYWORDS="")
+    assert not looks_adult(content_filter, title="Pornography")
+    assert looks_adult(content_filter, title="Anything", content_rating="X")
+
+
+@pytest.mark.parametrize(
+    "item, expected",
+    [
+        ({"guid": "com.plexapp.agents.themoviedb://603?lang=en"}, 603),
+        ({"guid": "com.plexapp.agents.themoviedb://1399/1/2?lang=en"}, 1399),
+        ({"guid": "plex://movie/5d776825880197001ec967c0", "guids": ["imdb://tt0133093", "tmdb://603"]}, 603),
+        ({"guid": "plex://show/5d9c086c46115600200aa2fe", "guids": [{"id": "tvdb://121361"}, {"id": "tmdb://1399"}]}, 1399),
+        ({"guid": "plex://movie/5d776825880197001ec967c0"}, None),
+        ({"guid": "com.plexapp.agents.imdb://tt0133093?lang=en"}, None),
+        ({}, None),
+    ],
+)
+def test_tmdb_id_from_guid(item, expected):
+    assert tmdb_id_from_guid(item) == expected
+
+
+@pytest.mark.anyio
+async def test_filter_history_drops_titles_tmdb_flags_adult(content_filter):
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        db.add(MediaMetadata(tmdb_id=777, media_type="movie", title="Flagged", adult=True, fetched_at=now))
+        db.add(MediaMetadata(tmdb_id=888, media_type="movie", title="Clean", adult=False, fetched_at=now))
+        await db.commit()
+    rows = [
+        {"title": "Legacy agent", "media_type": "movie", "guid": "com.plexapp.agents.themoviedb://777?lang=en"},
+        {"title": "Modern agent", "media_type": "movie", "guid": "plex://movie/abc", "guids": ["tmdb://777"]},
+        # Same ID, but the flagged metadata is for a movie, not a show.
+        {"title": "Episode", "media_type": "episode", "guid": "com.plexapp.agents.themoviedb://777/1/1"},
+        {"title": "Clean", "media_type": "movie", "guids": ["tmdb://888"]},
+        {"title": "Pornography", "rating_key": 5},
+        {"title": "Unknown", "rating_key": 6},
+    ]
+
+    kept = await content_filter.filter_history(rows)
+
+    assert [row["title"] for row in kept] == ["Episode", "Clean", "Unknown"]
@@ -0,0 +1,33 @@
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+
+from app.db import ALEMBIC_INI
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def test_concurrent_workers_migrate_a_fresh_database_once(tmp_path):
+    db_path = tmp_path / "sagarr.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}"}
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-c", "from app.db import init_db; init_db()"],
+            cwd=BACKEND,
+            env=env,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(4)
+    ]
+    errors = [worker.communicate(timeout=120)[1] for worker in workers]
+
+    assert [worker.returncode for worker in workers] == [0] * 4, "\n".join(errors)
+    head = ScriptDirectory.from_config(Config(str(ALEMBIC_INI))).get_current_head()
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute("SELECT version_num FROM alembic_version").fetchall() == [(head,)]
@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+import pytest
+
+from app.services import events
+from app.services.events import (
+    event_bus,
+    publish_everywhere,
+    refresh_watched_availability,
+    relay_shared_events,
+    sync_watched_availability,
+)
+from app.services.overseerr import overseerr_service
+from app.services.shared_cache import put_shared, scan_shared
+
+pytestmark = pytest.mark.anyio
+
+TTL = timedelta(minutes=5)
+
+
+class FakeOverseerr:
+    def __init__(self) -> None:
+        self.statuses: dict[int, str] = {}
+        self.checked: list[int] = []
+
+    async def check_availability(self, tmdb_id: int, media_type: str) -> dict:
+        self.checked.append(tmdb_id)
+        return {"status": self.statuses.get(tmdb_id, "MISSING")}
+
+
+@pytest.fixture
+def overseerr(monkeypatch) -> FakeOverseerr:
+    fake = FakeOverseerr()
+    monkeypatch.setattr(overseerr_service, "configured", True)
+    monkeypatch.setattr(overseerr_service, "check_availability", fake.check_availability)
+    # The bus is process-wide; start every test without remembered items.
+    monkeypatch.setattr(event_bus, "_watched", {})
+    monkeypatch.setattr(event_bus, "_availability", {})
+    return fake
+
+
+async def test_leader_checks_items_watched_on_every_worker_once(user, overseerr):
+    async with event_bus.subscribe(user.id) as queue:
+        event_bus.watch(user.id, [("movie", 10), ("tv", 20)])
+        await sync_watched_availability("worker-a", TTL)
+        # Another worker's connected users watch an overlapping set.
+        await put_shared("watched_items:worker-b", [["movie", 10], ["movie", 30]], TTL)
+
+        assert await refresh_watched_availability(TTL) == 3
+        assert sorted(overseerr.checked) == [10, 20, 30]
+        await sync_watched_availability("worker-a", TTL)
+        assert queue.empty()
+
+        overseerr.statuses[10] = "AVAILABLE"
+        overseerr.statuses[30] = "AVAILABLE"
+        await refresh_watched_availability(TTL)
+        await sync_watched_availability("worker-a", TTL)
+
+        event = queue.get_nowait()
+        assert (event.name, event.data) == ("availability", {"tmdb_id": 10, "media_type": "movie", "status": "available"})
+        # Item 30 is only watched on the other worker.
+        assert queue.empty()
+
+
+async def test_nothing_is_checked_without_overseerr(user, overseerr, monkeypatch):
+    monkeypatch.setattr(overseerr_service, "configured", False)
+    await put_shared("watched_items:worker-b", [["movie", 10]], TTL)
+
+    assert await refresh_watched_availability(TTL) == 0
+    assert overseerr.checked == []
+
+
+@pytest.fixture
+def relayed(monkeypatch) -> dict[str, float]:
+    # Shared event keys this "worker" has already published.
+    keys: dict[str, float] = {}
+    monkeypatch.setattr(events, "_relayed", keys)
+    return keys
+
+
+async def test_events_from_other_workers_reach_local_streams_once(user, relayed):
+    # What publish_everywhere on another worker leaves in the shared cache.
+    await put_shared(
+        "events:2026-10-18T12:00:00:b",
+        [[user.id, "request", {"tmdb_id": 10, "media_type": "movie", "status": "requested"}]],
+        TTL,
+    )
+    await put_shared("events:2026-10-18T12:00:01:b", [[user.id, "recommendations", {"run_id": 3}]], TTL)
+
+    # Nobody is connected here yet, so nothing is read.
+    assert await relay_shared_events() == 0
+    async with event_bus.subscribe(user.id) as queue:
+        assert await relay_shared_events() == 2
+        assert await relay_shared_events() == 0
+
+        assert [queue.get_nowait().name for _ in range(2)] == ["request", "recommendations"]
+        assert queue.empty()
+
+
+async def test_own_events_are_published_here_and_shared(user, relayed):
+    async with event_bus.subscribe(user.id) as queue:
+        await publish_everywhere([(user.id, "recommendations", {"run_id": 7})])
+
+        assert await relay_shared_events() == 0
+        event = queue.get_nowait()
+        assert (event.name, event.data) == ("recommendations", {"run_id": 7})
+        assert queue.empty()
+
+    shared = await scan_shared("events:")
+    assert list(shared.values()) == [[[user.id, "recommendations", {"run_id": 7}]]]
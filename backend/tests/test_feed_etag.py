@@ -0,0 +1,135 @@
+import httpx
+import pytest
+
+from app.routers import recommendations as router
+from app.services import metadata
+from app.services.feed_cache import etag_matches, feed_cache, make_etag
+from app.services.metadata import MetadataNotConfiguredError, fetch_tmdb_details_checked
+
+pytestmark = pytest.mark.anyio
+
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+@pytest.fixture
+async def feed(user, make_run, cache_metadata):
+    await cache_metadata("movie", {1: "Alien", 2: "Aliens"})
+    return await make_run(user.id, movies=[{"title": "Space", "reason": "r", "items": [1, 2]}])
+
+
+async def get_feed(client, auth_headers, **headers) -> httpx.Response:
+    return await client.get("/api/recommendations", headers={**auth_headers, **headers})
+
+
+async def test_feed_has_etag_and_revalidates(client, auth_headers, feed):
+    first = await get_feed(client, auth_headers, **IDENTITY)
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert [item["title"] for item in first.json()["movies"][0]["items"]] == ["Alien", "Aliens"]
+
+    again = await get_feed(client, auth_headers, **IDENTITY, **{"If-None-Match": first.headers["etag"]})
+
+    assert again.status_code == 304
+    assert again.headers["etag"] == first.headers["etag"]
+    assert again.content == b""
+
+
+async def test_each_encoding_has_its_own_etag(client, auth_headers, feed):
+    plain = await get_feed(client, auth_headers, **IDENTITY)
+    gzipped = await get_feed(client, auth_headers, **{"Accept-Encoding": "gzip"})
+    brotli = await get_feed(client, auth_headers, **{"Accept-Encoding": "br"})
+
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert brotli.headers["content-encoding"] == "br"
+    etags = {plain.headers["etag"], gzipped.headers["etag"], brotli.headers["etag"]}
+    assert len(etags) == 3
+    assert gzipped.json() == brotli.json() == plain.json()
+
+    # Revalidating the gzip body answers with the gzip representation's tag.
+    revalidated = await get_feed(
+        client, auth_headers, **{"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]}
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == gzipped.headers["etag"]
+
+
+async def test_rating_changes_the_etag(client, auth_headers, feed):
+    first = await get_feed(client, auth_headers, **IDENTITY)
+
+    rated = await client.post("/api/media/1/rate", headers=auth_headers, json={"media_type": "movie", "rating": "up"})
+    assert rated.status_code == 200
+    after = await get_feed(client, auth_headers, **IDENTITY, **{"If-None-Match": first.headers["etag"]})
+
+    assert after.status_code == 200
+    assert after.headers["etag"] != first.headers["etag"]
+    assert [item["tmdb_id"] for item in after.json()["movies"][0]["items"]] == [2]
+
+
+async def test_unchanged_feed_is_served_from_the_feed_cache(client, auth_headers, feed, monkeypatch):
+    await get_feed(client, auth_headers, **IDENTITY)
+
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("a cached feed must not be enriched again")
+
+    monkeypatch.setattr(router, "fetch_tmdb_details_checked", unexpected)
+    again = await get_feed(client, auth_headers, **{"Accept-Encoding": "gzip"})
+
+    assert again.status_code == 200
+    assert again.json()["movies"][0]["items"][0]["title"] == "Alien"
+
+
+@pytest.mark.parametrize("failure", [httpx.ConnectTimeout("timed out"), MetadataNotConfiguredError("no key")])
+async def test_incomplete_enrichment_is_neither_cached_nor_tagged(client, auth_headers, user, make_run, monkeypatch, failure):
+    await make_run(user.id, movies=[{"title": "Space", "reason": "r", "items": [1, 2]}])
+
+    async def tmdb_down(*args, **kwargs):
+        raise failure
+
+    monkeypatch.setattr(router, "fetch_tmdb_details_checked", tmdb_down)
+    degraded = await get_feed(client, auth_headers, **IDENTITY)
+
+    assert degraded.status_code == 200
+    assert [item["title"] for item in degraded.json()["movies"][0]["items"]] == [None, None]
+    assert "etag" not in degraded.headers
+    assert degraded.headers["cache-control"] == "no-store"
+    assert feed_cache._entries == {}
+
+    async def recovered(*args, **kwargs):
+        return [{"id": 1, "title": "Alien"}, {"id": 2, "title": "Aliens"}], True
+
+    monkeypatch.setattr(router, "fetch_tmdb_details_checked", recovered)
+    healed = await get_feed(client, auth_headers, **IDENTITY)
+
+    assert [item["title"] for item in healed.json()["movies"][0]["items"]] == ["Alien", "Aliens"]
+    assert "etag" in healed.headers
+
+
+async def test_failed_tmdb_lookup_is_reported_as_incomplete(monkeypatch):
+    monkeypatch.setattr(metadata, "get_settings", lambda: type("S", (), {"tmdb_api_key": "key", "TMDB_BASE_URL": ""})())
+
+    async def fetch_one(client, api_key, tmdb_id, media_type):
+        if tmdb_id == 1:
+            return {"id": 1, "title": "Alien"}
+        if tmdb_id == 2:
+            return None  # TMDb answered 404
+        raise httpx.ReadTimeout("timed out")
+
+    monkeypatch.setattr(metadata, "_fetch_one", fetch_one)
+
+    assert await fetch_tmdb_details_checked([1, 2]) == ([{"id": 1, "title": "Alien"}], True)
+    details, complete = await fetch_tmdb_details_checked([1, 3])
+    assert [d["id"] for d in details] == [1]
+    assert complete is False
+
+
+def test_etag_matching():
+    etag = make_etag("recommendations", 1, 0)
+    gzip_etag = etag[:-1] + '-gzip"'
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(f"W/{gzip_etag}", etag)
+    assert etag_matches(f'"other", {etag[:-1]}-br"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches(make_etag("recommendations", 1, 1), etag)
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import AsyncSessionLocal
+from app.models import User, UserPreference
+from app.routers import media
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 10, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def warmed(monkeypatch) -> list[tuple[list[int], str]]:
+    calls: list[tuple[list[int], str]] = []
+
+    async def warm(tmdb_ids, media_type):
+        calls.append((tmdb_ids, media_type))
+
+    monkeypatch.setattr(media, "warm_metadata_cache", warm)
+    return calls
+
+
+async def add_preferences(user_id: int, rows: list[tuple[int, str, int, datetime]]) -> None:
+    async with AsyncSessionLocal() as db:
+        for tmdb_id, media_type, rating, created_at in rows:
+            db.add(
+                UserPreference(
+                    user_id=user_id, tmdb_id=tmdb_id, media_type=media_type, rating=rating, created_at=created_at
+                )
+            )
+        await db.commit()
+
+
+async def walk(client, auth_headers, **params) -> list[list[int]]:
+    pages: list[list[int]] = []
+    cursor = None
+    while True:
+        query = {**params, **({"cursor": cursor} if cursor else {})}
+        body = (await client.get("/api/user/history", params=query, headers=auth_headers)).json()
+        pages.append([item["tmdb_id"] for item in body["history"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+async def test_pages_are_newest_first_without_gaps_or_repeats(client, auth_headers, user, warmed):
+    # Three rows share a timestamp, so the id breaks the tie.
+    await add_preferences(
+        user.id,
+        [
+            (1, "movie", 1, NOW - timedelta(days=2)),
+            (2, "movie", -1, NOW),
+            (3, "tv", 1, NOW),
+            (4, "movie", 2, NOW),
+            (5, "movie", 1, NOW + timedelta(seconds=1)),
+        ],
+    )
+
+    pages = await walk(client, auth_headers, limit=2)
+
+    assert pages == [[5, 4], [3, 2], [1]]
+
+
+async def test_filters_apply_across_pages(client, auth_headers, user, warmed):
+    await add_preferences(
+        user.id,
+        [(n, "movie" if n % 2 else "tv", 1 if n < 6 else -1, NOW + timedelta(minutes=n)) for n in range(1, 9)],
+    )
+
+    assert await walk(client, auth_headers, limit=1, rating=1, media_type="movie") == [[5], [3], [1]]
+    assert await walk(client, auth_headers, limit=10, rating=-1) == [[8, 7, 6]]
+
+
+async def test_titles_come_from_the_metadata_cache(client, auth_headers, user, cache_metadata, warmed):
+    await cache_metadata("movie", {1: "Alien"}, poster_path="/alien.jpg")
+    await add_preferences(user.id, [(1, "movie", 1, NOW), (2, "movie", 1, NOW - timedelta(hours=1))])
+
+    body = (await client.get("/api/user/history", headers=auth_headers)).json()
+
+    assert body["history"][0]["title"] == "Alien"
+    assert body["history"][0]["poster_url"] == "https://image.tmdb.org/t/p/w200/alien.jpg"
+    assert body["history"][1]["title"] is None
+    # Uncached titles are fetched in the background for the next load.
+    assert warmed == [([2], "movie")]
+
+
+async def test_other_users_history_is_not_listed(client, auth_headers, user, warmed):
+    async with AsyncSessionLocal() as db:
+        other = User(plex_id=2, username="bob", email="bob@example.com")
+        db.add(other)
+        await db.commit()
+    await add_preferences(other.id, [(1, "movie", 1, NOW)])
+
+    body = (await client.get("/api/user/history", headers=auth_headers)).json()
+
+    assert body == {"history": [], "next_cursor": None}
+
+
+async def test_invalid_cursor_is_rejected(client, auth_headers, user, warmed):
+    response = await client.get("/api/user/history", params={"cursor": "%%%"}, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
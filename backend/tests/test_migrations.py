@@ -0,0 +1,101 @@
+import json
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+from alembic import command
+from alembic.config import Config
+
+from app.db import ALEMBIC_INI
+
+
+class MigratedDb:
+    def __init__(self, connection: sa.Connection) -> None:
+        self.connection = connection
+        self.config = Config(str(ALEMBIC_INI))
+        self.config.attributes["connection"] = connection
+
+    def upgrade(self, revision: str = "head") -> None:
+        command.upgrade(self.config, revision)
+        self.connection.commit()
+
+
+@pytest.fixture
+def legacy_db(tmp_path) -> MigratedDb:
+    """
+    A separate database to migrate step by step, e.g. to an old revision,
+    then fill with legacy rows, then to head.
+    """
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.connect() as connection:
+        yield MigratedDb(connection)
+    engine.dispose()
+
+
+def add_cached_feed(connection: sa.Connection, user_id: int, payload: dict, created_at: datetime) -> None:
+    connection.execute(
+        sa.text("INSERT INTO users (id, plex_id, username, email) VALUES (:id, :id, :name, :name)"),
+        {"id": user_id, "name": f"user{user_id}"},
+    )
+    connection.execute(
+        sa.text(
+            "INSERT INTO recommendation_cache (user_id, recommendations, created_at) "
+            "VALUES (:user_id, :payload, :created_at)"
+        ),
+        {"user_id": user_id, "payload": json.dumps(payload), "created_at": created_at},
+    )
+    connection.commit()
+
+
+def run_rows(connection: sa.Connection, user_id: int) -> list[tuple]:
+    return connection.execute(
+        sa.text(
+            "SELECT c.lane, c.title, i.tmdb_id FROM recommendation_runs r "
+            "JOIN recommendation_categories c ON c.run_id = r.id "
+            "JOIN recommendation_items i ON i.category_id = c.id "
+            "WHERE r.user_id = :user_id ORDER BY c.lane, c.position, i.position"
+        ),
+        {"user_id": user_id},
+    ).all()
+
+
+def test_cached_feeds_keep_their_watched_titles(legacy_db):
+    legacy_db.upgrade("0001")
+    connection = legacy_db.connection
+    add_cached_feed(
+        connection,
+        1,
+        {"movies": [{"title": "Sci-Fi", "items": [603]}], "watched_titles": ["The Matrix ", "alien"]},
+        datetime(2026, 1, 1),
+    )
+    add_cached_feed(connection, 2, {"movies": [{"title": "Drama", "items": [1]}]}, datetime(2026, 1, 1))
+
+    legacy_db.upgrade()
+
+    titles = dict(connection.execute(sa.text("SELECT user_id, watched_titles FROM recommendation_runs")).all())
+    assert json.loads(titles[1]) == ["alien", "the matrix"]
+    assert titles[2] is None
+    assert run_rows(connection, 1) == [("movies", "Sci-Fi", 603)]
+
+
+def test_legacy_categories_key_is_carried_over_as_movies(legacy_db):
+    legacy_db.upgrade("0001")
+    connection = legacy_db.connection
+    add_cached_feed(
+        connection,
+        1,
+        {"categories": [{"title": "Classics", "items": [1, 2]}], "tv": [{"title": "Shows", "items": [3]}]},
+        datetime(2026, 1, 1),
+    )
+    # A lanes payload keeps its own movies even if "categories" is present.
+    add_cached_feed(
+        connection,
+        2,
+        {"movies": [{"title": "New", "items": [4]}], "categories": [{"title": "Old", "items": [5]}]},
+        datetime(2026, 1, 1),
+    )
+
+    legacy_db.upgrade()
+
+    assert run_rows(connection, 1) == [("movies", "Classics", 1), ("movies", "Classics", 2), ("tv", "Shows", 3)]
+    assert run_rows(connection, 2) == [("movies", "New", 4)]
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models import PerformanceRollup
+from app.services.performance import ROLLUP_RETENTION, prune_performance_rollups
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_prune_drops_only_rollups_past_retention():
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        for age in (ROLLUP_RETENTION + timedelta(hours=1), ROLLUP_RETENTION - timedelta(hours=1)):
+            db.add(PerformanceRollup(period_start=now - age, kind="cache", subject="feed", count=1, hits=1))
+        await db.commit()
+
+    assert await prune_performance_rollups() == 1
+
+    async with AsyncSessionLocal() as db:
+        kept = (await db.execute(select(PerformanceRollup.period_start))).scalars().all()
+    assert kept == [now - ROLLUP_RETENTION + timedelta(hours=1)]
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models import ActivityDaily, UserPreference, UserStats
+from app.services.preferences import apply_preference_events, preference_version, upsert_preference
+
+pytestmark = pytest.mark.anyio
+
+
+async def apply(user_id: int, events: list[tuple[int, str, str]]) -> tuple[int, int]:
+    async with AsyncSessionLocal() as db:
+        result = await apply_preference_events(db, user_id, events)
+        await db.commit()
+    return result
+
+
+async def ratings(user_id: int) -> dict[int, int]:
+    stmt = select(UserPreference.tmdb_id, UserPreference.rating).where(UserPreference.user_id == user_id)
+    async with AsyncSessionLocal() as db:
+        return dict((await db.execute(stmt)).all())
+
+
+async def stats(user_id: int) -> tuple[int, int, int]:
+    async with AsyncSessionLocal() as db:
+        row = await db.get(UserStats, user_id)
+    return (row.likes, row.dislikes, row.requested) if row else (0, 0, 0)
+
+
+async def activity_today() -> int:
+    async with AsyncSessionLocal() as db:
+        row = await db.get(ActivityDaily, datetime.utcnow().date())
+    return row.ratings if row else 0
+
+
+async def version(user_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        return await preference_version(db, user_id)
+
+
+async def test_last_event_per_title_wins(user):
+    saved, removed = await apply(
+        user.id,
+        [(1, "movie", "up"), (2, "movie", "skip"), (1, "movie", "down"), (3, "tv", "up"), (3, "tv", "unrate")],
+    )
+
+    assert (saved, removed) == (2, 0)
+    assert await ratings(user.id) == {1: -1, 2: -1}
+    assert await stats(user.id) == (0, 2, 0)
+    assert await activity_today() == 2
+    assert await version(user.id) == 1
+
+
+async def test_changed_ratings_move_counters(user):
+    await apply(user.id, [(1, "movie", "up"), (2, "movie", "up"), (3, "movie", "down")])
+
+    saved, removed = await apply(user.id, [(1, "movie", "down"), (3, "movie", "unrate")])
+
+    assert (saved, removed) == (1, 1)
+    assert await ratings(user.id) == {1: -1, 2: 1}
+    assert await stats(user.id) == (1, 1, 0)
+    assert await activity_today() == 4
+    assert await version(user.id) == 2
+
+
+async def test_repeated_rating_is_not_counted_again(user):
+    await apply(user.id, [(1, "movie", "up")])
+
+    saved, removed = await apply(user.id, [(1, "movie", "up")])
+
+    assert (saved, removed) == (1, 0)
+    assert await stats(user.id) == (1, 0, 0)
+    assert await activity_today() == 1
+    assert await version(user.id) == 1
+
+
+async def test_repeated_single_rating_is_not_counted_again(user):
+    async def rate(rating: int) -> None:
+        async with AsyncSessionLocal() as db:
+            await upsert_preference(db, user_id=user.id, tmdb_id=1, media_type="movie", rating=rating)
+            await db.commit()
+
+    await rate(1)
+    await rate(1)
+    assert await stats(user.id) == (1, 0, 0)
+    assert await activity_today() == 1
+    assert await version(user.id) == 1
+
+    await rate(-1)
+    assert await stats(user.id) == (0, 1, 0)
+    assert await activity_today() == 2
+    assert await version(user.id) == 2
+
+
+async def test_unrating_an_unrated_title_changes_nothing(user):
+    saved, removed = await apply(user.id, [(1, "movie", "unrate")])
+
+    assert (saved, removed) == (0, 0)
+    assert await stats(user.id) == (0, 0, 0)
+    assert await activity_today() == 0
+    assert await version(user.id) == 0
+
+
+async def test_rating_a_requested_title_replaces_the_request(user):
+    async with AsyncSessionLocal() as db:
+        await upsert_preference(db, user_id=user.id, tmdb_id=1, media_type="movie", rating=2)
+        await db.commit()
+    assert await stats(user.id) == (0, 0, 1)
+
+    await apply(user.id, [(1, "movie", "up")])
+
+    assert await ratings(user.id) == {1: 1}
+    assert await stats(user.id) == (1, 0, 0)
@@ -0,0 +1,95 @@
+import pytest
+
+from app.database import AsyncSessionLocal
+from app.models import User
+from app.routers import recommendations as router
+from app.services.recommendations import prune_runs
+
+pytestmark = pytest.mark.anyio
+
+
+def movie_rows(count: int) -> list[dict]:
+    return [{"title": f"Row {n}", "reason": "r", "items": [n * 10 + 1, n * 10 + 2]} for n in range(count)]
+
+
+@pytest.fixture
+def enriched(monkeypatch) -> list[list[int]]:
+    """
+    Record which IDs each enrichment call asked TMDb for.
+    """
+    calls: list[list[int]] = []
+
+    async def fetch(tmdb_ids, media_type="movie", use_cache=True):
+        calls.append(sorted(tmdb_ids))
+        return [{"id": tmdb_id, "title": f"Title {tmdb_id}"} for tmdb_id in tmdb_ids], True
+
+    monkeypatch.setattr(router, "fetch_tmdb_details_checked", fetch)
+    return calls
+
+
+async def get_lane(client, auth_headers, **params):
+    return await client.get("/api/recommendations", params=params, headers=auth_headers)
+
+
+async def test_lane_pages_follow_the_cursor_to_the_end(client, auth_headers, user, make_run, enriched):
+    await make_run(user.id, movies=movie_rows(5), tv=[{"title": "Shows", "items": [500]}])
+
+    first = (await get_lane(client, auth_headers, lane="movies", limit=2)).json()
+    second = (await get_lane(client, auth_headers, lane="movies", limit=2, cursor=first["next_cursor"])).json()
+    last = (await get_lane(client, auth_headers, lane="movies", limit=2, cursor=second["next_cursor"])).json()
+
+    assert [c["title"] for c in first["categories"]] == ["Row 0", "Row 1"]
+    assert [c["title"] for c in second["categories"]] == ["Row 2", "Row 3"]
+    assert [c["title"] for c in last["categories"]] == ["Row 4"]
+    assert last["next_cursor"] is None
+    assert first["lane"] == "movies" and first["seed"] is False
+
+
+async def test_only_the_requested_page_is_enriched(client, auth_headers, user, make_run, enriched):
+    await make_run(user.id, movies=movie_rows(5), tv=[{"title": "Shows", "items": [500]}])
+
+    await get_lane(client, auth_headers, lane="movies", limit=2)
+
+    assert enriched == [[1, 2, 11, 12]]
+
+
+async def test_cursor_into_a_pruned_run_is_gone(client, auth_headers, user, make_run, enriched):
+    await make_run(user.id, movies=movie_rows(3))
+    first = (await get_lane(client, auth_headers, lane="movies", limit=1)).json()
+    await make_run(user.id, movies=movie_rows(3))
+    async with AsyncSessionLocal() as db:
+        await prune_runs(db, user.id, keep=1)
+        await db.commit()
+
+    response = await get_lane(client, auth_headers, lane="movies", limit=1, cursor=first["next_cursor"])
+
+    assert response.status_code == 410
+
+
+async def test_cursor_into_another_users_run_is_gone(client, auth_headers, user, make_run, enriched):
+    async with AsyncSessionLocal() as db:
+        other = User(plex_id=2, username="bob", email="bob@example.com")
+        db.add(other)
+        await db.commit()
+    theirs = await make_run(other.id, movies=movie_rows(3))
+    await make_run(user.id, movies=movie_rows(3))
+
+    response = await get_lane(client, auth_headers, lane="movies", limit=1, cursor=router._encode_cursor(theirs.id, 1))
+
+    assert response.status_code == 410
+
+
+@pytest.mark.parametrize(
+    "params, detail",
+    [
+        ({"cursor": "MTox"}, "cursor requires lane"),
+        ({"lane": "movies", "cursor": "not-a-cursor!"}, "Invalid cursor"),
+    ],
+)
+async def test_bad_cursors_are_rejected(client, auth_headers, user, make_run, enriched, params, detail):
+    await make_run(user.id, movies=movie_rows(1))
+
+    response = await get_lane(client, auth_headers, **params)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
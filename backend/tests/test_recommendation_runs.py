@@ -0,0 +1,162 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.database import AsyncSessionLocal
+from app.models import RecommendationRun, RecommendationRunCategory, RecommendationRunItem, User
+from app.routers.recommendations import _load_categories
+from app.services import recommendations
+from app.services.recommendations import generate_recommendations, prune_runs
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeAI:
+    name = "fake"
+
+    def __init__(self, response: dict) -> None:
+        self.response = response
+        self.prompts: list[str] = []
+
+    async def generate(self, prompt: str, system_prompt: str | None = None) -> str:
+        self.prompts.append(prompt)
+        return json.dumps(self.response)
+
+
+@pytest.fixture
+def history(monkeypatch) -> list[dict]:
+    rows: list[dict] = []
+
+    async def get_user_history(user_id: int, limit: int = 1000) -> list[dict]:
+        return rows
+
+    monkeypatch.setattr(recommendations, "get_user_history", get_user_history)
+    return rows
+
+
+@pytest.fixture
+def ai(monkeypatch):
+    def install(response: dict) -> FakeAI:
+        provider = FakeAI(response)
+        monkeypatch.setattr(recommendations, "get_ai_provider", lambda: provider)
+        return provider
+
+    return install
+
+
+@pytest.fixture
+async def tautulli_user(user) -> User:
+    async with AsyncSessionLocal() as db:
+        row = await db.get(User, user.id)
+        row.tautulli_user_id = 7
+        await db.commit()
+    return row
+
+
+async def generate(user_id: int) -> RecommendationRun:
+    async with AsyncSessionLocal() as db:
+        return await generate_recommendations(db, user_id)
+
+
+async def test_generation_stores_lanes_categories_and_items_in_order(user, history, ai):
+    ai(
+        {
+            "movies": [
+                {"title": "Heists", "reason": "because", "items": [1, "2", "x", None]},
+                "not a category",
+                {"items": [3]},
+            ],
+            "tv": [{"title": "Sitcoms", "reason": "", "items": [10]}],
+            "documentaries": [],
+        }
+    )
+
+    run = await generate(user.id)
+
+    async with AsyncSessionLocal() as db:
+        rows = await _load_categories(db, run.id)
+    assert rows == [
+        ("movies", {"title": "Heists", "reason": "because", "items": [1, 2]}),
+        ("movies", {"title": "Recommendations", "reason": "", "items": [3]}),
+        ("tv", {"title": "Sitcoms", "reason": "", "items": [10]}),
+    ]
+
+
+async def test_legacy_single_list_response_is_stored_as_movies(user, history, ai):
+    ai({"categories": [{"title": "Old format", "items": [1]}]})
+
+    run = await generate(user.id)
+
+    async with AsyncSessionLocal() as db:
+        assert await _load_categories(db, run.id) == [("movies", {"title": "Old format", "reason": "", "items": [1]})]
+
+
+async def test_unparseable_response_stores_an_empty_run(user, history, monkeypatch):
+    class Garbage(FakeAI):
+        async def generate(self, prompt, system_prompt=None):
+            return "Sure! Here are some movies:"
+
+    monkeypatch.setattr(recommendations, "get_ai_provider", lambda: Garbage({}))
+
+    run = await generate(user.id)
+
+    async with AsyncSessionLocal() as db:
+        assert await _load_categories(db, run.id) == []
+
+
+async def test_prune_keeps_the_newest_runs_and_removes_their_rows(user, make_run):
+    now = datetime.utcnow()
+    runs = [
+        await make_run(user.id, created_at=now - timedelta(hours=n), movies=[{"title": "Row", "items": [n]}])
+        for n in range(4)
+    ]
+    seed = await make_run(None, movies=[{"title": "Seed", "items": [99]}])
+
+    async with AsyncSessionLocal() as db:
+        await prune_runs(db, user.id, keep=2)
+        await db.commit()
+        kept = (await db.execute(select(RecommendationRun.id).order_by(RecommendationRun.id))).scalars().all()
+        items = (await db.execute(select(func.count()).select_from(RecommendationRunItem))).scalar_one()
+        categories = (await db.execute(select(func.count()).select_from(RecommendationRunCategory))).scalar_one()
+
+    assert kept == [runs[0].id, runs[1].id, seed.id]
+    assert (categories, items) == (3, 3)
+
+
+async def test_titles_the_model_recommends_despite_being_watched_are_hidden(
+    client, auth_headers, tautulli_user, history, ai, cache_metadata
+):
+    history.extend(
+        [
+            {"title": "The Matrix", "media_type": "movie"},
+            {"title": "Pilot", "grandparent_title": "Breaking Bad", "media_type": "episode"},
+        ]
+    )
+    provider = ai(
+        {
+            "movies": [{"title": "Sci-Fi", "items": [603, 604]}],
+            "tv": [{"title": "Crime", "items": [1396, 1397]}],
+        }
+    )
+    await cache_metadata("movie", {603: "The Matrix", 604: "The Matrix Reloaded"})
+    await cache_metadata("tv", {1396: "Breaking Bad", 1397: "Better Call Saul"})
+
+    run = await generate(tautulli_user.id)
+    body = (await client.get("/api/recommendations", headers=auth_headers)).json()
+
+    assert json.loads(run.watched_titles) == ["breaking bad", "the matrix"]
+    assert '"the matrix"' in provider.prompts[0]
+    assert [item["title"] for item in body["movies"][0]["items"]] == ["The Matrix Reloaded"]
+    assert [item["title"] for item in body["tv"][0]["items"]] == ["Better Call Saul"]
+
+
+async def test_runs_without_watched_titles_hide_nothing(client, auth_headers, user, make_run, cache_metadata):
+    # Seed runs and runs from before watched titles were stored.
+    await cache_metadata("movie", {603: "The Matrix"})
+    await make_run(user.id, movies=[{"title": "Sci-Fi", "items": [603]}])
+
+    body = (await client.get("/api/recommendations", headers=auth_headers)).json()
+
+    assert [item["title"] for item in body["movies"][0]["items"]] == ["The Matrix"]
@@ -0,0 +1,276 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import select, update
+
+from app import main
+from app.database import AsyncSessionLocal
+from app.models import MediaRequestOutbox, User, UserPreference, UserStats
+from app.services import request_outbox
+from app.services.overseerr import overseerr_service
+from app.services.preferences import upsert_preference
+from app.services.leader import scheduler_lease
+from app.services.request_outbox import OUTBOX_MAX_ATTEMPTS, enqueue_request, notify_outbox, process_outbox
+from app.services.shared_cache import scan_shared
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeOverseerr:
+    """
+    Stands in for Overseerr: `availability` maps tmdb_id to a status
+    (default MISSING) and `errors` to an exception raised on submit.
+    """
+
+    def __init__(self) -> None:
+        self.availability: dict[int, str] = {}
+        self.errors: dict[int, Exception] = {}
+        self.submitted: list[int] = []
+        self.on_submit = None
+
+    async def check_availability(self, tmdb_id: int, media_type: str) -> dict:
+        return {"status": self.availability.get(tmdb_id, "MISSING")}
+
+    async def submit_request(self, tmdb_id: int, media_type: str) -> None:
+        if self.on_submit is not None:
+            await self.on_submit(tmdb_id)
+        if tmdb_id in self.errors:
+            raise self.errors[tmdb_id]
+        self.submitted.append(tmdb_id)
+
+
+@pytest.fixture
+def overseerr(monkeypatch) -> FakeOverseerr:
+    fake = FakeOverseerr()
+    monkeypatch.setattr(overseerr_service, "configured", True)
+    monkeypatch.setattr(overseerr_service, "check_availability", fake.check_availability)
+    monkeypatch.setattr(overseerr_service, "submit_request", fake.submit_request)
+    return fake
+
+
+def http_error(code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://overseerr/api/v1/request")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+
+async def queue(user_id: int, tmdb_id: int) -> None:
+    # What POST /api/media/{id}/request does.
+    async with AsyncSessionLocal() as db:
+        await enqueue_request(db, user_id, tmdb_id, "movie")
+        await upsert_preference(db, user_id=user_id, tmdb_id=tmdb_id, media_type="movie", rating=2)
+        await db.commit()
+
+
+async def outbox_row(tmdb_id: int, user_id: int | None = None) -> MediaRequestOutbox:
+    stmt = select(MediaRequestOutbox).where(MediaRequestOutbox.tmdb_id == tmdb_id)
+    if user_id is not None:
+        stmt = stmt.where(MediaRequestOutbox.user_id == user_id)
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(stmt)).scalar_one()
+
+
+async def preference(user_id: int, tmdb_id: int) -> int | None:
+    stmt = select(UserPreference.rating).where(UserPreference.user_id == user_id, UserPreference.tmdb_id == tmdb_id)
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(stmt)).scalar_one_or_none()
+
+
+async def requested_count(user_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        stats = await db.get(UserStats, user_id)
+    return stats.requested if stats else 0
+
+
+async def test_submits_pending_request(user, overseerr):
+    await queue(user.id, 10)
+
+    assert await process_outbox() == 1
+
+    row = await outbox_row(10)
+    assert (row.status, row.attempts, row.last_error) == ("submitted", 1, None)
+    assert row.submitted_at is not None
+    assert overseerr.submitted == [10]
+    assert await preference(user.id, 10) == 2
+
+
+async def test_queuing_worker_submits_without_the_scheduler_lease(user, overseerr):
+    assert main._request_outbox_loop not in main.LEADER_JOBS
+    loop = asyncio.create_task(main._request_outbox_loop())
+    try:
+        await queue(user.id, 10)
+        notify_outbox()
+        for _ in range(50):
+            if overseerr.submitted:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        loop.cancel()
+
+    assert overseerr.submitted == [10]
+    assert not scheduler_lease.is_leader
+
+
+async def test_repeated_request_while_pending_is_collapsed(user, overseerr):
+    await queue(user.id, 10)
+    await queue(user.id, 10)
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(MediaRequestOutbox))).scalars().all()
+    assert len(rows) == 1
+
+
+async def test_skips_titles_overseerr_already_has(user, overseerr):
+    overseerr.availability[10] = "AVAILABLE"
+    await queue(user.id, 10)
+
+    await process_outbox()
+
+    assert (await outbox_row(10)).status == "skipped"
+    assert overseerr.submitted == []
+
+
+async def test_same_title_from_several_users_is_submitted_once(user, overseerr):
+    async with AsyncSessionLocal() as db:
+        other = User(plex_id=2, username="bob", email="bob@example.com")
+        db.add(other)
+        await db.commit()
+    await queue(user.id, 10)
+    await queue(other.id, 10)
+
+    assert await process_outbox() == 2
+
+    assert overseerr.submitted == [10]
+    assert (await outbox_row(10, user.id)).status == "submitted"
+    assert (await outbox_row(10, other.id)).status == "submitted"
+
+
+@pytest.mark.parametrize("code", [429, 503])
+async def test_retryable_errors_back_off(user, overseerr, code):
+    overseerr.errors[10] = http_error(code)
+    await queue(user.id, 10)
+    before = datetime.utcnow()
+
+    await process_outbox()
+
+    row = await outbox_row(10)
+    assert (row.status, row.attempts, row.last_error) == ("pending", 1, f"HTTP {code}")
+    # First retry: the base delay with +/-20% jitter.
+    base = request_outbox.OUTBOX_BACKOFF_BASE_SECONDS
+    assert before + timedelta(seconds=base * 0.8) <= row.next_attempt_at
+    assert row.next_attempt_at <= datetime.utcnow() + timedelta(seconds=base * 1.2)
+    assert await preference(user.id, 10) == 2
+
+
+async def test_backoff_grows_and_is_capped():
+    assert request_outbox._backoff(1) <= timedelta(seconds=request_outbox.OUTBOX_BACKOFF_BASE_SECONDS * 1.2)
+    assert request_outbox._backoff(3) >= timedelta(seconds=request_outbox.OUTBOX_BACKOFF_BASE_SECONDS * 4 * 0.8)
+    assert request_outbox._backoff(50) <= timedelta(seconds=request_outbox.OUTBOX_BACKOFF_MAX_SECONDS * 1.2)
+
+
+async def test_client_error_fails_and_withdraws_preference(user, overseerr):
+    overseerr.errors[10] = http_error(400)
+    await queue(user.id, 10)
+    assert await requested_count(user.id) == 1
+
+    await process_outbox()
+
+    row = await outbox_row(10)
+    assert (row.status, row.attempts) == ("failed", 1)
+    assert row.last_error.startswith("HTTP 400")
+    assert await preference(user.id, 10) is None
+    assert await requested_count(user.id) == 0
+
+
+async def test_outcomes_are_shared_with_streams_on_other_workers(user, overseerr):
+    overseerr.errors[11] = http_error(400)
+    await queue(user.id, 10)
+    await queue(user.id, 11)
+
+    await process_outbox()
+
+    (shared,) = (await scan_shared("events:")).values()
+    assert sorted(shared, key=lambda event: event[2]["tmdb_id"]) == [
+        [user.id, "request", {"tmdb_id": 10, "media_type": "movie", "status": "requested"}],
+        [user.id, "request", {"tmdb_id": 11, "media_type": "movie", "status": "missing"}],
+    ]
+
+
+async def test_gives_up_after_max_attempts(user, overseerr):
+    overseerr.errors[10] = http_error(503)
+    await queue(user.id, 10)
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(MediaRequestOutbox).values(attempts=OUTBOX_MAX_ATTEMPTS - 1))
+        await db.commit()
+
+    await process_outbox()
+
+    row = await outbox_row(10)
+    assert (row.status, row.attempts) == ("failed", OUTBOX_MAX_ATTEMPTS)
+    assert await preference(user.id, 10) is None
+
+
+async def test_failure_keeps_a_rating_changed_since_the_request(user, overseerr):
+    overseerr.errors[10] = http_error(404)
+    await queue(user.id, 10)
+    async with AsyncSessionLocal() as db:
+        await upsert_preference(db, user_id=user.id, tmdb_id=10, media_type="movie", rating=1)
+        await db.commit()
+
+    await process_outbox()
+
+    assert (await outbox_row(10)).status == "failed"
+    assert await preference(user.id, 10) == 1
+
+
+async def test_unexpected_error_counts_as_attempt_without_cancelling_others(user, overseerr):
+    overseerr.errors[10] = RuntimeError("boom")
+    await queue(user.id, 10)
+    await queue(user.id, 11)
+
+    await process_outbox()
+
+    broken = await outbox_row(10)
+    assert (broken.status, broken.attempts) == ("pending", 1)
+    assert broken.last_error == "RuntimeError: boom"
+    assert broken.next_attempt_at > datetime.utcnow()
+    assert (await outbox_row(11)).status == "submitted"
+
+
+async def test_unexpected_error_reaches_the_attempt_cap(user, overseerr):
+    overseerr.errors[10] = RuntimeError("boom")
+    await queue(user.id, 10)
+    for _ in range(OUTBOX_MAX_ATTEMPTS):
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(MediaRequestOutbox).values(next_attempt_at=datetime.utcnow()))
+            await db.commit()
+        await process_outbox()
+
+    row = await outbox_row(10)
+    assert (row.status, row.attempts) == ("failed", OUTBOX_MAX_ATTEMPTS)
+
+
+async def test_claimed_rows_are_not_due_for_other_workers(user, overseerr):
+    await queue(user.id, 10)
+    seen: list[datetime] = []
+
+    async def inspect(tmdb_id: int) -> None:
+        seen.append((await outbox_row(tmdb_id)).next_attempt_at)
+
+    overseerr.on_submit = inspect
+
+    await process_outbox()
+
+    # While the submission ran, the row was pushed out by the claim timeout.
+    assert seen and seen[0] > datetime.utcnow() + request_outbox.OUTBOX_CLAIM_TIMEOUT - timedelta(minutes=1)
+
+
+async def test_rows_not_yet_due_are_left_alone(user, overseerr):
+    await queue(user.id, 10)
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(MediaRequestOutbox).values(next_attempt_at=datetime.utcnow() + timedelta(minutes=5)))
+        await db.commit()
+
+    assert await process_outbox() == 0
+    assert overseerr.submitted == []
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models import RecommendationRun, User, UserPreference
+from app.routers import recommendations as router
+from app.services import seed
+from app.services.seed import build_seed_feed, get_seed_run
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def generation(monkeypatch):
+    """
+    Replace background generation with a task the test controls; records
+    the users it was scheduled for.
+    """
+    scheduled: list[int] = []
+
+    def install(result=None):
+        async def generate():
+            if isinstance(result, Exception):
+                raise result
+            return await result() if result else None
+
+        def schedule(user_id: int) -> asyncio.Task:
+            scheduled.append(user_id)
+            return asyncio.ensure_future(generate())
+
+        monkeypatch.setattr(router, "schedule_generation", schedule)
+        return scheduled
+
+    return install
+
+
+@pytest.fixture
+async def popular_title(user) -> None:
+    """
+    A title another viewer liked, enough for build_seed_feed to produce a
+    feed if anything calls it.
+    """
+    async with AsyncSessionLocal() as db:
+        other = User(plex_id=2, username="bob", email="bob@example.com")
+        db.add(other)
+        await db.flush()
+        db.add(UserPreference(user_id=other.id, tmdb_id=603, media_type="movie", rating=1))
+        await db.commit()
+
+
+async def seed_runs() -> list[RecommendationRun]:
+    async with AsyncSessionLocal() as db:
+        stmt = select(RecommendationRun).where(RecommendationRun.user_id.is_(None))
+        return (await db.execute(stmt)).scalars().all()
+
+
+async def test_user_without_a_run_gets_the_seed_feed(client, auth_headers, user, make_run, cache_metadata, generation):
+    scheduled = generation()
+    await cache_metadata("movie", {603: "The Matrix"})
+    await make_run(None, movies=[{"title": "Popular on this server", "items": [603]}])
+
+    body = (await client.get("/api/recommendations", headers=auth_headers)).json()
+
+    assert body["seed"] is True
+    assert [item["title"] for item in body["movies"][0]["items"]] == ["The Matrix"]
+    assert scheduled == [user.id]
+
+
+async def test_requests_never_build_the_seed_feed(client, auth_headers, user, make_run, popular_title, generation):
+    async def first_run():
+        return (await make_run(user.id, movies=[{"title": "Yours", "items": [1]}])).id
+
+    generation(first_run)
+
+    body = (await client.get("/api/recommendations", headers=auth_headers)).json()
+
+    assert body["seed"] is False
+    assert body["movies"][0]["title"] == "Yours"
+    assert await seed_runs() == []
+
+
+async def test_failed_first_generation_without_a_seed_is_reported(client, auth_headers, user, popular_title, generation):
+    generation(RuntimeError("boom"))
+
+    response = await client.get("/api/recommendations", headers=auth_headers)
+
+    assert response.status_code == 503
+    assert await seed_runs() == []
+
+
+async def test_leader_build_is_what_requests_read(user, popular_title, cache_metadata, monkeypatch):
+    async def no_stats(stat_id):
+        return []
+
+    monkeypatch.setattr(seed.tautulli_service, "get_home_stats", no_stats)
+    await cache_metadata("movie", {603: "The Matrix"})
+
+    async with AsyncSessionLocal() as db:
+        assert await get_seed_run(db) is None
+        built = await build_seed_feed(db)
+        served = await get_seed_run(db)
+
+    assert served.id == built.id
+    assert [(c.lane, c.title, [i.tmdb_id for i in c.items]) for c in built.categories] == [
+        ("movies", "Popular on this server", [603])
+    ]
@@ -0,0 +1,129 @@
+import pytest
+
+from app import main
+from app.config import Settings, SettingsStore, settings_store
+from app.database import AsyncSessionLocal
+from app.models import AppSetting, User
+from app.routers.admin import SettingsUpdate
+from app.services import ai, metadata
+from app.services.overseerr import overseerr_service
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def restore_settings():
+    """
+    Put back the process-wide settings (and rebuild the services that
+    depend on them) after tests that change them.
+    """
+    original = settings_store.current
+    yield
+    settings_store.update(**original.model_dump())
+
+
+@pytest.fixture
+def store() -> SettingsStore:
+    return SettingsStore(Settings())
+
+
+@pytest.fixture
+async def admin_headers(user, auth_headers) -> dict[str, str]:
+    async with AsyncSessionLocal() as db:
+        row = await db.get(User, user.id)
+        row.is_admin = True
+        await db.commit()
+    return auth_headers
+
+
+def test_update_publishes_a_new_snapshot_with_the_changed_keys(store):
+    calls = []
+    store.subscribe(lambda settings, changed: calls.append((settings, changed)))
+    before = store.current
+
+    changed = store.update(AI_MODEL="gpt-4o", OVERSEERR_URL=before.OVERSEERR_URL)
+
+    assert changed == {"AI_MODEL"}
+    assert calls == [(store.current, frozenset({"AI_MODEL"}))]
+    assert store.current.AI_MODEL == "gpt-4o"
+    assert before.AI_MODEL != "gpt-4o"
+    assert store.version == 1
+
+
+def test_update_without_changes_notifies_nobody(store):
+    calls = []
+    store.subscribe(lambda settings, changed: calls.append(changed))
+
+    changed = store.update(AI_MODEL=store.current.AI_MODEL, NOT_A_SETTING="x")
+
+    assert changed == frozenset()
+    assert calls == []
+    assert store.version == 0
+
+
+def test_failing_listener_does_not_stop_the_others(store, caplog):
+    calls = []
+
+    def broken(settings, changed):
+        raise RuntimeError("boom")
+
+    store.subscribe(broken)
+    store.subscribe(lambda settings, changed: calls.append(changed))
+
+    store.update(AI_MODEL="gpt-4o")
+
+    assert calls == [frozenset({"AI_MODEL"})]
+    assert '"error_in": "settings"' in caplog.text
+    assert "RuntimeError: boom" in caplog.text
+
+
+async def test_tmdb_client_is_rebuilt_only_when_its_base_url_changes():
+    client = metadata._get_tmdb_client()
+
+    settings_store.update(TMDB_API_KEY="another-key")
+    assert metadata._get_tmdb_client() is client
+
+    settings_store.update(TMDB_BASE_URL="http://tmdb.test/3")
+    rebuilt = metadata._get_tmdb_client()
+    assert rebuilt is not client
+    assert str(rebuilt.base_url) == "http://tmdb.test/3/"
+
+
+async def test_services_pick_up_their_settings_at_runtime():
+    settings_store.update(OVERSEERR_URL="http://overseerr.test/", OVERSEERR_API_KEY="key")
+    assert overseerr_service.configured
+    assert str(overseerr_service._client.base_url) == "http://overseerr.test/api/v1/"
+
+    provider = ai.get_ai_provider()
+    settings_store.update(AI_MODEL="another-model")
+    assert ai.get_ai_provider() is not provider
+
+
+async def test_persisted_settings_override_the_environment():
+    async with AsyncSessionLocal() as db:
+        db.add(AppSetting(key="TAUTULLI_URL", value="http://tautulli.test"))
+        await db.commit()
+
+    await main._load_persistent_settings()
+
+    assert settings_store.current.TAUTULLI_URL == "http://tautulli.test"
+
+
+async def test_admin_save_applies_without_a_restart(client, admin_headers):
+    # Empty fields are left unchanged.
+    form = dict.fromkeys(SettingsUpdate.model_fields, "")
+    api_key = settings_store.current.AI_API_KEY
+
+    response = await client.post(
+        "/api/admin/settings",
+        headers=admin_headers,
+        json=form | {"AI_MODEL": "saved-model", "AI_API_KEY": "***"},
+    )
+
+    assert response.status_code == 200
+    assert settings_store.current.AI_MODEL == "saved-model"
+    # The masked secret shown in the form is not saved back.
+    assert settings_store.current.AI_API_KEY == api_key
+    async with AsyncSessionLocal() as db:
+        assert await db.get(AppSetting, "AI_API_KEY") is None
+        assert (await db.get(AppSetting, "AI_MODEL")).value == "saved-model"
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings_store
+from app.database import AsyncSessionLocal
+from app.main import _ensure_plex_client_id, _load_persistent_settings
+from app.models import AppSetting
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def plex_client_id():
+    saved = settings_store.current.PLEX_CLIENT_ID
+    yield lambda value: settings_store.update(PLEX_CLIENT_ID=value)
+    settings_store.update(PLEX_CLIENT_ID=saved)
+
+
+async def stored_client_ids() -> list[str]:
+    stmt = select(AppSetting.value).where(AppSetting.key == "PLEX_CLIENT_ID")
+    async with AsyncSessionLocal() as db:
+        return list((await db.execute(stmt)).scalars())
+
+
+async def test_workers_share_one_generated_plex_client_id(plex_client_id):
+    plex_client_id("")
+
+    await asyncio.gather(*(_ensure_plex_client_id() for _ in range(4)))
+    stored = await stored_client_ids()
+    await _ensure_plex_client_id()
+    await _load_persistent_settings()
+
+    assert len(stored) == 1 and stored[0]
+    assert await stored_client_ids() == stored
+    assert settings_store.current.PLEX_CLIENT_ID == stored[0]
+
+
+async def test_configured_plex_client_id_is_not_replaced(plex_client_id):
+    plex_client_id("from-env")
+
+    await _ensure_plex_client_id()
+
+    assert await stored_client_ids() == []
+    assert settings_store.current.PLEX_CLIENT_ID == "from-env"
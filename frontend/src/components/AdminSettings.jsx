@@ -77,6 +77,10 @@ function StatsSection() {
                     <div style={{ fontSize: '2rem', fontWeight: 'bold', color: '#3b82f6' }}>{stats.interactions.seen}</div>
                     <div style={{ fontSize: '0.9rem', color: 'var(--text-dim)' }}>Seen/Skipped</div>
                 </div>
+                <div style={{ textAlign: 'center', padding: '1rem', background: 'rgba(255,255,255,0.05)', borderRadius: '8px' }}>
+                    <div style={{ fontSize: '2rem', fontWeight: 'bold', color: '#f59e0b' }}>{stats.interactions.requested ?? 0}</div>
+                    <div style={{ fontSize: '0.9rem', color: 'var(--text-dim)' }}>Requested</div>
+                </div>
                 <div style={{ textAlign: 'center', padding: '1rem', background: 'rgba(255,255,255,0.05)', borderRadius: '8px' }}>
                     <div style={{ fontSize: '2rem', fontWeight: 'bold', color: 'white' }}>{stats.interactions.total}</div>
                     <div style={{ fontSize: '0.9rem', color: 'var(--text-dim)' }}>Total Interactions</div>
@@ -1,14 +1,23 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useCallback, useRef } from 'react'
 import axios from 'axios'
 import RecommendationRow from './RecommendationRow'
 import WelcomeModal from './WelcomeModal'
+import { onServerEvent } from '../serverEvents'
+
+const PAGE_SIZE = 5
 
 function Dashboard() {
   const [data, setData] = useState({ movies: [], tv: [], documentaries: [] })
+  // Per-lane paging state: undefined = not loaded yet, null = exhausted.
+  const [cursors, setCursors] = useState({})
   const [activeTab, setActiveTab] = useState('movies') // 'movies' | 'tv' | 'documentaries'
   const [loadingRecs, setLoadingRecs] = useState(false)
   const [error, setError] = useState(null)
   const [showWelcome, setShowWelcome] = useState(false)
+  const [isSeed, setIsSeed] = useState(false)
+  const loadingRef = useRef(false)
+  const isSeedRef = useRef(false)
+  const sentinelRef = useRef(null)
 
   useEffect(() => {
     // Check if user has seen the welcome modal
@@ -16,35 +25,84 @@ function Dashboard() {
     if (!hasSeenWelcome) {
       setShowWelcome(true)
     }
+  }, [])
 
-    const fetchRecommendations = async () => {
-      try {
-        setLoadingRecs(true)
-        setError(null)
-        const res = await axios.get('/api/recommendations')
-        // Handle both legacy and new formats gracefully
-        const movies = res.data.movies || res.data.categories || []
-        const tv = res.data.tv || []
-        const documentaries = res.data.documentaries || []
-        setData({ movies, tv, documentaries })
-      } catch (err) {
-        console.error(err)
-        if (err.response && err.response.status === 401) {
-          // Token expired or invalid, force logout
-          localStorage.removeItem('token')
-          localStorage.removeItem('user')
-          window.location.href = '/login'
-          return
-        }
-        setError('Failed to load recommendations')
-      } finally {
-        setLoadingRecs(false)
+  const fetchPage = useCallback(async (lane, cursor, reset = false) => {
+    if (loadingRef.current) return
+    loadingRef.current = true
+    try {
+      setLoadingRecs(true)
+      setError(null)
+      const params = { lane, limit: PAGE_SIZE }
+      if (cursor) params.cursor = cursor
+      const res = await axios.get('/api/recommendations', { params })
+      const categories = res.data.categories || []
+      setData((prev) => ({
+        ...prev,
+        [lane]: reset ? categories : [...prev[lane], ...categories],
+      }))
+      setCursors((prev) => ({ ...prev, [lane]: res.data.next_cursor || null }))
+      setIsSeed(Boolean(res.data.seed))
+    } catch (err) {
+      console.error(err)
+      if (err.response && err.response.status === 401) {
+        // Token expired or invalid, force logout
+        localStorage.removeItem('token')
+        localStorage.removeItem('user')
+        window.location.href = '/login'
+        return
       }
+      if (err.response && err.response.status === 410) {
+        // The feed was regenerated while scrolling; restart this lane.
+        setCursors((prev) => ({ ...prev, [lane]: undefined }))
+        return
+      }
+      setError('Failed to load recommendations')
+    } finally {
+      loadingRef.current = false
+      setLoadingRecs(false)
+    }
+  }, [])
+
+  // Load the first page of a lane the first time its tab is opened.
+  useEffect(() => {
+    if (cursors[activeTab] === undefined) {
+      fetchPage(activeTab, null, true)
     }
+  }, [activeTab, cursors, fetchPage])
+
+  // Swap the seed feed for the personalized one once the server reports it
+  // ready (or on (re)connect, in case it finished while disconnected).
+  useEffect(() => {
+    isSeedRef.current = isSeed
+  }, [isSeed])
 
-    fetchRecommendations()
+  useEffect(() => {
+    const reloadSeed = () => {
+      if (isSeedRef.current) setCursors({})
+    }
+    const offReady = onServerEvent('recommendations', reloadSeed)
+    const offOpen = onServerEvent('open', reloadSeed)
+    return () => {
+      offReady()
+      offOpen()
+    }
   }, [])
 
+  // Load further rows as the user scrolls towards the end of the lane.
+  useEffect(() => {
+    const sentinel = sentinelRef.current
+    const cursor = cursors[activeTab]
+    if (!sentinel || !cursor) return undefined
+    const observer = new IntersectionObserver((entries) => {
+      if (entries.some((entry) => entry.isIntersecting)) {
+        fetchPage(activeTab, cursor)
+      }
+    }, { rootMargin: '400px' })
+    observer.observe(sentinel)
+    return () => observer.disconnect()
+  }, [activeTab, cursors, fetchPage])
+
   const handleRated = (tmdbId) => {
     // Remove item from the active list
     setData((prev) => ({
@@ -90,10 +148,15 @@ function Dashboard() {
           </div>
         </div>
 
-        {loadingRecs && <p>Loading recommendations...</p>}
+        {isSeed && (
+          <p style={{ color: 'var(--text-dim)', fontSize: '0.9rem' }}>
+            Showing what's popular on this server while your personal recommendations are prepared.
+          </p>
+        )}
+        {loadingRecs && activeCategories.length === 0 && <p>Loading recommendations...</p>}
         {error && <p style={{ color: 'red' }}>{error}</p>}
 
-        {!loadingRecs && !error && activeCategories.length === 0 && (
+        {!loadingRecs && !error && cursors[activeTab] === null && activeCategories.length === 0 && (
           <div style={{ padding: '2rem', textAlign: 'center', color: 'var(--text-dim)' }}>
             <p>No {activeTab === 'movies' ? 'movie' : activeTab === 'tv' ? 'TV' : 'documentary'} recommendations found.</p>
             <p style={{ fontSize: '0.9rem' }}>Try watching more content or check back later!</p>
@@ -107,6 +170,8 @@ function Dashboard() {
             onRated={handleRated}
           />
         ))}
+        {loadingRecs && activeCategories.length > 0 && <p>Loading more...</p>}
+        <div ref={sentinelRef} />
       </div>
     </div>
   )
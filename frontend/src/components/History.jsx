@@ -1,20 +1,35 @@
 import { useState, useEffect } from 'react'
 import axios from 'axios'
 
+const PAGE_SIZE = 50
+
 function History() {
     const [history, setHistory] = useState([])
+    const [nextCursor, setNextCursor] = useState(null)
+    const [ratingFilter, setRatingFilter] = useState('')
+    const [typeFilter, setTypeFilter] = useState('')
     const [loading, setLoading] = useState(true)
+    const [loadingMore, setLoadingMore] = useState(false)
     const [error, setError] = useState(null)
 
     useEffect(() => {
         fetchHistory()
-    }, [])
+    }, [ratingFilter, typeFilter])
+
+    const buildParams = (cursor) => {
+        const params = { limit: PAGE_SIZE }
+        if (cursor) params.cursor = cursor
+        if (ratingFilter !== '') params.rating = ratingFilter
+        if (typeFilter) params.media_type = typeFilter
+        return params
+    }
 
     const fetchHistory = async () => {
         try {
             setLoading(true)
-            const res = await axios.get('/api/user/history')
+            const res = await axios.get('/api/user/history', { params: buildParams(null) })
             setHistory(res.data.history || [])
+            setNextCursor(res.data.next_cursor || null)
         } catch (err) {
             console.error(err)
             setError('Failed to load history')
@@ -23,6 +38,21 @@ function History() {
         }
     }
 
+    const loadMore = async () => {
+        if (!nextCursor) return
+        try {
+            setLoadingMore(true)
+            const res = await axios.get('/api/user/history', { params: buildParams(nextCursor) })
+            setHistory((prev) => [...prev, ...(res.data.history || [])])
+            setNextCursor(res.data.next_cursor || null)
+        } catch (err) {
+            console.error(err)
+            alert('Failed to load more history')
+        } finally {
+            setLoadingMore(false)
+        }
+    }
+
     const handleDelete = async (tmdbId) => {
         if (!confirm('Are you sure you want to remove this record?')) return
         try {
@@ -65,7 +95,23 @@ function History() {
 
     return (
         <div style={{ padding: '2rem', maxWidth: '800px', margin: '0 auto' }}>
-            <h2 style={{ marginBottom: '2rem' }}>My History</h2>
+            <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginBottom: '2rem' }}>
+                <h2 style={{ margin: 0 }}>My History</h2>
+                <div style={{ display: 'flex', gap: '0.5rem' }}>
+                    <select value={ratingFilter} onChange={(e) => setRatingFilter(e.target.value)}>
+                        <option value="">All ratings</option>
+                        <option value="2">Requested</option>
+                        <option value="1">Liked</option>
+                        <option value="-1">Disliked</option>
+                        <option value="0">Seen</option>
+                    </select>
+                    <select value={typeFilter} onChange={(e) => setTypeFilter(e.target.value)}>
+                        <option value="">All types</option>
+                        <option value="movie">Movies</option>
+                        <option value="tv">TV Series</option>
+                    </select>
+                </div>
+            </div>
 
             {history.length === 0 && <p>No history found.</p>}
 
@@ -134,6 +180,14 @@ function History() {
                     </div>
                 ))}
             </div>
+
+            {nextCursor && (
+                <div style={{ textAlign: 'center', marginTop: '1.5rem' }}>
+                    <button className="btn btn-secondary" onClick={loadMore} disabled={loadingMore}>
+                        {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                </div>
+            )}
         </div>
     )
 }
@@ -1,5 +1,7 @@
 import { useEffect, useState } from 'react'
 import axios from 'axios'
+import { queueRating } from '../ratingQueue'
+import { onServerEvent } from '../serverEvents'
 
 function MediaCard({ item, onRated }) {
   const [status, setStatus] = useState('unknown')
@@ -32,6 +34,22 @@ function MediaCard({ item, onRated }) {
     }
   }, [item.tmdb_id, item.media_type])
 
+  // Availability changes and request confirmations are pushed by the server.
+  useEffect(() => {
+    const mediaType = item.media_type || 'movie'
+    const update = (event) => {
+      if (event.tmdb_id === item.tmdb_id && event.media_type === mediaType) {
+        setStatus(event.status)
+      }
+    }
+    const offAvailability = onServerEvent('availability', update)
+    const offRequest = onServerEvent('request', update)
+    return () => {
+      offAvailability()
+      offRequest()
+    }
+  }, [item.tmdb_id, item.media_type])
+
   const handleRequest = async () => {
     try {
       const mediaType = item.media_type || 'movie'
@@ -42,25 +60,19 @@ function MediaCard({ item, onRated }) {
     }
   }
 
-  const handleRate = async (rating) => {
-    try {
-      setSubmittingRating(true)
-      const mediaType = item.media_type || 'movie'
-      await axios.post(`/api/media/${item.tmdb_id}/rate`, { rating, media_type: mediaType })
-      if (onRated) {
-        onRated(item.tmdb_id)
-      }
-    } catch (err) {
-      console.error(err)
-    } finally {
-      setSubmittingRating(false)
+  const handleRate = (action) => {
+    // Buffered and sent in batches; the card goes away right away.
+    setSubmittingRating(true)
+    queueRating(item.tmdb_id, item.media_type || 'movie', action)
+    if (onRated) {
+      onRated(item.tmdb_id)
     }
   }
 
   const handleSkip = () => {
-    // "Skip" is treated as a thumbs down so we stop
+    // "Skip" is stored as a thumbs down so we stop
     // surfacing this item in future recommendations.
-    handleRate('down')
+    handleRate('skip')
   }
 
   const renderPrimaryAction = () => {
@@ -0,0 +1,106 @@
+import axios from 'axios'
+
+// Ratings, skips and unrates are buffered and sent together to
+// POST /api/media/ratings, so rapid clicks become one write on the server.
+const FLUSH_DELAY_MS = 1000
+const RETRY_DELAY_MS = 10000
+const MAX_BATCH = 200
+// Events stay here until the server acknowledges them, so a tab closed
+// mid-send replays them on the next load. Replaying is safe: the last
+// event for a title wins, so a batch applied twice changes nothing.
+const STORAGE_KEY = 'pendingRatings'
+
+// Saved events belong to the session that queued them.
+const loadPending = () => {
+  try {
+    const saved = JSON.parse(localStorage.getItem(STORAGE_KEY) || 'null')
+    if (saved && saved.token === localStorage.getItem('token') && Array.isArray(saved.events)) {
+      return saved.events
+    }
+  } catch (err) {
+    console.error(err)
+  }
+  return []
+}
+
+const savePending = () => {
+  try {
+    if (pending.length === 0) {
+      localStorage.removeItem(STORAGE_KEY)
+    } else {
+      localStorage.setItem(STORAGE_KEY, JSON.stringify({ token: localStorage.getItem('token'), events: pending }))
+    }
+  } catch (err) {
+    console.error(err)
+  }
+}
+
+// Unacknowledged events, oldest first; while `flushing`, the first ones
+// are in flight.
+let pending = typeof window !== 'undefined' ? loadPending() : []
+let timer = null
+let flushing = false
+
+const schedule = (delay) => {
+  if (timer) clearTimeout(timer)
+  timer = setTimeout(flushRatings, delay)
+}
+
+// keepalive lets the request outlive the page when the tab is closed.
+const sendKeepalive = async (events) => {
+  const token = localStorage.getItem('token')
+  const response = await fetch('/api/media/ratings', {
+    method: 'POST',
+    keepalive: true,
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    body: JSON.stringify({ events }),
+  })
+  if (!response.ok) throw new Error(`Saving ratings failed with status ${response.status}`)
+}
+
+const flush = async (keepalive) => {
+  if (timer) clearTimeout(timer)
+  timer = null
+  // A send in progress is followed by another flush once it settles.
+  if (flushing || pending.length === 0) return
+  flushing = true
+  const events = pending.slice(0, MAX_BATCH)
+  try {
+    if (keepalive) {
+      await sendKeepalive(events)
+    } else {
+      await axios.post('/api/media/ratings', { events })
+    }
+  } catch (err) {
+    console.error(err)
+    // They are still first in the queue; try again later.
+    flushing = false
+    schedule(RETRY_DELAY_MS)
+    return
+  }
+  flushing = false
+  pending = pending.slice(events.length)
+  savePending()
+  if (pending.length > 0) schedule(0)
+}
+
+export const flushRatings = () => flush(false)
+
+export const queueRating = (tmdbId, mediaType, action) => {
+  pending.push({ tmdb_id: tmdbId, media_type: mediaType, action })
+  savePending()
+  schedule(pending.length >= MAX_BATCH ? 0 : FLUSH_DELAY_MS)
+}
+
+if (typeof window !== 'undefined') {
+  // Replay what an earlier page left unacknowledged.
+  if (pending.length > 0) schedule(FLUSH_DELAY_MS)
+
+  // Send whatever is left when the tab is hidden or closed.
+  window.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') flush(true)
+  })
+}
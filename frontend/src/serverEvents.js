@@ -0,0 +1,101 @@
+import axios from 'axios'
+
+// One shared EventSource per tab for /api/events (recommendations ready,
+// availability changes, request confirmations), opened while anything listens.
+// The native 'open' event fires on every (re)connect, so listeners can catch
+// up on anything missed while disconnected.
+//
+// The stream is opened with a short-lived, single-use ticket rather than the
+// session token, which would otherwise end up in access logs and browser
+// history. A used ticket cannot be replayed by the browser's own reconnect,
+// so on error the stream is closed and reopened with a fresh ticket.
+const REOPEN_DELAY_MS = 5000
+
+const listeners = new Map() // event name -> Set of handlers
+let source = null
+let opening = false
+let reopenTimer = null
+let attached = new Set() // event names with a listener on the current source
+
+const attach = (name) => {
+  if (!source || attached.has(name)) return
+  attached.add(name)
+  source.addEventListener(name, (message) => {
+    let data = null
+    try {
+      if (typeof message.data === 'string') data = JSON.parse(message.data)
+    } catch (err) {
+      console.error(err)
+      return
+    }
+    for (const handler of listeners.get(name) || []) {
+      handler(data)
+    }
+  })
+}
+
+const close = () => {
+  if (source) {
+    source.close()
+    source = null
+  }
+}
+
+const scheduleReopen = () => {
+  if (reopenTimer || listeners.size === 0) return
+  reopenTimer = setTimeout(() => {
+    reopenTimer = null
+    open()
+  }, REOPEN_DELAY_MS)
+}
+
+const open = async () => {
+  if (source || opening || listeners.size === 0) return
+  if (!localStorage.getItem('token') || typeof EventSource === 'undefined') return
+  opening = true
+  let ticket
+  try {
+    const { data } = await axios.post('/api/events/ticket')
+    ticket = data.ticket
+  } catch (err) {
+    console.error(err)
+    scheduleReopen()
+    return
+  } finally {
+    opening = false
+  }
+  // Everyone may have stopped listening while the ticket was requested.
+  if (listeners.size === 0 || source) return
+  source = new EventSource(`/api/events?ticket=${encodeURIComponent(ticket)}`)
+  attached = new Set()
+  for (const name of listeners.keys()) {
+    attach(name)
+  }
+  source.onerror = () => {
+    close()
+    scheduleReopen()
+  }
+}
+
+export const onServerEvent = (name, handler) => {
+  if (!listeners.has(name)) listeners.set(name, new Set())
+  listeners.get(name).add(handler)
+  if (source) {
+    attach(name)
+  } else {
+    open()
+  }
+
+  return () => {
+    const handlers = listeners.get(name)
+    handlers.delete(handler)
+    if (handlers.size === 0) listeners.delete(name)
+    if (listeners.size === 0) {
+      close()
+      if (reopenTimer) {
+        clearTimeout(reopenTimer)
+        reopenTimer = null
+      }
+    }
+  }
+}